@@ -0,0 +1,116 @@
+"""
+Multi-resolution firing rate and amplitude over time for every unit, written next to
+the neuron JSON at parse time (e.g. neuron_data_activity.npz).
+
+Each unit's spikes are counted in 1 s bins, together with the sum of their peak
+amplitudes. Coarser levels (10 s, 100 s) are built by summing blocks of the level below,
+so a plot of any width can be served from the level with about as many bins as it has
+pixels, without shipping spike times.
+
+Only the bins from a unit's first to its last spike are stored, so units active for
+part of a long recording take no room for the rest of it. For level k the bins of all
+units are concatenated; unit i owns counts_k[offsets_k[i]:offsets_k[i + 1]], which
+start at bin starts_k[i] of the recording. The file is compressed.
+"""
+
+import os.path
+import numpy as np
+from atomic_write import atomic_write
+
+ACTIVITY_STORE_SUFFIX = "_activity.npz"
+LEVELS_S = (1, 10, 100)  # bin width of each level, each a multiple of the one before
+
+def activity_store_file(data_file):
+    """The activity store belonging to a neuron JSON file, e.g. neuron_data.json -> neuron_data_activity.npz."""
+    return os.path.splitext(data_file)[0] + ACTIVITY_STORE_SUFFIX
+
+def peak_amplitudes(waveforms):
+    """Largest absolute deflection of each (n_spikes, n_samples) waveform."""
+    waveforms = np.asarray(waveforms)
+    if waveforms.size == 0:
+        return np.zeros(len(waveforms))
+    return np.abs(waveforms).max(axis=1)
+
+def bin_activity(spike_times_ms, amplitudes, bin_s=LEVELS_S[0]):
+    """Returns (first bin, spike counts, amplitude sums) in bin_s bins from the first spike's bin up to the last spike's."""
+    bins = (np.asarray(spike_times_ms, dtype=float) // (bin_s * 1000)).astype(np.int64)
+    first = int(bins.min()) if len(bins) else 0
+    n_bins = int(bins.max()) + 1 - first if len(bins) else 0
+    counts = np.bincount(bins - first, minlength=n_bins).astype(np.int32)
+    amp_sums = np.bincount(bins - first, weights=amplitudes, minlength=n_bins).astype(np.float32)
+    return first, counts, amp_sums
+
+def _unit_ranges(offsets, units):
+    """(row of each element, index of each element in the concatenated arrays) for the given units, in order."""
+    units = np.asarray(units, dtype=np.int64)
+    lengths = offsets[units + 1] - offsets[units]
+    rows = np.repeat(np.arange(len(units)), lengths)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return rows, offsets[units][rows] + within, within
+
+def save_activity_store(path, filenames, cluster_ids, activity):
+    """activity is one (first bin, counts, amplitude sums) triple of finest-level arrays per unit, as from bin_activity()."""
+    n = len(activity)
+    arrays = {"filenames": np.array(filenames, dtype=str), "cluster_ids": np.array(cluster_ids, dtype=np.int64),
+              "levels_s": np.array(LEVELS_S)}
+    starts = np.array([first for first, _, _ in activity], dtype=np.int64)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(c) for _, c, _ in activity])
+    counts = np.concatenate([c for _, c, _ in activity]).astype(np.int32) if n else np.zeros(0, dtype=np.int32)
+    amp_sums = np.concatenate([a for _, _, a in activity]).astype(np.float32) if n else np.zeros(0, dtype=np.float32)
+    unit, _, within = _unit_ranges(offsets, np.arange(n))
+    for k, bin_s in enumerate(LEVELS_S):
+        # every unit's fine bins summed into coarse bins of the recording in one reduceat: a new sum
+        # starts wherever the unit or the coarse bin changes, and a unit's fine bins are contiguous
+        factor = bin_s // LEVELS_S[0]
+        coarse = (starts[unit] + within) // factor
+        first = np.ones(len(coarse), dtype=bool)
+        first[1:] = (unit[1:] != unit[:-1]) | (coarse[1:] != coarse[:-1])
+        boundaries = np.flatnonzero(first)
+        level_offsets = np.zeros(n + 1, dtype=np.int64)
+        level_offsets[1:] = np.cumsum(np.bincount(unit[boundaries], minlength=n))
+        arrays[f"starts_{k}"] = starts // factor
+        arrays[f"offsets_{k}"] = level_offsets
+        arrays[f"counts_{k}"] = np.add.reduceat(counts, boundaries).astype(np.int32) if len(boundaries) else counts
+        arrays[f"amp_sums_{k}"] = np.add.reduceat(amp_sums, boundaries).astype(np.float32) if len(boundaries) else amp_sums
+    atomic_write(path, lambda f: np.savez_compressed(f, **arrays))
+
+def load_activity_store(path):
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
+
+def unit_activity(store, i):
+    """The (first bin, counts, amplitude sums) finest-level triple unit i was saved from."""
+    offsets = store["offsets_0"]
+    return int(store["starts_0"][i]), store["counts_0"][offsets[i]:offsets[i + 1]], store["amp_sums_0"][offsets[i]:offsets[i + 1]]
+
+def choose_level(store, width):
+    """Index of the finest level whose session-wide bin count fits in width, else the coarsest."""
+    for k in range(len(store["levels_s"])):
+        if n_level_bins(store, k) <= width:
+            return k
+    return len(store["levels_s"]) - 1
+
+def n_level_bins(store, k):
+    """Bins at level k from the start of the recording up to the last spike of any unit."""
+    offsets = store[f"offsets_{k}"]
+    return int((store[f"starts_{k}"] + np.diff(offsets)).max()) if len(offsets) > 1 else 0
+
+def level_series(store, k, units, n_bins=None):
+    """
+    Returns (rate_hz, mean_amplitude) arrays of shape (len(units), n_bins) at level k, from the
+    start of the recording, with zero rate outside a unit's first to last spike; mean_amplitude
+    is NaN in bins without spikes.
+    """
+    if n_bins is None:
+        n_bins = n_level_bins(store, k)
+    rows, index, within = _unit_ranges(store[f"offsets_{k}"], units)
+    cols = store[f"starts_{k}"][np.asarray(units, dtype=np.int64)][rows] + within
+    keep = cols < n_bins
+    counts = np.zeros((len(units), n_bins))
+    amp_sums = np.zeros((len(units), n_bins))
+    counts[rows[keep], cols[keep]] = store[f"counts_{k}"][index[keep]]
+    amp_sums[rows[keep], cols[keep]] = store[f"amp_sums_{k}"][index[keep]]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_amplitude = amp_sums / counts
+    return counts / store["levels_s"][k], mean_amplitude
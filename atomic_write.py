@@ -0,0 +1,23 @@
+"""
+Atomic replacement of the files the viewer, parser and exporters write next to a session.
+
+Each write goes to a temporary file of its own in the target's directory, which is then
+renamed over the target. Readers never see a half-written file, and callers writing the
+same file at once (e.g. an export in the viewer and a parse from the command line) never
+write into each other's temporary file; the last rename wins.
+"""
+
+import os
+import tempfile
+
+def atomic_write(path, write, mode="wb", newline=None):
+    """Calls write(f) with a new temporary file opened in mode (and newline, for text), then moves it over path."""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            write(f)
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
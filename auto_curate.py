@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Batch auto-curation: parse -> predict -> auto-exclude -> export for many recording
+directories, without the web viewer.
+
+Each session is processed in a worker process that loads the model once. A session is
+skipped if its outputs were produced from the same .mat files, model and settings
+(recorded in cluster_viewer_results/auto_curation.json). A summary table of per-session
+counts and timings is written at the end.
+
+The helpers shared with cluster_viewer.py (auto_exclude_clusters, write_exclusions,
+export_matrices) live here so neither needs the other's dependencies.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from atomic_write import atomic_write
+from session import Session
+from spike_cache import default_cache_dir, source_identity
+from training.prediction_cache import PREDICTION_CACHE_FILE, file_digest, predict_probs
+# channel_parser and make_spikes_matrix (scipy) are imported where they are used, so the
+# viewer can import the helpers below without paying for them at startup
+
+RESULTS_DIR = "cluster_viewer_results"
+MANIFEST_FILE = "auto_curation.json"
+SUMMARY_FIELDS = ["directory", "status", "n_channels", "n_units", "n_excluded", "n_cached",
+                  "parse_s", "predict_s", "export_s", "total_s", "error"]
+
+# set in each worker by _init_worker, so the model is loaded once per process rather than once per session
+_worker_model = {}
+
+def auto_exclude_clusters(session, threshold=0.5):
+    """Returns the (filename, cluster_id) pairs of a Session whose model probability is below threshold (all of them without predictions)."""
+    if session.model_prob is None:
+        return set(session.keys())
+    below = np.asarray(session.model_prob) < threshold
+    return set(zip(session.filenames[below].tolist(), session.cluster_ids[below].tolist()))
+
+def write_exclusions(excluded, exclude_file):
+    atomic_write(exclude_file, lambda f: csv.writer(f).writerows([fn, cid] for fn, cid in sorted(excluded)), mode="w", newline="")
+
+def export_matrices(directory, outdir, exclude_file, file_ext=".mat", keep_duplicates=False, skip_empty_channels=False, cache_dir=None):
+    """Writes the per-unit and per-channel spike matrices of one session; returns their paths."""
+    from make_spikes_matrix import make_spikes_matrix
+    outfiles = [os.path.join(outdir, f"spikes{file_ext}"), os.path.join(outdir, f"spikes_perChannel{file_ext}")]
+    for outfile, ignore_clusters in zip(outfiles, [False, True]):
+        make_spikes_matrix(directory, outfile=outfile, ignoreClusters=ignore_clusters, includeClusterZero=False, ignoreForced=False,
+                           ignoreDuplicates=not keep_duplicates, skipEmptyChannels=skip_empty_channels, exclusionfile=exclude_file, cacheDir=cache_dir)
+    return outfiles
+
+def find_sessions(paths, pattern="times_*.mat"):
+    """Returns every directory under paths (inclusive) that contains files matching pattern."""
+    sessions = []
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != RESULTS_DIR)
+            if glob.glob(os.path.join(glob.escape(root), pattern)):
+                sessions.append(root)
+    return sessions
+
+def _session_state(directory, pattern, model_file, settings):
+    sources = {os.path.basename(p): source_identity(p) for p in sorted(glob.glob(os.path.join(glob.escape(directory), pattern)))}
+    return {"model": file_digest(model_file), "settings": settings, "sources": sources}
+
+def _output_files(outdir):
+    return [os.path.join(outdir, f) for f in ["neuron_data.json", "clusters_excluded_auto.csv", "spikes_auto.mat", "spikes_perChannel_auto.mat"]]
+
+def is_up_to_date(directory, state):
+    outdir = os.path.join(directory, RESULTS_DIR)
+    if not all(os.path.exists(f) for f in _output_files(outdir)):
+        return False
+    try:
+        with open(os.path.join(outdir, MANIFEST_FILE), "r") as f:
+            return json.load(f) == state
+    except (OSError, ValueError):
+        return False
+
+def _init_worker(model_file):
+    from training.inference import load_predictor
+    _worker_model["file"] = model_file
+    _worker_model["predictor"] = load_predictor(model_file)
+
+def curate_session(directory, pattern="times_*.mat", nbins=50, keep_duplicates=False, skip_empty_channels=False,
+                   threshold=0.5, ingest_cache=True, force=False):
+    """Runs the auto-curation pipeline on one session with the worker's model; returns a summary row."""
+    from channel_parser import collect_neuron_data
+    model_file = _worker_model["file"]
+    row = {"directory": directory, "status": "skipped", "error": ""}
+    t0 = time.perf_counter()
+    settings = {"nbins": nbins, "keep_duplicates": keep_duplicates, "skip_empty_channels": skip_empty_channels, "threshold": threshold}
+    state = _session_state(directory, pattern, model_file, settings)
+    row["n_channels"] = len(state["sources"])
+    if not force and is_up_to_date(directory, state):
+        row["total_s"] = time.perf_counter() - t0
+        return row
+
+    outdir = os.path.join(directory, RESULTS_DIR)
+    data_file, exclude_file = _output_files(outdir)[:2]
+    cache_dir = default_cache_dir(directory) if ingest_cache else None
+    try:
+        os.makedirs(outdir, exist_ok=True)
+        t = time.perf_counter()
+        collect_neuron_data(directory, data_file, pattern=pattern, nbins=nbins, verbose=False, keep_duplicates=keep_duplicates, cache_dir=cache_dir)
+        row["parse_s"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        session = Session.from_json(data_file)
+        if len(session):
+            session.model_prob, row["n_cached"] = predict_probs(session.features(), model_file, lambda: _worker_model["predictor"],
+                                                                os.path.join(outdir, PREDICTION_CACHE_FILE))
+        else:
+            session.model_prob, row["n_cached"] = np.zeros(0), 0
+        auto_excluded = auto_exclude_clusters(session, threshold)
+        write_exclusions(auto_excluded, exclude_file)
+        row["predict_s"] = time.perf_counter() - t
+        row["n_units"] = len(session)
+        row["n_excluded"] = len(auto_excluded)
+
+        t = time.perf_counter()
+        export_matrices(directory, outdir, exclude_file, file_ext="_auto.mat", keep_duplicates=keep_duplicates,
+                        skip_empty_channels=skip_empty_channels, cache_dir=cache_dir)
+        row["export_s"] = time.perf_counter() - t
+
+        with open(os.path.join(outdir, MANIFEST_FILE), "w") as f:
+            json.dump(state, f, indent=2)
+        row["status"] = "ok"
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["total_s"] = time.perf_counter() - t0
+    return row
+
+def curate_sessions(sessions, model_file, workers=None, **kwargs):
+    """Curates every session in a process pool; returns the summary rows in the order of sessions."""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sessions)))
+    print(f"Auto-curating {len(sessions)} sessions on {workers} worker(s) with {model_file}")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_file,)) as pool:
+        futures = [pool.submit(curate_session, s, **kwargs) for s in sessions]
+        rows = []
+        for s, future in zip(sessions, futures):
+            row = future.result()
+            print(f"  {row['status']:>7}  {row['total_s']:7.1f} s  {s}" + (f"  ({row['error']})" if row["error"] else ""))
+            rows.append(row)
+    return rows
+
+def write_summary(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows({k: round(v, 3) if isinstance(v, float) else v for k, v in r.items()} for r in rows)
+    print(f"Saved auto-curation summary to {path}")
+
+if __name__ == "__main__":
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Auto-curate many recording directories with a trained model (no web viewer).")
+    parser.add_argument("directories", nargs="+", help="Session directories, or roots that are searched for them")
+    parser.add_argument("--model_file", default=os.path.join(basedir, "training/model.npz"), help="Path to trained model file (.npz or .pt)")
+    parser.add_argument("--pattern", default="times_*.mat", help="Filename pattern to match (default: 'times_*.mat')")
+    parser.add_argument("--nbins", type=int, default=50, help="Number of bins (default 50)")
+    parser.add_argument("--keep_duplicates", action="store_true", help="Keep duplicates (if DER labels are included)")
+    parser.add_argument("--skip_empty_channels", action="store_true", help="If set, skips channels without spikes (note this will affect channel indexing)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Exclude units whose model probability is below this (default 0.5)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: cpu count)")
+    parser.add_argument("--no_ingest_cache", action="store_true", help="If set, decodes the .mat files instead of using the .npy ingest cache")
+    parser.add_argument("--force", action="store_true", help="Re-run sessions even if their outputs are up to date")
+    parser.add_argument("--report", default="auto_curation_summary.csv", help="Path of the summary CSV (default: auto_curation_summary.csv)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model_file):
+        raise FileNotFoundError(f"Model file {args.model_file} not found")
+    sessions = find_sessions(args.directories, args.pattern)
+    if not sessions:
+        raise ValueError(f"No directories with '{args.pattern}' files found in {args.directories}")
+    rows = curate_sessions(sessions, args.model_file, workers=args.workers, pattern=args.pattern, nbins=args.nbins,
+                           keep_duplicates=args.keep_duplicates, skip_empty_channels=args.skip_empty_channels,
+                           threshold=args.threshold, ingest_cache=not args.no_ingest_cache, force=args.force)
+    counts = {s: sum(r["status"] == s for r in rows) for s in ["ok", "skipped", "error"]}
+    print(f"Done: {counts['ok']} curated, {counts['skipped']} up to date, {counts['error']} failed")
+    write_summary(rows, args.report)
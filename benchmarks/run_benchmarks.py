@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the parse -> score -> view -> export pipeline on synthetic sessions.
+
+For each scale, a seeded session is generated (see synthetic_session.py) and every stage
+is timed (median wall time over --repeat runs) plus run once under tracemalloc for its
+peak Python/NumPy memory. Results can be saved as a baseline and later runs compared
+against it; the script exits with status 1 if any stage regresses by more than --tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_session import write_synthetic_session
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_MODEL = os.path.join(ROOT, "training", "model.npz")
+
+SCALES = {
+    "small":  dict(n_channels=16,  max_clusters=3, min_spikes=200,  max_spikes=2000,  duration_s=600.0),
+    "medium": dict(n_channels=96,  max_clusters=4, min_spikes=500,  max_spikes=5000,  duration_s=1800.0),
+    "large":  dict(n_channels=256, max_clusters=5, min_spikes=1000, max_spikes=20000, duration_s=3600.0),
+}
+
+def measure(fn, repeat, setup=None):
+    """Returns (median wall time in s, peak traced memory in bytes) for fn(); fn's own printing is suppressed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _measure(fn, repeat, setup)
+
+def _measure(fn, repeat, setup):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak
+
+def benchmark_scale(scale, params, repeat, model_file, seed=0):
+    from channel_parser import collect_neuron_data
+    from make_spikes_matrix import make_spikes_matrix
+    from spike_cache import default_cache_dir, load_channel
+    import cluster_viewer
+    from cluster_viewer import app, load_session
+    from training.prediction_cache import PREDICTION_CACHE_FILE
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        write_synthetic_session(directory, seed=seed, **params)
+        outdir = os.path.join(directory, "cluster_viewer_results")
+        os.makedirs(outdir)
+        data_file = os.path.join(outdir, "neuron_data.json")
+        exclude_file = os.path.join(outdir, "clusters_excluded.csv")
+        cache_file = os.path.join(outdir, PREDICTION_CACHE_FILE)
+
+        results["collect_neuron_data"] = measure(
+            lambda: collect_neuron_data(directory, data_file, verbose=False), repeat)
+        results["make_spikes_matrix"] = measure(
+            lambda: make_spikes_matrix(directory, outfile=os.path.join(outdir, "spikes.mat"), ignoreDuplicates=True), repeat)
+
+        cache_dir = default_cache_dir(directory)
+        for fname in sorted(os.listdir(directory)):
+            if fname.endswith(".mat"):
+                load_channel(os.path.join(directory, fname), cache_dir)
+        results["collect_neuron_data (ingest cache)"] = measure(
+            lambda: collect_neuron_data(directory, data_file, verbose=False, cache_dir=cache_dir), repeat)
+        results["make_spikes_matrix (ingest cache)"] = measure(
+            lambda: make_spikes_matrix(directory, outfile=os.path.join(outdir, "spikes.mat"), ignoreDuplicates=True, cacheDir=cache_dir), repeat)
+
+        app.config.update(DATA_FILE=data_file, EXCLUDE_FILE=exclude_file, MODEL_FILE=model_file, PARSE_STATUS=None)
+        def clear_predictions():
+            cluster_viewer._model_cache.clear()
+            cluster_viewer._session_cache.clear()
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+        results["load_session (cold)"] = measure(load_session, repeat, setup=clear_predictions)
+        results["load_session (cached)"] = measure(load_session, repeat)
+        client = app.test_client()
+        results["/api/neurons"] = measure(lambda: client.get("/api/neurons").data, repeat)
+
+        with open(data_file) as f:
+            n_units = len(json.load(f))
+    print(f"[{scale}] {params['n_channels']} channels, {n_units} units")
+    return {stage: {"wall_s": t, "peak_mb": peak / 2**20} for stage, (t, peak) in results.items()}
+
+def compare(results, baseline, tolerance):
+    """Prints each stage next to its baseline; returns the list of regressed (scale, stage) pairs."""
+    regressions = []
+    for scale, stages in results.items():
+        for stage, r in stages.items():
+            b = baseline.get(scale, {}).get(stage)
+            if b is None:
+                continue
+            ratio = r["wall_s"] / b["wall_s"] if b["wall_s"] > 0 else float("inf")
+            flag = ""
+            if ratio > tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((scale, stage))
+            print(f"  {scale:>6} {stage:<36} {r['wall_s']*1000:9.1f} ms vs {b['wall_s']*1000:9.1f} ms  ({ratio:.2f}x){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic sessions.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES), help="Scales to run (default: small medium)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (default 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic sessions (default 0)")
+    parser.add_argument("--model_file", default=DEFAULT_MODEL, help="Model used for the load_session stages")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save_baseline", action="store_true", help="Write these results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Slowdown ratio that counts as a regression (default 1.5)")
+    parser.add_argument("--output", default=None, help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        results[scale] = benchmark_scale(scale, SCALES[scale], args.repeat, args.model_file, seed=args.seed)
+        for stage, r in results[scale].items():
+            print(f"  {stage:<36} {r['wall_s']*1000:9.1f} ms  peak {r['peak_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.baseline}:")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
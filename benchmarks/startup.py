@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Measures startup cost of the viewer and the CLI tools.
+
+For each CLI tool, times `python TOOL --help` (import cost plus argument parsing).
+For the viewer, times how long it takes from process launch until the first
+/api/neurons request succeeds (time-to-first-request).
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_JSONFILE = os.path.join(ROOT, "tests", "data", "dataset1", "expected_summary.json")
+CLI_TOOLS = ["cluster_viewer.py", "channel_parser.py", "make_spikes_matrix.py"]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_help(tool):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, tool), "--help"], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+def time_to_first_request(viewer_args, workdir, timeout=120.0):
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(ROOT, "cluster_viewer.py"), "--port", str(port), "--no_browser"] + viewer_args
+    url = f"http://127.0.0.1:{port}/api/neurons"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Viewer exited early with code {proc.returncode}: {' '.join(cmd)}")
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as r:
+                    r.read()
+                return time.perf_counter() - t0
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"No response from {url} after {timeout} s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def summarize(times):
+    return {"median_s": statistics.median(times), "min_s": min(times), "max_s": max(times), "runs": len(times)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time of the viewer and CLI tools.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per measurement (default 5)")
+    parser.add_argument("--jsonfile", default=DEFAULT_JSONFILE, help="Neuron JSON file to serve for the JSON-only viewer run")
+    parser.add_argument("--directory", default=None, help="If set, also time viewer startup when parsing this directory")
+    parser.add_argument("--output", default=None, help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for tool in CLI_TOOLS:
+        results[f"{tool} --help"] = summarize([time_help(tool) for _ in range(args.repeat)])
+    # run the viewer from a scratch copy so results/exclusion files never land in the source tree
+    with tempfile.TemporaryDirectory() as workdir:
+        jsonfile = shutil.copy(os.path.abspath(args.jsonfile), workdir)
+        results["viewer first request (--jsonfile)"] = summarize(
+            [time_to_first_request(["--jsonfile", jsonfile], workdir) for _ in range(args.repeat)])
+        if args.directory:
+            session_dir = os.path.join(workdir, "session")
+            os.makedirs(session_dir)
+            for fpath in glob.glob(os.path.join(args.directory, "times_*.mat")):
+                shutil.copy(fpath, session_dir)
+            times = []
+            for _ in range(args.repeat):
+                shutil.rmtree(os.path.join(session_dir, "cluster_viewer_results"), ignore_errors=True)
+                times.append(time_to_first_request(["--directory", session_dir], workdir))
+            results["viewer first request (--directory)"] = summarize(times)
+
+    width = max(len(k) for k in results)
+    for name, r in results.items():
+        print(f"{name:<{width}}  median {r['median_s']*1000:8.1f} ms  (min {r['min_s']*1000:.1f}, max {r['max_s']*1000:.1f})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Writes seeded, wave_clus-style synthetic sessions (one times_*.mat per channel) for
+benchmarking at scales well beyond tests/data.
+
+Each file has the same fields as real wave_clus/DER output:
+    - 'cluster_class': (N, 2) [cluster id, spike time in ms], cluster 0 = unsorted
+    - 'spikes':        (N, 64) waveforms, a negative trough around sample 20
+    - 'detectionLabel': (N, 1) 1 for kept spikes, other DER codes for duplicates
+    - 'forced':        (1, N) logical, True for spikes forced into a cluster
+"""
+
+import argparse
+import os
+import numpy as np
+from scipy.io import savemat
+
+N_SAMPLES = 64
+DUPLICATE_CODES = np.array([2, 7, 14, 35])
+
+def _template(rng):
+    """A spike-like waveform: a negative trough followed by a slower positive rebound."""
+    t = np.arange(N_SAMPLES)
+    trough = -rng.uniform(40, 120) * np.exp(-0.5 * ((t - 20) / rng.uniform(1.5, 3.0)) ** 2)
+    rebound = rng.uniform(5, 30) * np.exp(-0.5 * ((t - rng.uniform(26, 34)) / rng.uniform(3, 6)) ** 2)
+    return trough + rebound
+
+def _spike_times(rng, n_spikes, duration_ms, refractory_ms=2.0):
+    """Sorted spike times (ms) with gamma-distributed ISIs and an absolute refractory period."""
+    mean_isi = duration_ms / n_spikes
+    isis = refractory_ms + rng.gamma(shape=2.0, scale=max(mean_isi - refractory_ms, 0.1) / 2.0, size=n_spikes)
+    times = np.cumsum(isis) + rng.uniform(0, mean_isi)
+    return times[times < duration_ms]
+
+def make_channel(rng, n_clusters, spikes_per_cluster, duration_ms, noise_fraction=0.2, duplicate_fraction=0.3, forced_fraction=0.01):
+    """Returns the fields of one times_*.mat file as a dict."""
+    cluster_ids, times, waveforms = [], [], []
+    for cid in range(n_clusters + 1):
+        if cid == 0:
+            # always some unsorted spikes, so channels without clusters still look like real files
+            n = max(int(noise_fraction * np.sum(spikes_per_cluster)), 10)
+        else:
+            n = spikes_per_cluster[cid - 1]
+        t = _spike_times(rng, n, duration_ms)
+        template = _template(rng) * (0.3 if cid == 0 else 1.0)
+        w = template * rng.normal(1.0, 0.1, size=(len(t), 1)) + rng.normal(0, 8.0, size=(len(t), N_SAMPLES))
+        cluster_ids.append(np.full(len(t), cid))
+        times.append(t)
+        waveforms.append(w)
+
+    cluster_ids = np.concatenate(cluster_ids)
+    times = np.concatenate(times)
+    order = np.argsort(times, kind="stable")
+    n = len(times)
+    detection_label = np.ones(n)
+    is_duplicate = rng.random(n) < duplicate_fraction
+    detection_label[is_duplicate] = rng.choice(DUPLICATE_CODES, size=is_duplicate.sum())
+    return {
+        "cluster_class": np.column_stack([cluster_ids[order], np.round(times[order], 3)]).astype(float),
+        "spikes": np.vstack(waveforms)[order],
+        "detectionLabel": detection_label[:, None],
+        "forced": (rng.random(n) < forced_fraction)[None, :],
+    }
+
+def write_synthetic_session(directory, n_channels=16, max_clusters=3, min_spikes=200, max_spikes=2000,
+                            duration_s=600.0, noise_fraction=0.2, duplicate_fraction=0.3, forced_fraction=0.01,
+                            first_channel=1001, prefix="synth", seed=0, compress=True):
+    """
+    Writes n_channels times_<prefix>_<channel>.mat files into directory and returns their paths.
+    Each channel gets 0..max_clusters clusters with min_spikes..max_spikes spikes each.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for c in range(n_channels):
+        n_clusters = int(rng.integers(0, max_clusters + 1))
+        spikes_per_cluster = rng.integers(min_spikes, max_spikes + 1, size=n_clusters)
+        fields = make_channel(rng, n_clusters, spikes_per_cluster, duration_s * 1000.0,
+                              noise_fraction=noise_fraction, duplicate_fraction=duplicate_fraction, forced_fraction=forced_fraction)
+        path = os.path.join(directory, f"times_{prefix}_{first_channel + c}.mat")
+        savemat(path, fields, do_compression=compress)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic wave_clus-style session of times_*.mat files.")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--channels", type=int, default=16, help="Number of channels/files (default 16)")
+    parser.add_argument("--max_clusters", type=int, default=3, help="Maximum clusters per channel (default 3)")
+    parser.add_argument("--min_spikes", type=int, default=200, help="Minimum spikes per cluster (default 200)")
+    parser.add_argument("--max_spikes", type=int, default=2000, help="Maximum spikes per cluster (default 2000)")
+    parser.add_argument("--duration", type=float, default=600.0, help="Recording duration in seconds (default 600)")
+    parser.add_argument("--duplicate_fraction", type=float, default=0.3, help="Fraction of spikes labelled as DER duplicates (default 0.3)")
+    parser.add_argument("--forced_fraction", type=float, default=0.01, help="Fraction of spikes marked as forced (default 0.01)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0)")
+    args = parser.parse_args()
+    paths = write_synthetic_session(args.directory, n_channels=args.channels, max_clusters=args.max_clusters,
+                                    min_spikes=args.min_spikes, max_spikes=args.max_spikes, duration_s=args.duration,
+                                    duplicate_fraction=args.duplicate_fraction, forced_fraction=args.forced_fraction, seed=args.seed)
+    print(f"Wrote {len(paths)} files to {args.directory}")
@@ -2,9 +2,14 @@ import os.path
 import json
 import glob
 import numpy as np
-import scipy.io as sio
+from atomic_write import atomic_write
+from activity_store import activity_store_file, bin_activity, load_activity_store, peak_amplitudes, save_activity_store, unit_activity
+from isi_store import isi_store_file, load_isi_store, save_isi_store
+from profiling import profiler
+from spike_cache import default_cache_dir, load_channel
+from spike_index import channel_index, window_rows
 
-def load_spike_data(mat_path, nbins=50, keep_duplicates=False):
+def load_spike_data(mat_path, nbins=50, keep_duplicates=False, cache_dir=None, t_start=None, t_stop=None):
     """
     Loads a MATLAB struct containing spike waveforms and cluster_class info.
     Returns a list of dicts, one per neuron (excluding cluster 0 / noise).
@@ -12,9 +17,16 @@ def load_spike_data(mat_path, nbins=50, keep_duplicates=False):
         - 'ISI_bins': np.array of log-scaled bin centers (ms)
         - 'ISI_freqs': np.array of normalized histogram frequencies
         - 'waveform_quintiles': np.array shape (10, 64) summarizing waveform distribution
+        - 'ISIs': sorted inter-spike intervals (ms) as float32, for re-binning later
+        - 'activity': (first bin, spike counts, peak amplitude sums) in 1 s bins, see activity_store.py
+    If cache_dir is given, the raw arrays are memory-mapped from the ingest cache there
+    (see spike_cache.py) instead of decoding the .mat file every time.
+    With t_start and/or t_stop (ms), only spikes with t_start <= time < t_stop are used,
+    found through the channel's spike index (see spike_index.py).
     """
+    channel = os.path.basename(mat_path)
     # Load .mat file
-    mat = sio.loadmat(mat_path, squeeze_me=True)
+    mat = load_channel(mat_path, cache_dir)
     waveforms = mat['spikes']      # shape (N, 64)
     cluster_class = mat['cluster_class']  # shape (N, 2)
     if 'detectionLabel' in mat and not keep_duplicates:
@@ -22,11 +34,11 @@ def load_spike_data(mat_path, nbins=50, keep_duplicates=False):
     else:
         detection_label = np.ones(waveforms.shape[0], dtype=bool)
     
-    cluster_ids = cluster_class[:,0].astype(int)
-    spike_times = cluster_class[:,1].astype(float) # ms
+    spike_times = cluster_class[:,1] # ms
+    index = channel_index(mat)
 
     # Ignore noise cluster (0)
-    unique_clusters = np.unique(cluster_ids)
+    unique_clusters = index['sorted_clusters']
     unique_clusters = unique_clusters[unique_clusters != 0]
 
     # Log-spaced bins from 1 ms to 10 s (10,000 ms)
@@ -34,43 +46,107 @@ def load_spike_data(mat_path, nbins=50, keep_duplicates=False):
 
     neurons = []
     for cid in unique_clusters:
-        neuron_mask = cluster_ids == cid
-        neuron_mask = neuron_mask & (detection_label == 1)
-        if not neuron_mask.any():
+        # rows of the cluster's spikes in the window, in file order, without DER duplicates
+        rows = np.sort(window_rows(index, cid, t_start, t_stop))
+        rows = rows[detection_label[rows] == 1]
+        if len(rows) == 0:
             print(f'WARNING: in {mat_path=}, skipping cluster {cid} without spikes: {cid=}')
             continue
 
-        # Apply detection label mask
-        neuron_times = np.sort(spike_times[neuron_mask])
-        neuron_waveforms = waveforms[neuron_mask, :]
+        neuron_times = np.sort(spike_times[rows].astype(float))
+        neuron_waveforms = waveforms[rows, :]
 
         # Compute ISIs
-        ISIs = np.diff(neuron_times)
-        if len(ISIs) == 0:
-            ISI_freqs = np.zeros(len(ISI_bins) - 1)
-        else:
-            ISI_freqs, _ = np.histogram(ISIs, bins=ISI_bins, density=True)
-            if np.isnan(ISI_freqs).any():
-                ISI_freqs[np.isnan(ISI_freqs)] = 0
+        with profiler.stage("isi_histogram", channel=channel):
+            ISIs = np.diff(neuron_times)
+            if len(ISIs) == 0:
+                ISI_freqs = np.zeros(len(ISI_bins) - 1)
+            else:
+                ISI_freqs, _ = np.histogram(ISIs, bins=ISI_bins, density=True)
+                if np.isnan(ISI_freqs).any():
+                    ISI_freqs[np.isnan(ISI_freqs)] = 0
 
         # Compute waveform quintiles (10%, 20%, ..., 90%)
-        quintiles = np.percentile(neuron_waveforms, np.arange(10, 100, 10), axis=0)
+        with profiler.stage("waveform_percentiles", channel=channel):
+            quintiles = np.percentile(neuron_waveforms, np.arange(10, 100, 10), axis=0)
 
         neurons.append({
             'cluster_id': int(cid),
             'ISI_bins': ISI_bins[:-1],  # bin edges (left)
             'ISI_freqs': ISI_freqs,
             'waveform_quintiles': quintiles,
+            'ISIs': np.sort(ISIs).astype(np.float32),
+            'activity': bin_activity(spike_times[rows], peak_amplitudes(neuron_waveforms)),
             'firing_rate_hz': len(neuron_times) / (neuron_times[-1] - neuron_times[0]) * 1000 if len(neuron_times) > 1 else 0.0
         })
 
     return neurons
 
-def collect_neuron_data(directory, outfile, pattern="times_*.mat", nbins=50, verbose=True, keep_duplicates=False):
+def load_spike_times(mat_path, keep_duplicates=False, cache_dir=None, t_start=None, t_stop=None):
+    """
+    Returns {cluster_id: sorted spike times (ms)} for the same units load_spike_data()
+    reports: cluster 0 is dropped, as are DER duplicates unless keep_duplicates is set.
+    """
+    mat = load_channel(mat_path, cache_dir)
+    index = channel_index(mat)
+    units = {}
+    for cid in index['sorted_clusters']:
+        if cid == 0:
+            continue
+        rows = window_rows(index, cid, t_start, t_stop)
+        if 'detectionLabel' in mat and not keep_duplicates:
+            rows = rows[mat['detectionLabel'][rows] == 1]
+        if len(rows):
+            units[int(cid)] = np.asarray(mat['cluster_class'][rows, 1], dtype=float)
+    return units
+
+def collect_spike_times(directory, pattern="times_*.mat", keep_duplicates=False, cache_dir=None):
+    """Returns [(filename, cluster_id, sorted spike times in ms)] for every unit in directory, in collect_neuron_data() order."""
+    units = []
+    for fpath in sorted(glob.glob(os.path.join(directory, pattern))):
+        for cid, times in load_spike_times(fpath, keep_duplicates=keep_duplicates, cache_dir=cache_dir).items():
+            units.append((os.path.basename(fpath), cid, times))
+    return units
+
+def parse_channel(fpath, nbins=50, keep_duplicates=False, cache_dir=None, t_start=None, t_stop=None):
+    """
+    Returns (neurons, isis, activity) for one channel file: the JSON-ready neuron dicts
+    (with 'filename' set) and, per neuron, the intervals and binned activity that go into
+    the ISI and activity stores.
+    """
+    neurons = load_spike_data(fpath, nbins=nbins, keep_duplicates=keep_duplicates, cache_dir=cache_dir, t_start=t_start, t_stop=t_stop)
+    isis, activity = [], []
+    for n in neurons:
+        n['filename'] = os.path.basename(fpath)
+        isis.append(n.pop('ISIs'))
+        activity.append(n.pop('activity'))
+        # Convert numpy arrays to lists for JSON compatibility
+        n['ISI_bins'] = n['ISI_bins'].tolist()
+        n['ISI_freqs'] = n['ISI_freqs'].tolist()
+        n['waveform_quintiles'] = np.asarray(n['waveform_quintiles']).tolist()
+    return neurons, isis, activity
+
+def write_neuron_data(outfile, neurons, isis, activity):
+    """Writes the neuron JSON and its ISI and activity stores; the JSON is replaced atomically."""
+    with profiler.stage("write_json"):
+        atomic_write(outfile, lambda f: json.dump(neurons, f, indent=2), mode='w')
+        filenames, cluster_ids = [n['filename'] for n in neurons], [n['cluster_id'] for n in neurons]
+        save_isi_store(isi_store_file(outfile), filenames, cluster_ids, isis)
+        save_activity_store(activity_store_file(outfile), filenames, cluster_ids, activity)
+
+def collect_neuron_data(directory, outfile, pattern="times_*.mat", nbins=50, verbose=True, keep_duplicates=False, on_channel=None, cache_dir=None, t_start=None, t_stop=None, skip_errors=False):
     """
     Finds all .mat files matching the pattern in the given directory,
     extracts neuron data using load_spike_data(), adds filename to each dict,
-    and saves combined results to a JSON file.
+    and saves combined results to a JSON file. The units' ISIs and binned activity
+    over time are saved next to it (see isi_store.py and activity_store.py), so
+    histograms can be re-binned and stability plotted without re-parsing.
+    If on_channel is given, it is called as on_channel(filename, neurons, done, total)
+    after each file is parsed, so callers can consume results before the whole
+    directory is finished. t_start/t_stop (ms) restrict the summaries to a time window.
+    With skip_errors, a file that cannot be parsed (e.g. one wave_clus is still writing) is
+    reported and skipped, so the other channels are still saved; otherwise the error is
+    raised and nothing is written. Returns the paths of the skipped files.
     """
     if verbose:
         print(f"Searching '{directory}' for '{pattern}' ...")
@@ -79,25 +155,63 @@ def collect_neuron_data(directory, outfile, pattern="times_*.mat", nbins=50, ver
     if verbose:
         print(f"Found {len(files)} files matching pattern '{pattern}'.")
     all_neurons = []
+    all_isis = []
+    all_activity = []
+    failed = []
 
-    for fpath in files:
+    for i, fpath in enumerate(files):
         if verbose:
             print(f"Processing {os.path.basename(fpath)} ...")
-        neurons = load_spike_data(fpath, nbins=nbins, keep_duplicates=keep_duplicates)
-        for n in neurons:
-            n['filename'] = os.path.basename(fpath)
-            # Convert numpy arrays to lists for JSON compatibility
-            n['ISI_bins'] = n['ISI_bins'].tolist()
-            n['ISI_freqs'] = n['ISI_freqs'].tolist()
-            n['waveform_quintiles'] = np.asarray(n['waveform_quintiles']).tolist()
+        try:
+            neurons, isis, activity = parse_channel(fpath, nbins=nbins, keep_duplicates=keep_duplicates, cache_dir=cache_dir, t_start=t_start, t_stop=t_stop)
+        except Exception as e:
+            if not skip_errors:
+                raise
+            print(f"WARNING: skipping {fpath}, which could not be parsed: {e}")
+            failed.append(fpath)
+            neurons, isis, activity = [], [], []
         all_neurons.extend(neurons)
+        all_isis.extend(isis)
+        all_activity.extend(activity)
+        if on_channel is not None:
+            on_channel(os.path.basename(fpath), neurons, i + 1, len(files))
 
     # Save all results as a single JSON file
-    with open(outfile, 'w') as f:
-        json.dump(all_neurons, f, indent=2)
+    write_neuron_data(str(outfile), all_neurons, all_isis, all_activity)
 
     if verbose:
         print(f"Saved {len(all_neurons)} neuron entries to {outfile}")
+    return failed
+
+def update_neuron_data(outfile, fpath, nbins=50, keep_duplicates=False, cache_dir=None):
+    """
+    Re-parses one channel file into an existing neuron JSON (and its ISI and activity
+    stores), replacing that channel's units or dropping them if fpath no longer exists.
+    Units stay ordered by filename, as collect_neuron_data() writes them.
+    Returns (all neurons, the channel's neurons).
+    """
+    filename = os.path.basename(fpath)
+    neurons, isis, activity = [], [], []
+    if os.path.exists(outfile):
+        with open(outfile, 'r') as f:
+            neurons = json.load(f)
+        isi_store = load_isi_store(isi_store_file(outfile))
+        activity_store = load_activity_store(activity_store_file(outfile))
+        offsets = isi_store["offsets"]
+        isis = [isi_store["isis"][offsets[i]:offsets[i + 1]] for i in range(len(neurons))]
+        activity = [unit_activity(activity_store, i) for i in range(len(neurons))]
+    keep = [i for i, n in enumerate(neurons) if n['filename'] != filename]
+    channel = ([], [], [])
+    if os.path.exists(fpath):
+        channel = parse_channel(fpath, nbins=nbins, keep_duplicates=keep_duplicates, cache_dir=cache_dir)
+    # insert after the units of every channel that sorts before this one
+    at = sum(1 for i in keep if neurons[i]['filename'] < filename)
+    merged = []
+    for old, new in zip((neurons, isis, activity), channel):
+        rows = [old[i] for i in keep]
+        merged.append(rows[:at] + list(new) + rows[at:])
+    write_neuron_data(str(outfile), *merged)
+    return merged[0], channel[0]
 
 if __name__ == "__main__":
     import argparse
@@ -128,10 +242,19 @@ if __name__ == "__main__":
         help="Number of log-spaced ISI bins between 1 ms and 10 s (default: 50)."
     )
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("--t_start", type=float, default=None, help="If set, only uses spikes at or after this time (ms)")
+    parser.add_argument("--t_stop", type=float, default=None, help="If set, only uses spikes before this time (ms)")
+    parser.add_argument("--ingest_cache", action="store_true", help="If set, reads raw arrays through the .npy ingest cache in cluster_viewer_results")
+    parser.add_argument("--profile", default=None, help="If set, writes per-stage/per-channel timing and memory to this JSON file")
     args = parser.parse_args()    
+    if args.profile:
+        profiler.enable()
     outfile = args.outfile
     if outfile is None:
         savedir = os.path.join(args.directory, "cluster_viewer_results")
         os.makedirs(savedir, exist_ok=True)
         outfile = os.path.join(savedir, "neuron_data.json")
-    collect_neuron_data(args.directory, outfile, pattern=args.pattern, nbins=args.nbins, verbose=args.verbose)
+    cache_dir = default_cache_dir(args.directory) if args.ingest_cache else None
+    collect_neuron_data(args.directory, outfile, pattern=args.pattern, nbins=args.nbins, verbose=args.verbose, cache_dir=cache_dir, t_start=args.t_start, t_stop=args.t_stop)
+    if args.profile:
+        profiler.write_report(args.profile)
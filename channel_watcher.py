@@ -0,0 +1,63 @@
+"""
+Polls a directory for channel files that wave_clus creates or rewrites while sorting.
+
+A file is reported once its size and mtime have stayed the same for settle_s seconds,
+so a channel is only parsed after it has been completely written. Polling is one glob
+and a stat per file, which is negligible next to parsing, and works the same on every
+platform and on network filesystems, where change notifications are unreliable.
+"""
+
+import glob
+import os.path
+import time
+
+def snapshot(directory, pattern="times_*.mat"):
+    """{path: (size, mtime_ns)} of the files matching pattern; files vanishing mid-scan are skipped."""
+    files = {}
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files[path] = (st.st_size, st.st_mtime_ns)
+    return files
+
+def settled(files, settle_s, now=None):
+    """The entries of a snapshot() last modified at least settle_s seconds before now (wall-clock seconds)."""
+    if now is None:
+        now = time.time()
+    return {path: identity for path, identity in files.items() if now - identity[1] / 1e9 >= settle_s}
+
+class ChannelWatcher:
+    def __init__(self, directory, pattern="times_*.mat", settle_s=5.0, known=None):
+        """known is a snapshot() of the files already parsed (none by default)."""
+        self.directory = directory
+        self.pattern = pattern
+        self.settle_s = settle_s
+        self.known = dict(known or {})
+        # path -> (identity, time it was first seen with that identity)
+        self.pending = {}
+
+    def poll(self, now=None):
+        """Returns (changed, removed): sorted paths that are new or rewritten and have settled, and paths that were deleted."""
+        if now is None:
+            now = time.monotonic()
+        current = snapshot(self.directory, self.pattern)
+        changed = []
+        for path, identity in current.items():
+            if self.known.get(path) == identity:
+                self.pending.pop(path, None)
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != identity:
+                self.pending[path] = (identity, now)
+            elif now - seen[1] >= self.settle_s:
+                changed.append(path)
+                self.known[path] = identity
+                del self.pending[path]
+        removed = sorted(path for path in self.known if path not in current)
+        for path in removed:
+            del self.known[path]
+        for path in [p for p in self.pending if p not in current]:
+            del self.pending[path]
+        return sorted(changed), removed
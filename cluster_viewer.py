@@ -1,47 +1,229 @@
 #!/usr/bin/env python3
 import os
 import csv
+import functools
+import glob
 import json
 import webbrowser
-import math
-from flask import Flask, jsonify, request, send_from_directory
-from channel_parser import collect_neuron_data
-from make_spikes_matrix import make_spikes_matrix
-from training.data_loader import get_neuron_feature
-from training.train import load_model_predictor
+import queue
+import re
+import threading
+import time
+import numpy as np
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
+from activity_store import activity_store_file, choose_level, level_series, load_activity_store
+from auto_curate import auto_exclude_clusters, export_matrices, write_exclusions
+from isi_store import isi_store_file, load_isi_store, log_bins, rebin
+from profiling import Metrics, profiler
+from session import Session
+from similarity import build_index, find_similar, load_similarity_index, save_similarity_index, similarity_index_file
+from spike_cache import default_cache_dir
+from training.prediction_cache import PREDICTION_CACHE_FILE, predict_probs
+# channel_parser, make_spikes_matrix, duplicates (scipy) and the model loader (torch, for .pt files) are imported on the
+# code paths that need them, so --help and JSON-only viewing start without paying for them
 
 app = Flask(__name__, static_folder="static")
 
 app.config["DATA_FILE"] = "neuron_data.json"
 app.config["EXCLUDE_FILE"] = "clusters_excluded.csv"
 app.config["AUTO_EXCLUDE_FILE"] = "clusters_excluded_auto.csv"
+# Units the curator has toggled at least once; their exclusion state is a label for retraining
+app.config["CURATED_FILE"] = "clusters_curated.csv"
 app.config["EXPORT_ARGS"] = None
+app.config["INGEST_CACHE_DIR"] = None
 app.config["MODEL_FILE"] = None
+# Feature store of the training corpus (training/training_data/feature_store.npz) searched by /api/similar?scope=corpus
+app.config["CORPUS_FILE"] = None
+app.config["RETRAIN_MIN_LABELS"] = 20
+# Share of the curated units held out of every retraining to judge the fine-tuned model on
+app.config["RETRAIN_HOLDOUT_FRACTION"] = 0.2
+app.config["EVENT_KEEPALIVE_SEC"] = 15
+# Set while channels are parsed in the background: {"done", "total", "finished", "error"}
+app.config["PARSE_STATUS"] = None
+
+# Each connected /api/events client owns one queue; publish_event() fans out to all of them
+_event_subscribers = set()
+_event_lock = threading.Lock()
+
+# Neurons parsed so far by the background worker (served until neuron_data.json is written)
+_parsed_neurons = []
+_parse_lock = threading.Lock()
+
+# The session read from DATA_FILE, {"key": (path, mtime_ns, size), "session": Session}; watch mode replaces it
+# directly after each channel update instead of re-reading the JSON
+_session_cache = {}
+_session_lock = threading.Lock()
+
+# Loaded predictors keyed by model path, so the checkpoint is read once per process
+_model_cache = {}
+
+# Background retraining: the curated set the current model was last fitted on, the
+# model_retrained_<n>.npz files this process has swapped in (oldest first; only these are
+# ever deleted) and, while a retrained model is in use, the probabilities its curated
+# units had before ({"model_file": ..., "probs": {(filename, cluster_id): p}}), which it does not re-score
+_retrain_state = {"curated": frozenset(), "written": [], "kept_probs": None}
+_retrain_lock = threading.Lock()
+# Guards MODEL_FILE, _model_cache and _retrain_state["kept_probs"], which the retrainer swaps
+_model_lock = threading.Lock()
+
+# Spike trains of the current session, {"key": source files' identity, "units": [(filename, cluster_id, times)]}
+_spike_trains = {}
+_spike_lock = threading.Lock()
+
+# Correlograms kept by _cached_correlogram (least recently used are dropped first)
+CORRELOGRAM_CACHE_SIZE = 256
+
+# Duplicate unit pairs per (window_ms, min_score), valid for the currently loaded spike trains
+_duplicate_cache = {}
+
+# Similarity index of the session, {"key": (path, mtime_ns, size), "index": ...}
+_similarity_cache = {}
+_similarity_lock = threading.Lock()
+
+# Always-on counters served by /api/metrics (request latency, prediction cache hits, inference time)
+metrics = Metrics()
 
 # ---------------------------
 # Helpers
 # ---------------------------
 
-def load_session():
-    neurons = load_neurons()
-    print(f"Loaded {len(neurons)} neurons from {app.config['DATA_FILE']}")
+def load_session(start=0):
+    """Returns (Session of the units from index start, excluded set, model file), with exclusions and predictions filled in."""
+    session = load_neurons()[start:]
+    print(f"Loaded {len(session)} neurons from {app.config['DATA_FILE']}")
     excluded = load_exclusions()
 
-    model = None
-    if app.config["MODEL_FILE"] is not None:
-        model = _load_model()
-        if model is not None:
-            print(f"Loaded model from {app.config['MODEL_FILE']}")
-    for n in neurons:
-        n["excluded"] = (n["filename"], n["cluster_id"]) in excluded
-        if model is not None:
-            n["model_feature"] = get_neuron_feature(n)
-            n["model_prob"] = 1 / (1 + math.exp(-model(n["model_feature"])))
-    return neurons, excluded, model
+    model_file, kept_probs = current_model()
+    session.set_excluded(excluded)
+    if model_file is not None and len(session):
+        probs = np.zeros(len(session))
+        scored = np.arange(len(session))
+        if kept_probs:
+            keys = session.keys()
+            kept = np.array([k in kept_probs for k in keys], dtype=bool)
+            probs[kept] = [kept_probs[keys[i]] for i in np.flatnonzero(kept)]
+            scored = np.flatnonzero(~kept)
+        # cached predictions are reused; the model is only loaded to score units it has not seen
+        with profiler.stage("predict"):
+            probs[scored], n_cached = predict_probs(session.features()[scored], model_file, lambda: _load_timed_model(model_file), _prediction_cache_file())
+        metrics.incr("prediction_cache_hits", n_cached)
+        metrics.incr("prediction_cache_misses", len(scored) - n_cached)
+        if n_cached < len(scored):
+            print(f"Scored {len(scored) - n_cached} neurons with {model_file} ({n_cached} cached)")
+        session.model_prob = probs
+    return session, excluded, model_file
+
+def current_model():
+    """(model file, {unit key: probability} of the units it must not re-score, or None), read consistently."""
+    with _model_lock:
+        model_file = app.config["MODEL_FILE"]
+        kept = _retrain_state["kept_probs"]
+        return model_file, kept["probs"] if kept is not None and kept["model_file"] == model_file else None
 
 def load_neurons():
-    with open(app.config["DATA_FILE"], "r") as f:
-        return json.load(f)
+    """The session's units as a Session; the parsed JSON is kept until the file changes."""
+    if is_parsing():
+        with _parse_lock:
+            return Session.from_records(_parsed_neurons)
+    path = app.config["DATA_FILE"]
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _session_lock:
+        if _session_cache.get("key") != key:
+            _session_cache.update(key=key, session=Session.from_json(path))
+        return _session_cache["session"]
+
+def is_parsing():
+    status = app.config["PARSE_STATUS"]
+    return status is not None and not status["finished"]
+
+def get_parse_status():
+    status = app.config["PARSE_STATUS"]
+    if status is None:
+        return {"done": 0, "total": 0, "finished": True, "error": None}
+    with _parse_lock:
+        return dict(status)
+
+def start_background_parse(directory, pattern="times_*.mat", nbins=50, verbose=False, keep_duplicates=False, known=None):
+    """
+    Parses channels in a worker thread, publishing a 'parse' event as each channel completes.
+    Files that cannot be parsed are skipped and removed from the known snapshot (if given),
+    so a watcher started with it parses them again once they have settled.
+    """
+    from channel_parser import collect_neuron_data
+    status = {"done": 0, "total": 0, "finished": False, "error": None}
+    with _parse_lock:
+        _parsed_neurons.clear()
+    app.config["PARSE_STATUS"] = status
+
+    def on_channel(filename, neurons, done, total):
+        with _parse_lock:
+            _parsed_neurons.extend(neurons)
+            status["done"] = done
+            status["total"] = total
+        publish_event("parse", {"filename": filename, "done": done, "total": total, "finished": False})
+
+    def worker():
+        t0 = time.perf_counter()
+        try:
+            failed = collect_neuron_data(directory, app.config["DATA_FILE"], pattern=pattern, nbins=nbins, verbose=verbose, keep_duplicates=keep_duplicates, on_channel=on_channel, cache_dir=app.config["INGEST_CACHE_DIR"], skip_errors=True)
+            for path in failed if known is not None else []:
+                known.pop(path, None)
+        except Exception as e:
+            print(f"ERROR: parsing {directory} failed: {e}")
+            status["error"] = str(e)
+        metrics.add_timing("parse", time.perf_counter() - t0)
+        status["finished"] = True
+        if status["error"] is None:
+            # build the similarity index now rather than on the first search
+            load_session_index()
+        publish_event("parse", {"done": status["done"], "total": status["total"], "finished": True, "error": status["error"]})
+
+    thread = threading.Thread(target=worker, name="channel-parser", daemon=True)
+    thread.start()
+    return thread
+
+def update_channel(path, nbins=50, keep_duplicates=False):
+    """Re-parses one channel file (or drops its units if it was deleted) into DATA_FILE and the in-memory session."""
+    from channel_parser import update_neuron_data
+    t0 = time.perf_counter()
+    neurons, channel = update_neuron_data(app.config["DATA_FILE"], path, nbins=nbins, keep_duplicates=keep_duplicates, cache_dir=app.config["INGEST_CACHE_DIR"])
+    st = os.stat(app.config["DATA_FILE"])
+    with _session_lock:
+        _session_cache.update(key=(app.config["DATA_FILE"], st.st_mtime_ns, st.st_size), session=Session.from_records(neurons))
+    metrics.add_timing("update_channel", time.perf_counter() - t0)
+    removed = not os.path.exists(path)
+    print(f"{'Removed' if removed else 'Updated'} {os.path.basename(path)} ({len(channel)} units, {len(neurons)} in session)")
+    publish_event("channel", {"filename": os.path.basename(path), "n_units": len(channel), "removed": removed})
+
+def start_watching(directory, pattern="times_*.mat", nbins=50, keep_duplicates=False, known=None, interval_s=2.0, settle_s=5.0):
+    """
+    Polls directory in a daemon thread and calls update_channel() for every channel file that
+    is created, rewritten (once it has settled) or deleted, except those in the known snapshot.
+    The watcher is created once any background parse has finished, which may still remove
+    files it failed to parse from known.
+    """
+    from channel_watcher import ChannelWatcher
+
+    def worker():
+        watcher = None
+        while True:
+            time.sleep(interval_s)
+            if is_parsing():
+                continue
+            if watcher is None:
+                watcher = ChannelWatcher(directory, pattern, settle_s=settle_s, known=known)
+            changed, removed = watcher.poll()
+            for path in changed + removed:
+                try:
+                    update_channel(path, nbins=nbins, keep_duplicates=keep_duplicates)
+                except Exception as e:
+                    # left as known: the file is retried when it changes again
+                    print(f"ERROR: parsing {path} failed: {e}")
+
+    thread = threading.Thread(target=worker, name="channel-watcher", daemon=True)
+    thread.start()
+    return thread
 
 def load_exclusions():
     excluded = set()
@@ -58,27 +240,298 @@ def load_exclusions():
 def save_exclusions(excluded, exclude_file=None):
     if exclude_file is None:
         exclude_file = app.config["EXCLUDE_FILE"]
-    with open(exclude_file, "w", newline="") as f:
-        writer = csv.writer(f)
-        for fn, cid in sorted(excluded):
-            writer.writerow([fn, cid])
+    write_exclusions(excluded, exclude_file)
+
+def load_curated():
+    curated = set()
+    if os.path.exists(app.config["CURATED_FILE"]):
+        with open(app.config["CURATED_FILE"], newline="") as f:
+            for row in csv.reader(f):
+                if len(row) >= 2:
+                    curated.add((row[0], int(row[1])))
+    return curated
+
+def add_curated(keys):
+    """Records units as curated (see CURATED_FILE); the file is only rewritten if some are new."""
+    curated = load_curated()
+    if not set(keys) <= curated:
+        save_exclusions(curated | set(keys), exclude_file=app.config["CURATED_FILE"])
+
+def publish_event(event, data):
+    """Push a server-sent event (e.g. an exclusion delta) to every connected client."""
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    with _event_lock:
+        subscribers = list(_event_subscribers)
+    for q in subscribers:
+        q.put(message)
+
+def subscribe_events():
+    q = queue.Queue()
+    with _event_lock:
+        _event_subscribers.add(q)
+    return q
+
+def unsubscribe_events(q):
+    with _event_lock:
+        _event_subscribers.discard(q)
+
+def load_spike_trains():
+    """[(filename, cluster_id, sorted spike times in ms)] for the session, reloaded only when a source file changes."""
+    from channel_parser import collect_spike_times
+    a = app.config["EXPORT_ARGS"]
+    files = sorted(glob.glob(os.path.join(a.directory, a.pattern)))
+    key = (a.directory, a.pattern, a.keep_duplicates, tuple((f, os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files))
+    with _spike_lock:
+        if _spike_trains.get("key") != key:
+            units = collect_spike_times(a.directory, pattern=a.pattern, keep_duplicates=a.keep_duplicates, cache_dir=app.config["INGEST_CACHE_DIR"])
+            _spike_trains.update(key=key, units=units, by_unit={(f, c): t for f, c, t in units})
+            _duplicate_cache.clear()
+        return _spike_trains["units"]
+
+def get_spike_times(filename, cluster_id):
+    """Sorted spike times (ms) of one unit of the session, or None if there is no such unit."""
+    load_spike_trains()
+    return _spike_trains["by_unit"].get((filename, cluster_id))
+
+class StaleSpikeTrains(LookupError):
+    """The spike trains were reloaded after the caller read their key."""
+
+@functools.lru_cache(maxsize=CORRELOGRAM_CACHE_SIZE)
+def _cached_correlogram(trains_key, unit, other, window_ms, bin_ms):
+    # trains_key changes whenever a source file does, so stale entries are never hit and age out;
+    # the trains are read under the lock and only if they are still that version (errors are not cached)
+    from correlograms import correlogram
+    with _spike_lock:
+        if _spike_trains.get("key") != trains_key:
+            raise StaleSpikeTrains(unit)
+        times = _spike_trains["by_unit"][unit]
+        other_times = None if other is None else _spike_trains["by_unit"][other]
+    edges, counts = correlogram(times, other_times, window_ms=window_ms, bin_ms=bin_ms)
+    return edges.tolist(), counts.tolist(), len(times), None if other is None else len(other_times)
+
+def find_duplicates(window_ms=0.5, min_score=0.5):
+    from duplicates import find_session_duplicates
+    units = load_spike_trains()
+    with _spike_lock:
+        if (window_ms, min_score) not in _duplicate_cache:
+            _duplicate_cache[(window_ms, min_score)] = find_session_duplicates(units, window_ms=window_ms, min_score=min_score)
+        return _duplicate_cache[(window_ms, min_score)]
+
+@functools.lru_cache(maxsize=2)
+def _cached_isi_store(path, mtime_ns):
+    # keyed by mtime, so a re-parse is picked up on the next request
+    return load_isi_store(path)
+
+@functools.lru_cache(maxsize=2)
+def _cached_activity_store(path, mtime_ns):
+    return load_activity_store(path)
 
-def _load_model():
-    if app.config["MODEL_FILE"] is None:
+def _find_unit(filenames, cluster_ids):
+    """Indices of the store units selected by the filename/cluster_id query arguments (all units if absent)."""
+    if request.args.get("filename") is None:
+        return np.arange(len(cluster_ids))
+    return np.flatnonzero((filenames == request.args.get("filename")) & (cluster_ids == request.args.get("cluster_id", type=int)))
+
+def load_session_index():
+    """The similarity index of DATA_FILE, read from its saved copy if that is current, else built and saved."""
+    path = app.config["DATA_FILE"]
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _similarity_lock:
+        if _similarity_cache.get("key") != key:
+            index_file = similarity_index_file(path)
+            index = None
+            if os.path.exists(index_file):
+                index, source = load_similarity_index(index_file)
+                if source != (st.st_size, st.st_mtime_ns):
+                    index = None
+            if index is None:
+                with profiler.stage("similarity_index"):
+                    session = load_neurons()
+                    index = build_index(session.filenames, session.cluster_ids, session.features(), session.isi_freqs)
+                    save_similarity_index(index_file, index, (st.st_size, st.st_mtime_ns))
+            _similarity_cache.update(key=key, index=index)
+        return _similarity_cache["index"]
+
+@functools.lru_cache(maxsize=1)
+def _cached_corpus_index(path, mtime_ns):
+    with np.load(path, allow_pickle=False) as f:
+        return build_index(f["filenames"], f["cluster_ids"], f["X"], sessions=f["sessions"], labels=f["y"])
+
+def _prediction_cache_file():
+    return os.path.join(os.path.dirname(app.config["DATA_FILE"]), PREDICTION_CACHE_FILE)
+
+def _load_timed_model(path):
+    predictor = _load_model(path)
+    def timed_predictor(features):
+        t0 = time.perf_counter()
+        with profiler.stage("inference"):
+            logits = predictor(features)
+        metrics.add_timing("inference", time.perf_counter() - t0)
+        metrics.incr("units_scored", len(logits))
+        return logits
+    return timed_predictor
+
+def _load_model(path):
+    if path is None:
         return None
-    path = app.config["MODEL_FILE"]
     if not os.path.exists(path):
         raise FileNotFoundError(f"Model file {path} not found")
-    return load_model_predictor(path)
+    with _model_lock:
+        if path not in _model_cache:
+            from training.inference import load_predictor
+            _model_cache[path] = load_predictor(path)
+            print(f"Loaded model from {path}")
+        return _model_cache[path]
+
+def retrain_now():
+    """
+    Fine-tunes the current .npz model on the curated units of the session (excluded -> 0,
+    kept -> 1) and, if it does at least as well on a holdout, swaps it in, re-scores the
+    uncurated units and publishes a 'model' event. The holdout is a fixed share of the units
+    (see training.online.holdout_mask()) that no generation is trained on, and the curated
+    units keep the probabilities they had. Returns the retrain() result, or None if there
+    is nothing new to learn from.
+    """
+    from training.inference import NUMPY_MODEL_EXT, load_predictor
+    from training.online import holdout_mask, retrain
+    with _retrain_lock:
+        model_file, kept_probs = current_model()
+        if model_file is None or os.path.splitext(model_file)[1] != NUMPY_MODEL_EXT:
+            return None
+        session = load_neurons()
+        curated = load_curated() & set(session.keys())
+        if len(curated) < app.config["RETRAIN_MIN_LABELS"] or curated == _retrain_state["curated"]:
+            return None
+        keys = session.keys()
+        is_curated = np.array([k in curated for k in keys], dtype=bool)
+        holdout = holdout_mask([k for k in keys if k in curated], app.config["RETRAIN_HOLDOUT_FRACTION"])
+        if holdout.all() or not holdout.any():
+            # wait for more labels rather than train on units that should be held out
+            return None
+        excluded = load_exclusions()
+        labels = np.array([k not in excluded for k in keys], dtype=bool)[is_curated]
+
+        outfile = _reserve_retrained_model(os.path.dirname(os.path.abspath(app.config["DATA_FILE"])), NUMPY_MODEL_EXT)
+        t0 = time.perf_counter()
+        try:
+            result = retrain(model_file, session.features()[is_curated], labels, outfile, holdout=holdout)
+        finally:
+            if os.path.getsize(outfile) == 0:
+                # rejected or failed: give the reserved name back
+                os.remove(outfile)
+        metrics.add_timing("retrain", time.perf_counter() - t0)
+        metrics.incr("retrains")
+        _retrain_state["curated"] = frozenset(curated)
+        print(f"Retrained on {len(curated)} curated units: holdout loss {result['holdout_loss_before']:.4f} -> "
+              f"{result['holdout_loss_after']:.4f} ({'accepted' if result['accepted'] else 'rejected'})")
+        if not result["accepted"]:
+            publish_event("model", {**result, "model_file": model_file, "units": []})
+            return result
+
+        # curated units keep what they were shown with; units curated under the current model were scored by it
+        curated_rows = np.flatnonzero(is_curated)
+        kept_probs = dict(kept_probs or {})
+        new_rows = [i for i in curated_rows if keys[i] not in kept_probs]
+        if new_rows:
+            probs, _ = predict_probs(session.features()[new_rows], model_file, lambda: _load_timed_model(model_file), _prediction_cache_file())
+            kept_probs.update((keys[i], float(p)) for i, p in zip(new_rows, probs))
+        # load before swapping, so no request ever waits on the new model
+        predictor = load_predictor(outfile)
+        written = _retrain_state["written"] + [outfile]
+        # the model before the previous one can no longer be in use by a request
+        stale = written[-3] if len(written) >= 3 else None
+        with _model_lock:
+            _model_cache[outfile] = predictor
+            app.config["MODEL_FILE"] = outfile
+            _retrain_state["kept_probs"] = {"model_file": outfile, "probs": {keys[i]: kept_probs[keys[i]] for i in curated_rows}}
+            _model_cache.pop(stale, None)
+        _retrain_state["written"] = written[-2:]
+        if stale is not None and os.path.exists(stale):
+            os.remove(stale)
+        metrics.incr("model_swaps")
+
+        uncurated = np.flatnonzero(~is_curated)
+        probs, _ = predict_probs(session.features()[uncurated], outfile, lambda: _load_timed_model(outfile), _prediction_cache_file())
+        publish_event("model", {**result, "model_file": outfile, "units": [
+            {"filename": keys[i][0], "cluster_id": keys[i][1], "model_prob": float(p)} for i, p in zip(uncurated, probs)]})
+        return result
+
+def _reserve_retrained_model(directory, ext):
+    """
+    Creates an empty model_retrained_<n><ext> with the lowest n above those already in directory
+    and returns its path, so models of earlier runs (or another viewer) are never overwritten.
+    """
+    pattern = re.compile(rf"model_retrained_(\d+){re.escape(ext)}$")
+    n = max([int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m], default=0)
+    while True:
+        n += 1
+        path = os.path.join(directory, f"model_retrained_{n}{ext}")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            continue
+
+def start_retraining(interval_s):
+    """Calls retrain_now() every interval_s seconds in a daemon thread, skipping while channels are parsed."""
+    def worker():
+        while True:
+            time.sleep(interval_s)
+            if is_parsing():
+                continue
+            try:
+                retrain_now()
+            except Exception as e:
+                print(f"ERROR: retraining failed: {e}")
+
+    thread = threading.Thread(target=worker, name="model-retrainer", daemon=True)
+    thread.start()
+    return thread
 
 # ---------------------------
 # Routes
 # ---------------------------
 
+@app.before_request
+def _start_request_timer():
+    g.request_t0 = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+    t0 = g.get("request_t0")
+    # the event stream stays open for the whole session, so its latency is meaningless
+    if t0 is not None and request.endpoint not in (None, "api_events"):
+        metrics.add_timing(f"request {request.method} {request.path}", time.perf_counter() - t0)
+    return response
+
+@app.route("/api/metrics")
+def api_metrics():
+    snapshot = metrics.snapshot()
+    if profiler.enabled:
+        snapshot["profile"] = profiler.report()
+    return jsonify(snapshot)
+
 @app.route("/api/neurons")
 def api_neurons():
-    neurons, excluded, model = load_session()
-    return jsonify(neurons)
+    session, excluded, model_file = load_session()
+    filename = request.args.get("filename")
+    if filename is not None:
+        # units are ordered by filename, so one channel's units are contiguous
+        rows = np.flatnonzero(session.filenames == filename)
+        session = session[rows[0]:rows[-1] + 1] if len(rows) else session[:0]
+    return jsonify(session.to_records())
+
+@app.route("/api/neurons/progress")
+def api_neurons_progress():
+    """Neurons parsed so far, starting at index `start`, plus the parse progress."""
+    start = request.args.get("start", 0, type=int)
+    # read the status first so a parse finishing mid-request is picked up by the next call
+    status = get_parse_status()
+    if status["error"] is not None:
+        return jsonify({**status, "neurons": []})
+    session, excluded, model_file = load_session(start=start)
+    return jsonify({**status, "neurons": session.to_records()})
 
 @app.route("/api/toggle", methods=["POST"])
 def api_toggle():
@@ -92,42 +545,264 @@ def api_toggle():
     else:
         excluded.add(key)
     save_exclusions(excluded)
+    add_curated({key})
+    publish_event("exclusion", {"filename": filename, "cluster_id": cluster_id, "excluded": key in excluded})
     return jsonify({"status": "ok", "excluded": list(excluded)})
 
-def auto_exclude_clusters(neurons, model):
-    auto_excluded = set()
-    for n in neurons:
-        if n.get("model_prob", 0) < 0.5:
-            auto_excluded.add((n["filename"], n["cluster_id"]))
-    return auto_excluded
+@app.route("/api/events")
+def api_events():
+    q = subscribe_events()
+    keepalive = app.config["EVENT_KEEPALIVE_SEC"]
+    def stream():
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    yield q.get(timeout=keepalive)
+                except queue.Empty:
+                    # comment line keeps proxies and the browser from timing out the stream
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe_events(q)
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _spike_data_unavailable():
+    """An error response if spike trains cannot be read right now, else None."""
+    if app.config["EXPORT_ARGS"] is None:
+        return jsonify({"status": "error", "message": "Spike trains not available (no directory set)"}), 400
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    return None
+
+@app.route("/api/duplicates")
+def api_duplicates():
+    """Likely duplicate unit pairs: units on different channels whose spikes coincide within window_ms."""
+    error = _spike_data_unavailable()
+    if error is not None:
+        return error
+    window_ms = request.args.get("window_ms", 0.5, type=float)
+    min_score = request.args.get("min_score", 0.5, type=float)
+    return jsonify({"window_ms": window_ms, "min_score": min_score, "pairs": find_duplicates(window_ms, min_score)})
+
+@app.route("/api/duplicates/exclude", methods=["POST"])
+def api_duplicates_exclude():
+    """Adds the smaller unit of every likely duplicate pair to the exclusions."""
+    error = _spike_data_unavailable()
+    if error is not None:
+        return error
+    from duplicates import duplicate_exclusions
+    data = request.json or {}
+    pairs = find_duplicates(float(data.get("window_ms", 0.5)), float(data.get("min_score", 0.5)))
+    excluded = load_exclusions()
+    added = sorted(duplicate_exclusions(pairs) - excluded)
+    save_exclusions(excluded | set(added))
+    for filename, cluster_id in added:
+        publish_event("exclusion", {"filename": filename, "cluster_id": cluster_id, "excluded": True})
+    return jsonify({"status": "ok", "added": added})
+
+@app.route("/api/isi")
+def api_isi():
+    """
+    ISI histograms re-binned from the stored intervals into nbins log-spaced edges between
+    min_ms and max_ms, for every unit of the session or only (filename, cluster_id).
+    """
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    store_file = isi_store_file(app.config["DATA_FILE"])
+    if not os.path.exists(store_file):
+        return jsonify({"status": "error", "message": f"No ISI store next to {app.config['DATA_FILE']}; re-parse the session to create it"}), 404
+    nbins = request.args.get("nbins", 50, type=int)
+    min_ms = request.args.get("min_ms", 1.0, type=float)
+    max_ms = request.args.get("max_ms", 10000.0, type=float)
+    if not (2 <= nbins <= 1000 and 0 < min_ms < max_ms):
+        return jsonify({"status": "error", "message": "Need 2 <= nbins <= 1000 and 0 < min_ms < max_ms"}), 400
+
+    store = _cached_isi_store(store_file, os.stat(store_file).st_mtime_ns)
+    filenames, cluster_ids, offsets = store["filenames"], store["cluster_ids"], store["offsets"]
+    units = _find_unit(filenames, cluster_ids)
+    if request.args.get("filename") is not None:
+        if len(units) == 0:
+            return jsonify({"status": "error", "message": "Unknown unit"}), 404
+        i = units[0]
+        isis, offsets = store["isis"][offsets[i]:offsets[i + 1]], np.array([0, offsets[i + 1] - offsets[i]])
+    else:
+        isis = store["isis"]
+
+    edges = log_bins(nbins, min_ms, max_ms)
+    density = rebin(isis, offsets, edges)
+    return jsonify({"ISI_bins": edges[:-1].tolist(), "units": [
+        {"filename": str(filenames[i]), "cluster_id": int(cluster_ids[i]), "ISI_freqs": d.tolist()} for i, d in zip(units, density)]})
+
+@app.route("/api/activity")
+def api_activity():
+    """
+    Firing rate and mean peak amplitude over time for the session or one unit, from the
+    finest pre-binned level with at most `width` bins (e.g. the plot's width in pixels).
+    """
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    store_file = activity_store_file(app.config["DATA_FILE"])
+    if not os.path.exists(store_file):
+        return jsonify({"status": "error", "message": f"No activity store next to {app.config['DATA_FILE']}; re-parse the session to create it"}), 404
+    width = request.args.get("width", 200, type=int)
+    if width < 1:
+        return jsonify({"status": "error", "message": "Need width >= 1"}), 400
+
+    store = _cached_activity_store(store_file, os.stat(store_file).st_mtime_ns)
+    if "starts_0" not in store:
+        return jsonify({"status": "error", "message": f"The activity store next to {app.config['DATA_FILE']} is in an old format; re-parse the session to update it"}), 404
+    units = _find_unit(store["filenames"], store["cluster_ids"])
+    if request.args.get("filename") is not None and len(units) == 0:
+        return jsonify({"status": "error", "message": "Unknown unit"}), 404
+    k = choose_level(store, width)
+    rates, amplitudes = level_series(store, k, units)
+    return jsonify({"bin_s": int(store["levels_s"][k]), "n_bins": rates.shape[1], "units": [
+        {"filename": str(store["filenames"][i]), "cluster_id": int(store["cluster_ids"][i]),
+         "rate_hz": np.round(r, 3).tolist(),
+         "amplitude": [None if np.isnan(v) else v for v in np.round(a, 2).tolist()]}
+        for i, r, a in zip(units, rates, amplitudes)]})
+
+@app.route("/api/correlogram")
+def api_correlogram():
+    """
+    Autocorrelogram of (filename, cluster_id), or its cross-correlogram with (filename2, cluster_id2),
+    over +-window_ms in bins of bin_ms. Lags are the other unit's spike times minus this unit's.
+    """
+    error = _spike_data_unavailable()
+    if error is not None:
+        return error
+    window_ms = request.args.get("window_ms", 50.0, type=float)
+    bin_ms = request.args.get("bin_ms", 1.0, type=float)
+    if not (window_ms > 0 and bin_ms > 0 and 2 * window_ms / bin_ms <= 10000):
+        return jsonify({"status": "error", "message": "Need window_ms > 0, bin_ms > 0 and at most 10000 bins"}), 400
+    from correlograms import n_bins
+    try:
+        n_bins(window_ms, bin_ms)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    unit = (request.args.get("filename"), request.args.get("cluster_id", type=int))
+    other = None
+    if request.args.get("filename2") is not None:
+        other = (request.args.get("filename2"), request.args.get("cluster_id2", type=int))
+    for u in [unit] if other is None else [unit, other]:
+        if get_spike_times(*u) is None:
+            return jsonify({"status": "error", "message": f"Unknown unit {u[0]} cluster {u[1]}"}), 404
+    with _spike_lock:
+        trains_key = _spike_trains["key"]
+    try:
+        edges, counts, n_spikes, n_spikes2 = _cached_correlogram(trains_key, unit, other, window_ms, bin_ms)
+    except (StaleSpikeTrains, KeyError):
+        return jsonify({"status": "error", "message": "Spike trains were reloaded; retry"}), 409
+    return jsonify({"bin_edges": edges, "counts": counts, "window_ms": window_ms, "bin_ms": bin_ms,
+                    "n_spikes": n_spikes, "n_spikes2": n_spikes2})
+
+def similar_units(filename, cluster_id, k=10, scope="session", with_isi=False):
+    """
+    (matches, error): the k units most similar to (filename, cluster_id), best first, from the
+    session or the training corpus (which has no ISI histograms); error is a (message, status) pair.
+    """
+    index = load_session_index()
+    rows = np.flatnonzero((index["filenames"] == filename) & (index["cluster_ids"] == cluster_id))
+    if len(rows) == 0:
+        return None, (f"Unknown unit {filename} cluster {cluster_id}", 404)
+    row = rows[0]
+    waveform, isi = index["waveform"][row], index["isi"][row] if with_isi else None
+    if scope == "session":
+        found, sims = find_similar(index, waveform, isi, k=k, skip=row)
+        excluded = load_exclusions()
+        return [{"filename": str(index["filenames"][i]), "cluster_id": int(index["cluster_ids"][i]), "similarity": round(float(s), 4),
+                 "excluded": (str(index["filenames"][i]), int(index["cluster_ids"][i])) in excluded} for i, s in zip(found, sims)], None
+    corpus_file = app.config["CORPUS_FILE"]
+    if corpus_file is None or not os.path.exists(corpus_file):
+        return None, ("No training corpus feature store available", 404)
+    if with_isi:
+        return None, ("The training corpus has no ISI histograms", 400)
+    corpus = _cached_corpus_index(corpus_file, os.stat(corpus_file).st_mtime_ns)
+    if corpus["waveform"].shape[1] != len(waveform):
+        return None, (f"Corpus features have {corpus['waveform'].shape[1]} samples, the session's {len(waveform)}", 400)
+    found, sims = find_similar(corpus, waveform, k=k)
+    return [{"session": str(corpus["sessions"][i]), "filename": str(corpus["filenames"][i]), "cluster_id": int(corpus["cluster_ids"][i]),
+             "similarity": round(float(s), 4), "excluded": not corpus["labels"][i]} for i, s in zip(found, sims)], None
+
+@app.route("/api/similar")
+def api_similar():
+    """
+    The k units whose median waveform (and, with isi=1, ISI histogram) are most similar in
+    shape to (filename, cluster_id), within the session (scope=session) or the training corpus (scope=corpus).
+    """
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    k = request.args.get("k", 10, type=int)
+    scope = request.args.get("scope", "session")
+    if not (1 <= k <= 1000 and scope in ("session", "corpus")):
+        return jsonify({"status": "error", "message": "Need 1 <= k <= 1000 and scope 'session' or 'corpus'"}), 400
+    matches, error = similar_units(request.args.get("filename"), request.args.get("cluster_id", type=int), k=k, scope=scope,
+                                   with_isi=request.args.get("isi", 0, type=int) == 1)
+    if error is not None:
+        return jsonify({"status": "error", "message": error[0]}), error[1]
+    return jsonify({"scope": scope, "matches": matches})
+
+@app.route("/api/similar/exclude", methods=["POST"])
+def api_similar_exclude():
+    """Excludes the session units among the k most similar to a unit whose similarity is at least min_similarity."""
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    data = request.json or {}
+    try:
+        cluster_id, k, min_similarity = int(data["cluster_id"]), int(data.get("k", 100)), float(data.get("min_similarity", 0.9))
+    except (KeyError, TypeError, ValueError):
+        cluster_id = k = min_similarity = None
+    if cluster_id is None or not (1 <= k <= 1000 and -1 <= min_similarity <= 1):
+        return jsonify({"status": "error", "message": "Need an integer cluster_id, 1 <= k <= 1000 and -1 <= min_similarity <= 1"}), 400
+    matches, error = similar_units(data.get("filename"), cluster_id, k=k, with_isi=bool(data.get("isi", False)))
+    if error is not None:
+        return jsonify({"status": "error", "message": error[0]}), error[1]
+    selected = {(m["filename"], m["cluster_id"]) for m in matches if m["similarity"] >= min_similarity}
+    excluded = load_exclusions()
+    added = sorted(selected - excluded)
+    save_exclusions(excluded | set(added))
+    # an explicit exclusion, like a toggle, is a label for retraining
+    add_curated(selected)
+    for filename, cluster_id in added:
+        publish_event("exclusion", {"filename": filename, "cluster_id": cluster_id, "excluded": True})
+    return jsonify({"status": "ok", "added": added})
 
 def export_spike_matrices(use_model_predictions=False):
     a = app.config["EXPORT_ARGS"]
     if a is None:
         return
     outdir = os.path.join(a.directory, "cluster_viewer_results")
-    neurons, excluded, model = load_session()
+    session, excluded, model_file = load_session()
     exclude_file = app.config["EXCLUDE_FILE"]
     didAuto = False
 
-    if use_model_predictions and model is not None:
+    if use_model_predictions and model_file is not None:
         didAuto = True
         exclude_file = app.config["AUTO_EXCLUDE_FILE"]
         print("Generating auto-exclusion list based on model predictions...")
-        auto_excluded = auto_exclude_clusters(neurons, model)
+        auto_excluded = auto_exclude_clusters(session)
         save_exclusions(auto_excluded, exclude_file=exclude_file)
         print(f"Auto-excluded {len(auto_excluded)} clusters based on model predictions (saved to {exclude_file})")
 
     print('Creating spike matrix files...')
     file_ext = "_auto.mat" if didAuto else ".mat"
-    make_spikes_matrix(a.directory, outfile=os.path.join(outdir, f"spikes{file_ext}"), ignoreClusters=False, includeClusterZero=False, ignoreForced=False, ignoreDuplicates=not a.keep_duplicates, skipEmptyChannels=a.skip_empty_channels, exclusionfile=exclude_file)
-    make_spikes_matrix(a.directory, outfile=os.path.join(outdir, f"spikes_perChannel{file_ext}"), ignoreClusters=True, includeClusterZero=False, ignoreForced=False, ignoreDuplicates=not a.keep_duplicates, skipEmptyChannels=a.skip_empty_channels, exclusionfile=exclude_file)
+    export_matrices(a.directory, outdir, exclude_file, file_ext=file_ext, keep_duplicates=a.keep_duplicates,
+                    skip_empty_channels=a.skip_empty_channels, cache_dir=app.config["INGEST_CACHE_DIR"])
 
 @app.route("/api/export", methods=["POST"])
 def api_export():
     if app.config["EXPORT_ARGS"] is None:
         return jsonify({"status": "error", "message": "Export not available (no directory set)"}), 400
-    export_spike_matrices()
+    if is_parsing():
+        return jsonify({"status": "error", "message": "Channels are still being parsed"}), 409
+    publish_event("export", {"status": "running"})
+    try:
+        export_spike_matrices()
+    except Exception as e:
+        publish_event("export", {"status": "error", "message": str(e)})
+        raise
+    publish_event("export", {"status": "ok"})
     return jsonify({"status": "ok"})
 
 @app.route("/")
@@ -153,16 +828,31 @@ if __name__ == "__main__":
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
     parser.add_argument("--keep_duplicates", action="store_true", help="Keep duplicates (if DER labels are included)")
     parser.add_argument("--skip_empty_channels", action="store_true", help="If set, skips channels without spikes (note this will affect channel indexing)")
-    parser.add_argument("--model_file", default=os.path.join(basedir, "training/model.pt"), help="Path to trained model file (.pt) for predictions")
+    parser.add_argument("--model_file", default=os.path.join(basedir, "training/model.npz"), help="Path to trained model file for predictions: a torch-free .npz (see training/export_model.py) or a .pt checkpoint")
+    parser.add_argument("--corpus", default=os.path.join(basedir, "training/training_data/feature_store.npz"), help="Feature store of the training corpus to search for similar units (see training/data_loader.py)")
     parser.add_argument("--skip_manual", action="store_true", help="If set, auto-exports based on model predictions (and does not start server)")
+    parser.add_argument("--no_browser", action="store_true", help="If set, does not open a browser window when the server starts")
+    parser.add_argument("--no_ingest_cache", action="store_true", help="If set, decodes the .mat files on every parse/export instead of memory-mapping cached .npy copies")
+    parser.add_argument("--watch", action="store_true", help="If set, keeps watching the directory and parses channel files as they are created or rewritten (e.g. while wave_clus is still sorting)")
+    parser.add_argument("--settle_sec", type=float, default=5.0, help="With --watch, seconds a file must stay unchanged before it is parsed (default 5)")
+    parser.add_argument("--retrain_every", type=float, default=0, help="If > 0, fine-tunes the (.npz) model on the units curated so far every this many seconds and hot-swaps it in when it does at least as well on a holdout")
+    parser.add_argument("--retrain_min_labels", type=int, default=20, help="Number of curated units needed before retraining (default 20)")
+    parser.add_argument("--profile", default=None, help="If set, records per-stage/per-channel timing and memory and writes them to this JSON file on exit")
 
     args = parser.parse_args()
+    if args.profile:
+        import atexit
+        profiler.enable()
+        atexit.register(profiler.write_report, args.profile)
     app.config["MODEL_FILE"] = args.model_file if os.path.exists(args.model_file) else None
+    app.config["CORPUS_FILE"] = args.corpus if os.path.exists(args.corpus) else None
     if args.directory:
         if not os.path.isdir(args.directory):
             raise NotADirectoryError(f"{args.directory} is not a valid directory")
         savedir = os.path.join(args.directory, "cluster_viewer_results")
         os.makedirs(savedir, exist_ok=True)
+        if not args.no_ingest_cache:
+            app.config["INGEST_CACHE_DIR"] = default_cache_dir(args.directory)
         app.config["DATA_FILE"] = args.jsonfile if args.jsonfile else os.path.join(savedir, app.config["DATA_FILE"])
     if args.csvfile is not None:
         app.config["EXCLUDE_FILE"] = args.csvfile
@@ -170,26 +860,40 @@ if __name__ == "__main__":
     else:
         app.config["EXCLUDE_FILE"] = os.path.join(os.path.dirname(app.config["DATA_FILE"]), app.config["EXCLUDE_FILE"])
         app.config["AUTO_EXCLUDE_FILE"] = os.path.join(os.path.dirname(app.config["DATA_FILE"]), app.config["AUTO_EXCLUDE_FILE"])
+    app.config["CURATED_FILE"] = os.path.join(os.path.dirname(app.config["EXCLUDE_FILE"]), os.path.basename(app.config["CURATED_FILE"]))
 
     if args.directory:
-        collect_neuron_data(args.directory, app.config["DATA_FILE"], pattern=args.pattern, nbins=args.nbins, verbose=args.verbose, keep_duplicates=args.keep_duplicates)
         app.config["EXPORT_ARGS"] = args
 
         if args.skip_manual and app.config["MODEL_FILE"] is not None:
+            from channel_parser import collect_neuron_data
+            collect_neuron_data(args.directory, app.config["DATA_FILE"], pattern=args.pattern, nbins=args.nbins, verbose=args.verbose, keep_duplicates=args.keep_duplicates, cache_dir=app.config["INGEST_CACHE_DIR"])
             print("Auto-exporting based on model predictions...")
             export_spike_matrices(use_model_predictions=True)
             print("Done.")
             exit(0)
+        # files created or rewritten after this snapshot, or still changing when it was taken, are left to the watcher
+        from channel_watcher import settled, snapshot
+        known = settled(snapshot(args.directory, args.pattern), args.settle_sec)
+        # serve the UI right away; channels stream to the browser as they are parsed
+        start_background_parse(args.directory, pattern=args.pattern, nbins=args.nbins, verbose=args.verbose, keep_duplicates=args.keep_duplicates, known=known)
+        if args.watch:
+            start_watching(args.directory, pattern=args.pattern, nbins=args.nbins, keep_duplicates=args.keep_duplicates, known=known, settle_s=args.settle_sec)
     else:
         if not args.jsonfile:
             raise ValueError("Must provide --directory or --jsonfile")
         app.config["DATA_FILE"] = args.jsonfile
-    if not os.path.exists(app.config["DATA_FILE"]):
-        raise FileNotFoundError(f"Cannot find {app.config['DATA_FILE']}")
+        if not os.path.exists(app.config["DATA_FILE"]):
+            raise FileNotFoundError(f"Cannot find {app.config['DATA_FILE']}")
+
+    if args.retrain_every > 0 and app.config["MODEL_FILE"] is not None:
+        app.config["RETRAIN_MIN_LABELS"] = args.retrain_min_labels
+        start_retraining(args.retrain_every)
 
     url = f"http://127.0.0.1:{args.port}"
     print(f"Starting server at {url}")
-    Timer(1.0, lambda: webbrowser.open(url)).start()
-    app.run(debug=False, port=args.port)
+    if not args.no_browser:
+        Timer(1.0, lambda: webbrowser.open(url)).start()
+    app.run(debug=False, port=args.port, threaded=True)
     print("Server stopped.")
     # export_spike_matrices()
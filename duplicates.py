@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Detects units recorded twice, typically the same neuron picked up on neighbouring
+electrodes, from the coincidence of their spike trains.
+
+All spikes are binned at the coincidence window and every unit becomes one row of a
+sparse (units x bins) matrix. One sparse product against the same matrix dilated by a
+bin on either side gives, for every pair of units at once, an upper bound on how many
+spikes of one have a spike of the other nearby. Only pairs whose bound clears the
+threshold are counted exactly, with a searchsorted over the sorted spike times.
+"""
+
+import argparse
+import csv
+import os.path
+import numpy as np
+from scipy import sparse
+
+PAIR_FIELDS = ["filename_a", "cluster_id_a", "filename_b", "cluster_id_b", "n_spikes_a", "n_spikes_b",
+               "coincidences", "score", "expected"]
+
+def count_coincidences(a, b, window_ms):
+    """Number of spikes in sorted a that have a spike in sorted b within +-window_ms."""
+    if len(a) == 0 or len(b) == 0:
+        return 0
+    idx = np.searchsorted(b, a)
+    before = np.abs(a - b[np.clip(idx - 1, 0, len(b) - 1)])
+    after = np.abs(b[np.clip(idx, 0, len(b) - 1)] - a)
+    return int(np.count_nonzero(np.minimum(before, after) <= window_ms))
+
+def _binned_matrix(spike_times, window_ms, offsets=(0,)):
+    """Sparse (units x bins) spike counts, with each spike also added at the given bin offsets."""
+    counts = np.array([len(t) for t in spike_times])
+    rows = np.repeat(np.arange(len(spike_times)), counts)
+    bins = np.floor(np.concatenate(spike_times) / window_ms).astype(np.int64)
+    bins -= bins.min() - 1  # leave room for the -1 offset
+    n_bins = bins.max() + 2
+    rows = np.tile(rows, len(offsets))
+    cols = np.concatenate([bins + o for o in offsets])
+    return sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(spike_times), n_bins))
+
+def find_duplicate_units(spike_times, channels, window_ms=0.5, min_score=0.5, min_spikes=10, cross_channel_only=True):
+    """
+    Returns likely duplicate pairs among units given as sorted spike time arrays (ms), best first.
+
+    Each pair is a dict with the unit indices 'a' and 'b' (b is the unit with fewer spikes, or the
+    later one on a tie), 'coincidences' (spikes of b with a spike of a within +-window_ms),
+    'score' (coincidences / spikes of b) and 'expected' (the score two independent Poisson trains
+    at these rates would reach by chance). Units with fewer than min_spikes spikes are ignored.
+    """
+    spike_times = [np.asarray(t, dtype=float) for t in spike_times]
+    counts = np.array([len(t) for t in spike_times])
+    if np.count_nonzero(counts >= min_spikes) < 2:
+        return []
+    all_times = np.concatenate(spike_times)
+    duration = max(all_times.max() - all_times.min(), window_ms)
+
+    binned = _binned_matrix(spike_times, window_ms)
+    dilated = _binned_matrix(spike_times, window_ms, offsets=(-1, 0, 1))
+    dilated.data[:] = 1
+    # bound[i, j] >= number of spikes of unit i with a spike of unit j within one window
+    bound = (binned @ dilated.T).tocoo()
+
+    channels = np.asarray(channels)
+    b, a, upper = bound.row, bound.col, bound.data
+    keep = (a != b) & (counts[b] >= min_spikes) & (counts[a] >= min_spikes)
+    keep &= (counts[b] < counts[a]) | ((counts[b] == counts[a]) & (b > a))
+    keep &= upper >= min_score * counts[b]
+    if cross_channel_only:
+        keep &= channels[a] != channels[b]
+
+    pairs = []
+    for i, j in zip(a[keep], b[keep]):
+        coincidences = count_coincidences(spike_times[j], spike_times[i], window_ms)
+        score = coincidences / counts[j]
+        if score >= min_score:
+            pairs.append({
+                "a": int(i), "b": int(j), "coincidences": coincidences, "score": float(score),
+                "expected": float(min(1.0, counts[i] * 2 * window_ms / duration)),
+            })
+    return sorted(pairs, key=lambda p: (-p["score"], p["a"], p["b"]))
+
+def find_session_duplicates(units, **kwargs):
+    """find_duplicate_units() for collect_spike_times() output; pairs are labelled by (filename, cluster_id)."""
+    pairs = find_duplicate_units([t for _, _, t in units], [f for f, _, _ in units], **kwargs)
+    labelled = []
+    for p in pairs:
+        (fa, ca, ta), (fb, cb, tb) = units[p["a"]], units[p["b"]]
+        labelled.append({"filename_a": fa, "cluster_id_a": ca, "filename_b": fb, "cluster_id_b": cb,
+                         "n_spikes_a": len(ta), "n_spikes_b": len(tb), "coincidences": p["coincidences"],
+                         "score": p["score"], "expected": p["expected"]})
+    return labelled
+
+def duplicate_exclusions(pairs):
+    """The (filename, cluster_id) of the smaller unit of each pair, i.e. the one to drop."""
+    return {(p["filename_b"], p["cluster_id_b"]) for p in pairs}
+
+if __name__ == "__main__":
+    from channel_parser import collect_spike_times
+    from spike_cache import default_cache_dir
+    parser = argparse.ArgumentParser(description="Find units with near-identical spike trains across channels.")
+    parser.add_argument("directory", help="Directory containing times_*.mat files")
+    parser.add_argument("--pattern", default="times_*.mat", help="Filename pattern to match (default: 'times_*.mat')")
+    parser.add_argument("--window_ms", type=float, default=0.5, help="Coincidence window in ms (default 0.5)")
+    parser.add_argument("--min_score", type=float, default=0.5, help="Minimum fraction of the smaller unit's spikes that coincide (default 0.5)")
+    parser.add_argument("--keep_duplicates", action="store_true", help="Keep DER-labelled duplicate spikes")
+    parser.add_argument("--same_channel", action="store_true", help="Also compare units on the same channel")
+    parser.add_argument("--ingest_cache", action="store_true", help="If set, reads raw arrays through the .npy ingest cache in cluster_viewer_results")
+    parser.add_argument("--outfile", default=None, help="CSV file for the pairs (default: cluster_viewer_results/duplicate_units.csv)")
+    args = parser.parse_args()
+
+    cache_dir = default_cache_dir(args.directory) if args.ingest_cache else None
+    units = collect_spike_times(args.directory, pattern=args.pattern, keep_duplicates=args.keep_duplicates, cache_dir=cache_dir)
+    pairs = find_session_duplicates(units, window_ms=args.window_ms, min_score=args.min_score, cross_channel_only=not args.same_channel)
+    for p in pairs:
+        print(f"{p['filename_a']} c{p['cluster_id_a']} <-> {p['filename_b']} c{p['cluster_id_b']}: "
+              f"{p['score']:.1%} of {p['n_spikes_b']} spikes coincide (chance {p['expected']:.1%})")
+    outfile = args.outfile
+    if outfile is None:
+        savedir = os.path.join(args.directory, "cluster_viewer_results")
+        os.makedirs(savedir, exist_ok=True)
+        outfile = os.path.join(savedir, "duplicate_units.csv")
+    with open(outfile, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=PAIR_FIELDS)
+        writer.writeheader()
+        writer.writerows(pairs)
+    print(f"Saved {len(pairs)} likely duplicate pairs among {len(units)} units to {outfile}")
@@ -0,0 +1,51 @@
+"""
+Compact store of every unit's sorted inter-spike intervals, written next to the neuron
+JSON at parse time, so ISI histograms can be re-binned to any resolution or range
+without reading the .mat files again.
+
+The intervals of all units are concatenated into one float32 array; unit i owns
+isis[offsets[i]:offsets[i + 1]], in the same order as the neurons in the JSON file.
+"""
+
+import os.path
+import numpy as np
+from atomic_write import atomic_write
+
+ISI_STORE_SUFFIX = "_isis.npz"
+
+def isi_store_file(data_file):
+    """The ISI store belonging to a neuron JSON file, e.g. neuron_data.json -> neuron_data_isis.npz."""
+    return os.path.splitext(data_file)[0] + ISI_STORE_SUFFIX
+
+def save_isi_store(path, filenames, cluster_ids, isis):
+    offsets = np.zeros(len(isis) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in isis])
+    flat = np.concatenate(isis).astype(np.float32) if isis else np.zeros(0, dtype=np.float32)
+    atomic_write(path, lambda f: np.savez(f, isis=flat, offsets=offsets, filenames=np.array(filenames, dtype=str), cluster_ids=np.array(cluster_ids, dtype=np.int64)))
+
+def load_isi_store(path):
+    """Returns {"isis", "offsets", "filenames", "cluster_ids"} as arrays."""
+    with np.load(path) as f:
+        return {k: f[k] for k in ["isis", "offsets", "filenames", "cluster_ids"]}
+
+def log_bins(nbins=50, min_ms=1.0, max_ms=10000.0):
+    """nbins log-spaced bin edges, as used at parse time (np.logspace(0, 4, nbins) by default)."""
+    return np.logspace(np.log10(min_ms), np.log10(max_ms), nbins)
+
+def rebin(isis, offsets, edges):
+    """
+    Returns an (n_units, len(edges) - 1) array of ISI histograms normalized like
+    np.histogram(density=True), with units that have no intervals in range set to 0.
+    All units are binned at once with a single searchsorted and bincount.
+    """
+    n_units, n_bins = len(offsets) - 1, len(edges) - 1
+    unit = np.repeat(np.arange(n_units), np.diff(offsets))
+    idx = np.searchsorted(edges, isis, side="right") - 1
+    idx[isis == edges[-1]] = n_bins - 1  # np.histogram's last bin includes its right edge
+    valid = (idx >= 0) & (idx < n_bins)
+    counts = np.bincount(unit[valid] * n_bins + idx[valid], minlength=n_units * n_bins).reshape(n_units, n_bins)
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        density = counts / totals / np.diff(edges)
+    density[totals[:, 0] == 0] = 0
+    return density
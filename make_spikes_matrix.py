@@ -6,11 +6,14 @@ import warnings
 from datetime import datetime
 
 import numpy as np
-from scipy.io import loadmat, savemat
+from scipy.io import savemat
 from scipy.sparse import lil_matrix
-from scipy.stats import scoreatpercentile
 
-def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClusterZero=False, ignoreForced=False, ignoreDuplicates=True, skipEmptyChannels=False, exclusionfile=None):
+from profiling import profiler
+from spike_cache import default_cache_dir, load_channel
+from spike_index import build_spike_index, channel_index, window_rows
+
+def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClusterZero=False, ignoreForced=False, ignoreDuplicates=True, skipEmptyChannels=False, exclusionfile=None, cacheDir=None, tStart=None, tStop=None):
     """
     Convert *times.mat or *spikes.mat files to a sparse spike matrix (0s and 1s).
 
@@ -30,6 +33,12 @@ def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClu
         If True, ignore duplicate spikes as detected by DER
     exclusionfile : str, optional
         If provided, path to a CSV file with (filename, cluster_id) pairs to exclude
+    cacheDir : str, optional
+        If provided, raw arrays are memory-mapped from the ingest cache in this folder
+        (created on first use, see spike_cache.py) instead of decoding each .mat file.
+    tStart, tStop : float, optional
+        If provided, only spikes with tStart <= time < tStop (ms) are used. Spike matrix
+        columns stay relative to the start of the recording.
 
     Returns
     -------
@@ -103,7 +112,7 @@ def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClu
     # Loop through files
     for c, fname in enumerate(allFiles):
         full_path = os.path.join(directory, fname)
-        data = loadmat(full_path, squeeze_me=True)
+        data = load_channel(full_path, cacheDir)
 
         if ignoreForced and 'forced' not in data:
             warnings.warn(f"ignoreForced=True but {fname} does not include 'forced' field.")
@@ -113,19 +122,40 @@ def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClu
         # Extract spike data
         cell_waveforms = data.get('spikes', np.array([]))
         detection_label = data.get('detectionLabel', np.ones(cell_waveforms.shape[0], dtype=bool)) if ignoreDuplicates else None
+        forced = np.array(data['forced']).flatten() if ignoreForced and 'forced' in data else None
         if 'cluster_class' in data:
-            cluster_class = np.array(data['cluster_class'][:, 0], dtype=float)
-            spike_times = np.array(data['cluster_class'][:, 1], dtype=float)
+            labels, times = data['cluster_class'][:, 0], data['cluster_class'][:, 1]
         else:
-            spike_times = np.array(data.get('index', []), dtype=float)
-            cluster_class = np.ones_like(spike_times)
+            times = np.array(data.get('index', []), dtype=float)
+            labels = np.ones_like(times)
+
+        rows = slice(None)
+        all_cluster_classes = None
+        if tStart is not None or tStop is not None:
+            # rows of the spikes inside the time window, in file order, found through the (cached) spike index
+            index = channel_index(data) if 'cluster_class' in data else build_spike_index(labels, times)
+            all_cluster_classes = index['sorted_clusters']
+            rows = np.sort(np.concatenate([window_rows(index, cid, tStart, tStop) for cid in all_cluster_classes] + [np.zeros(0, dtype=np.int64)]))
+            if cell_waveforms.size > 0:
+                cell_waveforms = cell_waveforms[rows, :]
+            if detection_label is not None:
+                detection_label = np.asarray(detection_label)[rows]
+            if forced is not None and forced.size == len(times):
+                forced = forced[rows]
+        cluster_class = np.array(labels[rows], dtype=float)
+        spike_times = np.array(times[rows], dtype=float)
+
+        # Initialize spike matrix if first file
+        if spikes is None:
+            mxTime = int(np.ceil(np.max(times))) if len(times) else 1
+            spikes = lil_matrix((len(allFiles) * 10, mxTime*3), dtype=bool)  # overallocate a bit
 
         # Exclude specified (filename, cluster_id) pairs
         if excluded:
             assert 'cluster_class' in data, f"Cannot exclude clusters for file {fname} without 'cluster_class' field."
             clusters_to_ignore = [ec for ef, ec in excluded if ef == fname]
             # if any excluded clusters are not actually present, we have a problem
-            cluster_classes = np.unique(cluster_class)
+            cluster_classes = np.unique(cluster_class) if all_cluster_classes is None else all_cluster_classes
             if any(ec not in cluster_classes for ec in clusters_to_ignore):
                 raise Exception(f"Excluded clusters {clusters_to_ignore} not all found in file {fname}.")
             for ec in clusters_to_ignore:
@@ -139,11 +169,6 @@ def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClu
             else:
                 cluster_class[cluster_class > 0] = 1
 
-        # Initialize spike matrix if first file
-        if spikes is None:
-            mxTime = int(np.ceil(spike_times.max())) if spike_times.size else 1
-            spikes = lil_matrix((len(allFiles) * 10, mxTime*3), dtype=bool)  # overallocate a bit
-
         # Identify unique clusters
         cluster_classes = np.unique(cluster_class)
         if includeClusterZero:
@@ -151,88 +176,93 @@ def make_spikes_matrix(directory, outfile=None, ignoreClusters=False, includeClu
         else:
             cluster_classes = cluster_classes[cluster_classes > 0]
 
-        if cluster_classes.size > 0:
-            for cluster_id in cluster_classes:
-                ixc = cluster_class == cluster_id
-                if ignoreForced and 'forced' in data:
-                    forced = np.array(data['forced']).flatten()
-                    if forced.size == len(cluster_class):
+        with profiler.stage("fill_matrix", channel=fname):
+            if cluster_classes.size > 0:
+                for cluster_id in cluster_classes:
+                    ixc = cluster_class == cluster_id
+                    if forced is not None and forced.size == len(cluster_class):
                         ixc = ixc & (forced == 0)
-                if ignoreDuplicates:
-                    cur_spikes_excluded = np.sum((detection_label[ixc] != 1))
-                    ixc = ixc & (detection_label == 1) # Apply detection label mask
-                else:
-                    cur_spikes_excluded = 0
-
-                spike_inds = np.ceil(spike_times[ixc]).astype(int)
-                spike_inds = spike_inds[(spike_inds > 0) & (spike_inds <= spikes.shape[1])]
-                spikes[u, spike_inds-1] = True
-
-                if cell_waveforms.size > 0 and np.any(ixc):
-                    waveform = np.mean(cell_waveforms[ixc, :], axis=0)
-                else:
-                    waveform = np.full((cell_waveforms.shape[1] if cell_waveforms.ndim > 1 else 1,), np.nan)
-
-                waveform_list.append(waveform)
-                chan_list.append(chan_inds[c])
-                cluster_ids_list.append(cluster_id)
-                channel_file_names.append(fname)
-                n_spikes_excluded.append(cur_spikes_excluded)
-                u += 1
-        else:
-            if skipEmptyChannels:
-                print(f"WARNING: No spikes found on channel {chan_inds[c]}, so will skip this channel.")
+                    if ignoreDuplicates:
+                        cur_spikes_excluded = np.sum((detection_label[ixc] != 1))
+                        ixc = ixc & (detection_label == 1) # Apply detection label mask
+                    else:
+                        cur_spikes_excluded = 0
+
+                    spike_inds = np.ceil(spike_times[ixc]).astype(int)
+                    spike_inds = spike_inds[(spike_inds > 0) & (spike_inds <= spikes.shape[1])]
+                    spikes[u, spike_inds-1] = True
+
+                    if cell_waveforms.size > 0 and np.any(ixc):
+                        waveform = np.mean(cell_waveforms[ixc, :], axis=0)
+                    else:
+                        waveform = np.full((cell_waveforms.shape[1] if cell_waveforms.ndim > 1 else 1,), np.nan)
+
+                    waveform_list.append(waveform)
+                    chan_list.append(chan_inds[c])
+                    cluster_ids_list.append(cluster_id)
+                    channel_file_names.append(fname)
+                    n_spikes_excluded.append(cur_spikes_excluded)
+                    u += 1
             else:
-                chan_list.append(chan_inds[c])
-                cluster_ids_list.append(np.nan)
-                channel_file_names.append(fname)
-                waveform_list.append(np.full((cell_waveforms.shape[1] if cell_waveforms.ndim > 1 else 1,), np.nan))
-                n_spikes_excluded.append(0)
-                u += 1
-
-    # Trim spike matrix
-    spikes = spikes[:u, :]
-    spikes = spikes[:, :int(spikes.nonzero()[1].max()) + 1]
-
-    # Compute waveform peak differences
-    waveform = np.vstack(waveform_list)
-
-    # resort chan, spikes, waveforms by channel number
-    chan_list = np.array(chan_list)
-    sort_order = np.argsort(chan_list)
-    chan_list = chan_list[sort_order]
-    cluster_ids_list = np.array(cluster_ids_list)[sort_order]
-    waveform = waveform[sort_order, :]
-    spikes = spikes[sort_order, :]
-    channel_file_names = [channel_file_names[i] for i in sort_order]
-    n_spikes_excluded = np.array(n_spikes_excluded)[sort_order]
-
-    # Construct params struct
-    params = {
-        'directory': directory,
-        'ignoreClusters': ignoreClusters,
-        'includeClusterZero': includeClusterZero,
-        'ignoreForced': ignoreForced,
-        'ignoreDuplicates': ignoreDuplicates,
-        'timeNow': datetime.now().isoformat()
-    }
-
-    # Construct result
-    result = dict(
-        chan=chan_list,
-        cluster_ids=np.array(cluster_ids_list),
-        params=params,
-        spikes=spikes.astype(bool).tocsc(),
-        waveform=waveform,
-        channel_file_names=channel_file_names,
-        n_spikes_excluded=n_spikes_excluded,
-        clusters_excluded=list([','.join([str(x) for x in parts]) for parts in excluded])
-    )
+                if skipEmptyChannels:
+                    print(f"WARNING: No spikes found on channel {chan_inds[c]}, so will skip this channel.")
+                else:
+                    chan_list.append(chan_inds[c])
+                    cluster_ids_list.append(np.nan)
+                    channel_file_names.append(fname)
+                    waveform_list.append(np.full((cell_waveforms.shape[1] if cell_waveforms.ndim > 1 else 1,), np.nan))
+                    n_spikes_excluded.append(0)
+                    u += 1
+
+    with profiler.stage("finalize"):
+        # Trim spike matrix
+        spikes = spikes[:u, :]
+        spikes = spikes[:, :int(spikes.nonzero()[1].max()) + 1 if spikes.nnz else 0]
+
+        # Compute waveform peak differences
+        waveform = np.vstack(waveform_list)
+
+        # resort chan, spikes, waveforms by channel number
+        chan_list = np.array(chan_list)
+        sort_order = np.argsort(chan_list)
+        chan_list = chan_list[sort_order]
+        cluster_ids_list = np.array(cluster_ids_list)[sort_order]
+        waveform = waveform[sort_order, :]
+        spikes = spikes[sort_order, :]
+        channel_file_names = [channel_file_names[i] for i in sort_order]
+        n_spikes_excluded = np.array(n_spikes_excluded)[sort_order]
+
+        # Construct params struct
+        params = {
+            'directory': directory,
+            'ignoreClusters': ignoreClusters,
+            'includeClusterZero': includeClusterZero,
+            'ignoreForced': ignoreForced,
+            'ignoreDuplicates': ignoreDuplicates,
+            'timeNow': datetime.now().isoformat()
+        }
+        if tStart is not None:
+            params['tStart'] = tStart
+        if tStop is not None:
+            params['tStop'] = tStop
+
+        # Construct result
+        result = dict(
+            chan=chan_list,
+            cluster_ids=np.array(cluster_ids_list),
+            params=params,
+            spikes=spikes.astype(bool).tocsc(),
+            waveform=waveform,
+            channel_file_names=channel_file_names,
+            n_spikes_excluded=n_spikes_excluded,
+            clusters_excluded=list([','.join([str(x) for x in parts]) for parts in excluded])
+        )
 
     # Save output if requested
     if outfile:
         print(str(outfile))
-        savemat(str(outfile), result, do_compression=True)
+        with profiler.stage("savemat"):
+            savemat(str(outfile), result, do_compression=True)
         print(f"Saved spike matrix to {outfile}")
 
     return result
@@ -249,7 +279,13 @@ if __name__ == "__main__":
     parser.add_argument("--ignore_duplicates", action="store_true", help="If set, ignore duplicate spikes")
     parser.add_argument("--skip_empty_channels", action="store_true", help="If set, skips channels without spikes (note this will affect channel indexing)")
     parser.add_argument("--exclusionfile", default=None, help="Path to CSV file with (filename, cluster_id) pairs to exclude")
+    parser.add_argument("--t_start", type=float, default=None, help="If set, only uses spikes at or after this time (ms)")
+    parser.add_argument("--t_stop", type=float, default=None, help="If set, only uses spikes before this time (ms)")
+    parser.add_argument("--ingest_cache", action="store_true", help="If set, reads raw arrays through the .npy ingest cache in cluster_viewer_results")
+    parser.add_argument("--profile", default=None, help="If set, writes per-stage/per-channel timing and memory to this JSON file")
     args = parser.parse_args()
+    if args.profile:
+        profiler.enable()
 
     make_spikes_matrix(
         args.directory,
@@ -259,5 +295,10 @@ if __name__ == "__main__":
         ignoreForced=args.ignore_forced,
         ignoreDuplicates=args.ignore_duplicates,
         skipEmptyChannels=args.skip_empty_channels,
-        exclusionfile=args.exclusionfile
+        exclusionfile=args.exclusionfile,
+        cacheDir=default_cache_dir(args.directory) if args.ingest_cache else None,
+        tStart=args.t_start,
+        tStop=args.t_stop
     )
+    if args.profile:
+        profiler.write_report(args.profile)
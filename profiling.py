@@ -0,0 +1,107 @@
+"""
+Lightweight stage timing and memory instrumentation.
+
+The module-level `profiler` is disabled by default, in which case stage() costs a
+single attribute check. Enabling it (--profile on the CLI tools) records wall time,
+bytes read and peak RSS for each stage, optionally per channel, and write_report()
+saves a machine-readable JSON summary.
+"""
+
+import contextlib
+import json
+import resource
+import sys
+import threading
+import time
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+class Profiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self._t0 = time.perf_counter()
+
+    @contextlib.contextmanager
+    def _stage(self, name, channel, bytes_read):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "channel": channel,
+                "wall_s": time.perf_counter() - t0,
+                "bytes_read": bytes_read,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            with self._lock:
+                self.records.append(record)
+
+    def stage(self, name, channel=None, bytes_read=0):
+        """Context manager timing one stage; a no-op while the profiler is disabled."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._stage(name, channel, bytes_read)
+
+    def report(self):
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        channels = {}
+        for r in records:
+            s = stages.setdefault(r["stage"], {"count": 0, "wall_s": 0.0, "max_wall_s": 0.0, "bytes_read": 0})
+            s["count"] += 1
+            s["wall_s"] += r["wall_s"]
+            s["max_wall_s"] = max(s["max_wall_s"], r["wall_s"])
+            s["bytes_read"] += r["bytes_read"]
+            if r["channel"] is not None:
+                c = channels.setdefault(r["channel"], {"wall_s": 0.0, "bytes_read": 0, "stages": {}})
+                c["wall_s"] += r["wall_s"]
+                c["bytes_read"] += r["bytes_read"]
+                c["stages"][r["stage"]] = c["stages"].get(r["stage"], 0.0) + r["wall_s"]
+        return {
+            "total_wall_s": time.perf_counter() - self._t0,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+            "channels": channels,
+        }
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Saved profile to {path}")
+
+class Metrics:
+    """Thread-safe running counters and timings, cheap enough to keep on in a server."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            t = self.timings.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            t["count"] += 1
+            t["total_s"] += seconds
+            t["max_s"] = max(t["max_s"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            timings = {k: {**v, "mean_s": v["total_s"] / v["count"]} for k, v in self.timings.items()}
+            return {"counters": dict(self.counters), "timings": timings, "peak_rss_mb": peak_rss_mb()}
+
+profiler = Profiler()
@@ -0,0 +1,127 @@
+"""
+Array-backed container for the units of a session.
+
+The neuron JSON holds one dict of nested lists per unit. A Session keeps the same data
+as contiguous columns instead (units x ISI bins, units x quantiles x samples, and
+per-unit metadata), so predictions, exclusions and feature extraction are single
+array operations. Unit objects are lightweight views into one row. The JSON shape is
+only rebuilt by to_records(), at the API boundary.
+
+Columns are replaced rather than written to in place (set_excluded, model_prob), so
+slices of a cached Session can be annotated independently.
+"""
+
+import json
+import numpy as np
+
+class Unit:
+    """View of one unit of a Session; the array attributes are views, not copies."""
+    __slots__ = ("session", "index")
+
+    def __init__(self, session, index):
+        self.session = session
+        self.index = index
+
+    @property
+    def filename(self):
+        return str(self.session.filenames[self.index])
+
+    @property
+    def cluster_id(self):
+        return int(self.session.cluster_ids[self.index])
+
+    @property
+    def firing_rate_hz(self):
+        return float(self.session.firing_rate_hz[self.index])
+
+    @property
+    def isi_freqs(self):
+        return self.session.isi_freqs[self.index]
+
+    @property
+    def waveform_quintiles(self):
+        return self.session.waveform_quintiles[self.index]
+
+    @property
+    def model_feature(self):
+        return self.session.features()[self.index]
+
+    @property
+    def excluded(self):
+        return bool(self.session.excluded[self.index])
+
+    @property
+    def model_prob(self):
+        return None if self.session.model_prob is None else float(self.session.model_prob[self.index])
+
+class Session:
+    def __init__(self, filenames, cluster_ids, firing_rate_hz, isi_bins, isi_freqs, waveform_quintiles, excluded=None, model_prob=None):
+        self.filenames = np.asarray(filenames, dtype=str)
+        self.cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+        self.firing_rate_hz = np.asarray(firing_rate_hz, dtype=float)
+        # (n_bins,) when shared by all units, as it is for one parse; (n_units, n_bins) otherwise
+        self.isi_bins = np.asarray(isi_bins, dtype=float)
+        self.isi_freqs = np.asarray(isi_freqs, dtype=float)
+        self.waveform_quintiles = np.asarray(waveform_quintiles, dtype=float)
+        self.excluded = np.zeros(len(self.cluster_ids), dtype=bool) if excluded is None else np.asarray(excluded, dtype=bool)
+        self.model_prob = model_prob
+
+    @classmethod
+    def from_records(cls, neurons):
+        """Builds a Session from neuron dicts in the JSON shape written by collect_neuron_data()."""
+        if not neurons:
+            return cls([], [], [], np.zeros(0), np.zeros((0, 0)), np.zeros((0, 0, 0)))
+        isi_bins = np.array([n["ISI_bins"] for n in neurons], dtype=float)
+        if (isi_bins == isi_bins[0]).all():
+            isi_bins = isi_bins[0]
+        return cls([n["filename"] for n in neurons], [n["cluster_id"] for n in neurons], [n["firing_rate_hz"] for n in neurons],
+                   isi_bins, [n["ISI_freqs"] for n in neurons], [n["waveform_quintiles"] for n in neurons])
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls.from_records(json.load(f))
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def __iter__(self):
+        return (Unit(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        """A Unit for an integer index; a Session sharing this one's arrays for a slice."""
+        if not isinstance(index, slice):
+            return Unit(self, range(len(self))[index])
+        return Session(self.filenames[index], self.cluster_ids[index], self.firing_rate_hz[index],
+                       self.isi_bins if self.isi_bins.ndim == 1 else self.isi_bins[index],
+                       self.isi_freqs[index], self.waveform_quintiles[index], self.excluded[index],
+                       None if self.model_prob is None else self.model_prob[index])
+
+    def keys(self):
+        """(filename, cluster_id) of every unit."""
+        return list(zip(self.filenames.tolist(), self.cluster_ids.tolist()))
+
+    def features(self):
+        """Median waveform of every unit, as training.data_loader.get_neuron_feature() (a view)."""
+        return self.waveform_quintiles[:, self.waveform_quintiles.shape[1] // 2]
+
+    def set_excluded(self, excluded):
+        """Marks the units whose (filename, cluster_id) is in the excluded set."""
+        self.excluded = np.array([k in excluded for k in self.keys()], dtype=bool)
+
+    def to_records(self):
+        """The units as JSON-ready dicts: the collect_neuron_data() shape plus 'excluded' and, with predictions, 'model_feature' and 'model_prob'."""
+        n = len(self)
+        isi_bins = [self.isi_bins.tolist()] * n if self.isi_bins.ndim == 1 else self.isi_bins.tolist()
+        quintiles = self.waveform_quintiles.tolist()
+        records = [
+            {"cluster_id": c, "ISI_bins": b, "ISI_freqs": f, "waveform_quintiles": q, "firing_rate_hz": r, "filename": fn, "excluded": e}
+            for c, b, f, q, r, fn, e in zip(self.cluster_ids.tolist(), isi_bins, self.isi_freqs.tolist(), quintiles,
+                                            self.firing_rate_hz.tolist(), self.filenames.tolist(), self.excluded.tolist())
+        ]
+        if self.model_prob is not None:
+            middle = self.waveform_quintiles.shape[1] // 2
+            for r, q, p in zip(records, quintiles, np.asarray(self.model_prob, dtype=float).tolist()):
+                r["model_feature"] = q[middle]
+                r["model_prob"] = p
+        return records
@@ -0,0 +1,66 @@
+"""
+Nearest-neighbour search over unit features, to find the units that look like one the
+curator has just excluded, within the session or across a training corpus.
+
+A unit is described by its median waveform (the model feature, see
+training.data_loader.get_neuron_feature) and its ISI histogram. Each part is centred and
+scaled to unit length when the index is built, so the dot product of two rows is the
+correlation of their shapes regardless of amplitude, and a query against every unit is
+one matrix-vector product. The session index is saved next to the neuron JSON
+(e.g. neuron_data_similarity.npz) together with the size/mtime of the JSON it was built from.
+"""
+
+import os.path
+import numpy as np
+from atomic_write import atomic_write
+
+SIMILARITY_INDEX_SUFFIX = "_similarity.npz"
+
+def similarity_index_file(data_file):
+    """The similarity index belonging to a neuron JSON file, e.g. neuron_data.json -> neuron_data_similarity.npz."""
+    return os.path.splitext(data_file)[0] + SIMILARITY_INDEX_SUFFIX
+
+def normalize_rows(X):
+    """Rows centred and scaled to unit length (all-constant rows become zero), as float32."""
+    X = np.asarray(X, dtype=float)
+    X = X - X.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (X / norms).astype(np.float32)
+
+def build_index(filenames, cluster_ids, waveforms, isi_freqs=None, **extra):
+    """extra arrays (e.g. sessions, labels) are kept alongside, one entry per unit."""
+    index = {"filenames": np.asarray(filenames, dtype=str), "cluster_ids": np.asarray(cluster_ids, dtype=np.int64),
+             "waveform": normalize_rows(waveforms)}
+    if isi_freqs is not None:
+        index["isi"] = normalize_rows(isi_freqs)
+    index.update({k: np.asarray(v) for k, v in extra.items()})
+    return index
+
+def save_similarity_index(path, index, source):
+    """source is the (size, mtime_ns) of the neuron JSON the index was built from."""
+    atomic_write(path, lambda f: np.savez(f, source=np.array(source, dtype=np.int64), **index))
+
+def load_similarity_index(path):
+    """Returns (index, source)."""
+    with np.load(path) as f:
+        index = {k: f[k] for k in f.files}
+    return index, tuple(int(v) for v in index.pop("source"))
+
+def find_similar(index, waveform, isi=None, k=10, skip=None):
+    """
+    Returns (rows, similarities) of the k units of index most similar to one unit, best first.
+    waveform (and isi, to also compare ISI shape) are that unit's normalized rows; row skip,
+    the unit itself when it is part of the index, is left out.
+    """
+    sims = index["waveform"] @ waveform
+    if isi is not None:
+        sims = (sims + index["isi"] @ isi) / 2
+    if skip is not None:
+        sims[skip] = -np.inf
+    k = min(k, len(sims) - (skip is not None))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    rows = np.argpartition(-sims, k - 1)[:k]
+    rows = rows[np.lexsort((rows, -sims[rows]))]
+    return rows, sims[rows]
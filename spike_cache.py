@@ -0,0 +1,92 @@
+"""
+Ingest cache of the raw arrays in times_*.mat / *spikes.mat files.
+
+The first time a channel is read, its cluster_class, detectionLabel, forced, spikes and
+index fields are written as uncompressed .npy files (one subdirectory per channel, next
+to a small source.json recording the .mat file's size and mtime). Later reads of an
+unchanged file memory-map those arrays instead of decompressing the .mat again, so
+re-parsing a session and every export only touch the pages they actually use.
+The per-cluster time index of spike_index.py is built at ingest and cached the same way.
+"""
+
+import json
+import os.path
+import numpy as np
+from atomic_write import atomic_write
+from profiling import profiler
+from spike_index import INDEX_FIELDS, build_spike_index
+
+CACHE_FIELDS = ("cluster_class", "detectionLabel", "forced", "spikes", "index")
+INGEST_CACHE_DIR = "ingest_cache"
+SOURCE_FILE = "source.json"
+
+def default_cache_dir(directory):
+    return os.path.join(directory, "cluster_viewer_results", INGEST_CACHE_DIR)
+
+def source_identity(mat_path):
+    st = os.stat(mat_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _channel_dir(mat_path, cache_dir):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(mat_path))[0])
+
+def _read_source(channel_dir):
+    try:
+        with open(os.path.join(channel_dir, SOURCE_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _remove(path):
+    # another ingest of the same channel may have removed it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def ingest_channel(mat_path, cache_dir):
+    """Decodes mat_path, writes its cached fields to cache_dir and returns them as in-memory arrays."""
+    import scipy.io as sio  # only needed on a cache miss; keeps the viewer's startup free of scipy
+    identity = source_identity(mat_path)
+    with profiler.stage("loadmat", channel=os.path.basename(mat_path), bytes_read=identity["size"]):
+        data = sio.loadmat(mat_path, squeeze_me=True)
+    arrays = {k: np.asarray(data[k]) for k in CACHE_FIELDS if k in data}
+    if "cluster_class" in arrays and arrays["cluster_class"].ndim == 2:
+        arrays.update(build_spike_index(arrays["cluster_class"][:, 0], arrays["cluster_class"][:, 1]))
+
+    channel_dir = _channel_dir(mat_path, cache_dir)
+    os.makedirs(channel_dir, exist_ok=True)
+    with profiler.stage("ingest", channel=os.path.basename(mat_path)):
+        # invalidate first, so a crash half way through never leaves a manifest pointing at mixed arrays
+        source_file = os.path.join(channel_dir, SOURCE_FILE)
+        _remove(source_file)
+        for k in CACHE_FIELDS + INDEX_FIELDS:
+            npy_file = os.path.join(channel_dir, k + ".npy")
+            if k not in arrays:
+                _remove(npy_file)
+                continue
+            atomic_write(npy_file, lambda f: np.save(f, arrays[k]))
+        atomic_write(source_file, lambda f: json.dump({"source": os.path.basename(mat_path), "identity": identity, "fields": list(arrays)}, f), mode="w")
+    return arrays
+
+def load_channel(mat_path, cache_dir=None):
+    """
+    Returns {field: array} for the CACHE_FIELDS present in mat_path, shaped as by
+    loadmat(squeeze_me=True). With a cache_dir, arrays of an unchanged file are
+    memory-mapped read-only from the cache, and a new or modified file is ingested;
+    the result then also holds the INDEX_FIELDS of spike_index.channel_index().
+    Without one, the .mat file is simply decoded.
+    """
+    channel = os.path.basename(mat_path)
+    if cache_dir is None:
+        import scipy.io as sio
+        with profiler.stage("loadmat", channel=channel, bytes_read=os.path.getsize(mat_path)):
+            data = sio.loadmat(mat_path, squeeze_me=True)
+        return {k: data[k] for k in CACHE_FIELDS if k in data}
+
+    channel_dir = _channel_dir(mat_path, cache_dir)
+    source = _read_source(channel_dir)
+    if source is None or source["identity"] != source_identity(mat_path):
+        return ingest_channel(mat_path, cache_dir)
+    with profiler.stage("load_cached", channel=channel):
+        return {k: np.load(os.path.join(channel_dir, k + ".npy"), mmap_mode="r") for k in source["fields"]}
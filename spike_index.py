@@ -0,0 +1,41 @@
+"""
+Per-channel index of spikes sorted by cluster, then time.
+
+Cluster clusters[j] owns positions offsets[j]:offsets[j + 1] of the sorted arrays; times
+holds the sorted spike times and order the row of each spike in the channel's own arrays
+(cluster_class, spikes, detectionLabel, ...). The spikes of one cluster inside a time
+window are then found with one searchsorted into clusters and two into times, so
+restricting a summary or export to a window costs time proportional to the spikes inside
+it rather than to the length of the recording.
+"""
+
+import numpy as np
+
+INDEX_FIELDS = ("sorted_order", "sorted_clusters", "sorted_offsets", "sorted_times")
+
+def build_spike_index(cluster_ids, spike_times):
+    """Returns {"sorted_order", "sorted_clusters", "sorted_offsets", "sorted_times"} for one channel."""
+    cluster_ids = np.asarray(cluster_ids).astype(np.int64)
+    spike_times = np.asarray(spike_times, dtype=float)
+    order = np.lexsort((spike_times, cluster_ids))
+    clusters, starts = np.unique(cluster_ids[order], return_index=True)
+    return {"sorted_order": order, "sorted_clusters": clusters,
+            "sorted_offsets": np.append(starts, len(order)).astype(np.int64), "sorted_times": spike_times[order]}
+
+def channel_index(data):
+    """The index of a load_channel() result: the cached one if it was ingested with it, else built now."""
+    if INDEX_FIELDS[0] in data:
+        return {k: data[k] for k in INDEX_FIELDS}
+    cluster_class = np.asarray(data["cluster_class"])
+    return build_spike_index(cluster_class[:, 0], cluster_class[:, 1])
+
+def window_rows(index, cluster_id, t_start=None, t_stop=None):
+    """Rows of cluster_id's spikes with t_start <= time < t_stop (ms; None is unbounded), in time order."""
+    j = np.searchsorted(index["sorted_clusters"], cluster_id)
+    if j == len(index["sorted_clusters"]) or index["sorted_clusters"][j] != cluster_id:
+        return np.zeros(0, dtype=np.int64)
+    lo, hi = int(index["sorted_offsets"][j]), int(index["sorted_offsets"][j + 1])
+    times = index["sorted_times"][lo:hi]
+    start = lo if t_start is None else lo + int(np.searchsorted(times, t_start, side="left"))
+    stop = hi if t_stop is None else lo + int(np.searchsorted(times, t_stop, side="left"))
+    return np.asarray(index["sorted_order"][start:max(start, stop)])
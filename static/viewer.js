@@ -1,150 +1,503 @@
 document.addEventListener('DOMContentLoaded', () => {
 
-  async function loadData() {
-    const loading = document.getElementById('loading');
-    const grid = document.getElementById('grid');
+  // filename_clusterId -> card element, so pushed deltas only touch the affected card
+  const cardsByKey = new Map();
+  // filename_clusterId -> canvas for the rate/amplitude-over-time plot, drawn once parsing is done
+  const activityCanvasByKey = new Map();
+  // filename_clusterId -> ISI histogram chart, updated in place when the histograms are re-binned
+  const isiChartsByKey = new Map();
+  // filename_clusterId -> model probability span, updated when a retrained model is swapped in
+  const modelSpansByKey = new Map();
 
-    // Show loading message
-    loading.style.display = 'block';
-    grid.style.display = 'none';
+  function setExcluded(filename, clusterId, isExcluded) {
+    const card = cardsByKey.get(`${filename}_${clusterId}`);
+    if (card) {
+        card.classList.toggle('excluded', isExcluded);
+    }
+  }
+
+  function setModelProb(span, prob) {
+    // color from red (0%) to green (100%)
+    span.innerText = ` ${(prob * 100).toFixed(0)}%`;
+    span.style.color = `rgb(${Math.round(255 * (1 - prob))}, ${Math.round(255 * prob)}, 0)`;
+  }
+
+  function listenForUpdates() {
+    const events = new EventSource('/api/events');
+    events.addEventListener('parse', () => {
+        parseVersion++;
+        if (parseWaiter) {
+            parseWaiter();
+            parseWaiter = null;
+        }
+    });
+    events.addEventListener('exclusion', e => {
+        const d = JSON.parse(e.data);
+        setExcluded(d.filename, d.cluster_id, d.excluded);
+    });
+    events.addEventListener('export', e => {
+        const d = JSON.parse(e.data);
+        const status = document.getElementById('export-status');
+        if (d.status === 'running') {
+            status.textContent = 'Exporting...';
+        } else {
+            status.textContent = d.status === 'ok' ? 'Done.' : ('Error: ' + d.message);
+        }
+    });
+    events.addEventListener('channel', e => {
+        updateChannel(JSON.parse(e.data).filename);
+    });
+    events.addEventListener('model', e => {
+        const d = JSON.parse(e.data);
+        for (const u of d.units) {
+            const span = modelSpansByKey.get(`${u.filename}_${u.cluster_id}`);
+            if (span) {
+                setModelProb(span, u.model_prob);
+            }
+        }
+        document.getElementById('model-status').textContent =
+            `Model retrained on ${d.n_train + d.n_holdout} units: holdout loss ` +
+            `${d.holdout_loss_before.toFixed(3)} -> ${d.holdout_loss_after.toFixed(3)}` +
+            (d.accepted ? `, ${d.units.length} predictions updated` : ', kept the previous model');
+    });
+  }
 
-    const res = await fetch('/api/neurons');
+  // Replaces the cards of one channel after it was re-parsed in watch mode
+  async function updateChannel(filename) {
+    const res = await fetch(`/api/neurons?filename=${encodeURIComponent(filename)}`);
     const neurons = await res.json();
-    grid.innerHTML = '';
+    for (const [key, card] of cardsByKey) {
+        if (card.dataset.filename === filename) {
+            card.remove();
+            cardsByKey.delete(key);
+            isiChartsByKey.delete(key);
+            activityCanvasByKey.delete(key);
+            modelSpansByKey.delete(key);
+        }
+    }
+    const grid = document.getElementById('grid');
+    // channels are listed in filename order
+    const next = [...grid.children].find(c => c.dataset.filename > filename) || null;
+    for (const n of neurons) {
+        renderCard(grid, n, next);
+    }
+    loadActivity();
+  }
 
-    // Create cards one by one
-    for (const [idx, n] of neurons.entries()) {
-        const card = document.createElement('div');
-        card.className = 'card' + (n.excluded ? ' excluded' : '');
-        card.title = `${n.filename} | cluster ${n.cluster_id}`;
-        card.dataset.filename = n.filename;
-        card.dataset.clusterId = n.cluster_id;
-        card.onclick = async () => {
-            const res = await fetch('/api/toggle', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({ filename: n.filename, cluster_id: n.cluster_id })
-            });
-            const data = await res.json();
-            const excludedSet = new Set(data.excluded.map(e => `${e[0]}_${e[1]}`));
-
-            // Loop through all cards and update excluded class
-            document.querySelectorAll('.card').forEach(cardEl => {
-                const fname = cardEl.dataset.filename;
-                const cid = parseInt(cardEl.dataset.clusterId);
-                const key = `${fname}_${cid}`;
-                if (excludedSet.has(key)) {
-                    cardEl.classList.add('excluded');
-                } else {
-                    cardEl.classList.remove('excluded');
-                }
-            });
-        };
-
-        // Add a visible title
-        const titleEl = document.createElement('div');
-        // display model_prob if available
-        // strrep '.mat' in filename
-        let filename = n.filename.replace('.mat', '').replace('times_', '');
-        titleEl.innerText = `${filename} - c${n.cluster_id} (${n.firing_rate_hz.toFixed(1)} Hz)`;
-
-        let modelPred = '';
-        if (n.model_prob !== undefined) {
-            // get color from red (0%) to green (100%) based on model_prob
-            let color = `rgb(${Math.round(255 * (1 - n.model_prob))}, ${Math.round(255 * n.model_prob)}, 0)`;
-            const modelSpan = document.createElement('span');
-            modelSpan.innerText = ` ${(n.model_prob * 100).toFixed(0)}%`;
-            modelSpan.style.color = color;
-            titleEl.appendChild(modelSpan);
-        }
-        titleEl.style.fontSize = '12px';
-        titleEl.style.marginBottom = '4px';
-        titleEl.style.fontWeight = 'bold';
-        card.appendChild(titleEl);
-
-        const c1 = document.createElement('canvas');
-        const c2 = document.createElement('canvas');
-        card.appendChild(c1);
-        card.appendChild(c2);
-        grid.appendChild(card);
-
-        new Chart(c1, {
-            type: 'bar',
-            data: {
-            labels: n.ISI_bins.map(v => v.toFixed(2)),
-            datasets: [{ data: n.ISI_freqs, borderColor: '#36a2eb', fill: false, backgroundColor: 'black', pointRadius: 0 }]
-            },
-            options: {
-                responsive: true,
-                // maintainAspectRatio: false,
-                scales: {
-                    x: { type: 'logarithmic', title: { display: true, text: 'ISI (ms)' } },
-                    y: {
-                        display: true,
-                        title: { display: true, text: 'Proportion' },
-                        ticks: {
-                            maxTicksLimit: 3,
-                            callback: function(value, index, ticks) {
-                                return value.toFixed(2); // round to 2 decimal places
-                            }
+  function renderCard(grid, n, before = null) {
+    const card = document.createElement('div');
+    card.className = 'card' + (n.excluded ? ' excluded' : '');
+    card.title = `${n.filename} | cluster ${n.cluster_id}`;
+    card.dataset.filename = n.filename;
+    card.dataset.clusterId = n.cluster_id;
+    card.onclick = async () => {
+        const res = await fetch('/api/toggle', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ filename: n.filename, cluster_id: n.cluster_id })
+        });
+        const data = await res.json();
+        const key = `${n.filename}_${n.cluster_id}`;
+        const isExcluded = data.excluded.some(e => `${e[0]}_${e[1]}` === key);
+        setExcluded(n.filename, n.cluster_id, isExcluded);
+    };
+    cardsByKey.set(`${n.filename}_${n.cluster_id}`, card);
+
+    // Add a visible title
+    const titleEl = document.createElement('div');
+    // display model_prob if available
+    // strrep '.mat' in filename
+    let filename = n.filename.replace('.mat', '').replace('times_', '');
+    titleEl.innerText = `${filename} - c${n.cluster_id} (${n.firing_rate_hz.toFixed(1)} Hz)`;
+
+    let modelPred = '';
+    if (n.model_prob !== undefined) {
+        const modelSpan = document.createElement('span');
+        setModelProb(modelSpan, n.model_prob);
+        modelSpansByKey.set(`${n.filename}_${n.cluster_id}`, modelSpan);
+        titleEl.appendChild(modelSpan);
+    }
+    titleEl.appendChild(correlogramLink('sim', 'Highlight units with a similar waveform', () => showSimilar([n.filename, n.cluster_id])));
+    titleEl.appendChild(correlogramLink('acg', 'Show autocorrelogram', () => showCorrelogram([n.filename, n.cluster_id], null)));
+    titleEl.appendChild(correlogramLink('ccg', 'Show cross-correlogram with the unit in the correlogram panel', () => {
+        if (correlogramRequest) {
+            showCorrelogram(correlogramRequest.unit, [n.filename, n.cluster_id]);
+        }
+    }));
+    titleEl.style.fontSize = '12px';
+    titleEl.style.marginBottom = '4px';
+    titleEl.style.fontWeight = 'bold';
+    card.appendChild(titleEl);
+
+    const c1 = document.createElement('canvas');
+    const c2 = document.createElement('canvas');
+    const c3 = document.createElement('canvas');
+    card.appendChild(c1);
+    card.appendChild(c2);
+    card.appendChild(c3);
+    grid.insertBefore(card, before);
+    activityCanvasByKey.set(`${n.filename}_${n.cluster_id}`, c3);
+
+    const isiChart = new Chart(c1, {
+        type: 'bar',
+        data: {
+        labels: n.ISI_bins.map(v => v.toFixed(2)),
+        datasets: [{ data: n.ISI_freqs, borderColor: '#36a2eb', fill: false, backgroundColor: 'black', pointRadius: 0 }]
+        },
+        options: {
+            responsive: true,
+            // maintainAspectRatio: false,
+            scales: {
+                x: { type: 'logarithmic', title: { display: true, text: 'ISI (ms)' } },
+                y: {
+                    display: true,
+                    title: { display: true, text: 'Proportion' },
+                    ticks: {
+                        maxTicksLimit: 3,
+                        callback: function(value, index, ticks) {
+                            return value.toFixed(2); // round to 2 decimal places
                         }
                     }
-                },
-                plugins: { legend: { display: false } }
-            }
-        });
+                }
+            },
+            plugins: { legend: { display: false } }
+        }
+    });
 
-        const labels = [...Array(64).keys()];
-        const numQuintiles = n.waveform_quintiles.length; // should be 10
-        const medianIdx = Math.floor(numQuintiles / 2);   // index 5 (50th percentile)
+    isiChartsByKey.set(`${n.filename}_${n.cluster_id}`, isiChart);
 
-        const datasets = n.waveform_quintiles.map((quintile, idx) => {
-        let shade;
-        if (idx === medianIdx) {
-            shade = 0; // black
-        } else {
-            // distance from median determines lightness (0 = black, 200 = light gray)
-            const dist = Math.abs(idx - medianIdx);
-            const maxDist = medianIdx;
-            shade = Math.round(50 + (dist / maxDist) * 150); // 50 → 200
+    const labels = [...Array(64).keys()];
+    const numQuintiles = n.waveform_quintiles.length; // should be 10
+    const medianIdx = Math.floor(numQuintiles / 2);   // index 5 (50th percentile)
+
+    const datasets = n.waveform_quintiles.map((quintile, idx) => {
+    let shade;
+    if (idx === medianIdx) {
+        shade = 0; // black
+    } else {
+        // distance from median determines lightness (0 = black, 200 = light gray)
+        const dist = Math.abs(idx - medianIdx);
+        const maxDist = medianIdx;
+        shade = Math.round(50 + (dist / maxDist) * 150); // 50 → 200
+    }
+    const color = `rgb(${shade}, ${shade}, ${shade})`;
+    return { data: quintile, borderColor: color, fill: false, pointRadius: 0 };
+    });
+
+    new Chart(c2, {
+        type: 'line',
+        data: {
+            labels: labels,
+            datasets: datasets
+        },
+        options: {
+            responsive: true,
+            // maintainAspectRatio: false,
+            aspectRatio: 1.2,
+            scales: {
+                x: { display: false },
+                y: {
+                    display: true,
+                    title: { display: true, text: 'Potential (mV)' },
+                    ticks: {
+                    // display roughly 5 ticks automatically
+                    maxTicksLimit: 5
+                    }
+                }
+                },
+            plugins: { legend: { display: false } }
         }
-        const color = `rgb(${shade}, ${shade}, ${shade})`;
-        return { data: quintile, borderColor: color, fill: false, pointRadius: 0 };
-        });
+    });
+  }
 
-        new Chart(c2, {
+  async function loadActivity() {
+    const canvas = activityCanvasByKey.values().next().value;
+    if (!canvas) {
+        return;
+    }
+    const res = await fetch(`/api/activity?width=${Math.max(canvas.clientWidth, 50)}`);
+    if (!res.ok) {
+        return;
+    }
+    const data = await res.json();
+    const labels = [...Array(data.n_bins).keys()].map(i => `${i * data.bin_s} s`);
+    for (const u of data.units) {
+        const c = activityCanvasByKey.get(`${u.filename}_${u.cluster_id}`);
+        // cards that already have a plot keep it when new channels arrive
+        if (!c || Chart.getChart(c)) {
+            continue;
+        }
+        new Chart(c, {
             type: 'line',
             data: {
                 labels: labels,
-                datasets: datasets
+                datasets: [
+                    { data: u.rate_hz, borderColor: 'black', borderWidth: 1, pointRadius: 0, yAxisID: 'y' },
+                    { data: u.amplitude, borderColor: '#e69500', borderWidth: 1, pointRadius: 0, yAxisID: 'y1' }
+                ]
             },
             options: {
-                responsive: true,
-                // maintainAspectRatio: false,
-                aspectRatio: 1.2,
+                animation: false,
+                aspectRatio: 3,
                 scales: {
                     x: { display: false },
-                    y: {
-                        display: true,
-                        title: { display: true, text: 'Potential (mV)' },
-                        ticks: {
-                        // display roughly 5 ticks automatically
-                        maxTicksLimit: 5
-                        }
-                    }
-                    },
+                    y: { title: { display: true, text: 'Hz' }, ticks: { maxTicksLimit: 3 } },
+                    y1: { position: 'right', grid: { display: false }, title: { display: true, text: 'Amp.', color: '#e69500' }, ticks: { maxTicksLimit: 3 } }
+                },
                 plugins: { legend: { display: false } }
             }
         });
+    }
+  }
+
+  async function rebinISIs() {
+    const status = document.getElementById('isi-status');
+    const params = new URLSearchParams({
+        nbins: document.getElementById('isi-nbins').value,
+        min_ms: document.getElementById('isi-min').value,
+        max_ms: document.getElementById('isi-max').value,
+    });
+    const res = await fetch(`/api/isi?${params}`);
+    const data = await res.json();
+    if (!res.ok) {
+        status.textContent = 'Error: ' + data.message;
+        return;
+    }
+    status.textContent = '';
+    const labels = data.ISI_bins.map(v => v.toFixed(2));
+    for (const u of data.units) {
+        const chart = isiChartsByKey.get(`${u.filename}_${u.cluster_id}`);
+        if (chart) {
+            chart.data.labels = labels;
+            chart.data.datasets[0].data = u.ISI_freqs;
+            chart.update('none');
+        }
+    }
+  }
+  for (const id of ['isi-nbins', 'isi-min', 'isi-max']) {
+    document.getElementById(id).onchange = rebinISIs;
+  }
+
+  // Correlogram panel: 'acg' on a card shows that unit, 'ccg' its lags relative to the unit already shown
+  let correlogramRequest = null;
+  let correlogramChart = null;
+
+  function correlogramLink(text, title, onclick) {
+    const link = document.createElement('span');
+    link.className = 'cg-link';
+    link.innerText = text;
+    link.title = title;
+    link.onclick = e => {
+        e.stopPropagation();
+        onclick();
+    };
+    return link;
+  }
 
-        // Let browser update DOM before next iteration
-        await new Promise(r => requestAnimationFrame(r));
+  function unitLabel(unit) {
+    return `${unit[0].replace('.mat', '').replace('times_', '')} - c${unit[1]}`;
+  }
+
+  async function showCorrelogram(unit, other) {
+    correlogramRequest = { unit, other };
+    const panel = document.getElementById('correlogram-panel');
+    const title = document.getElementById('correlogram-title');
+    const params = new URLSearchParams({
+        filename: unit[0], cluster_id: unit[1],
+        window_ms: document.getElementById('cg-window').value,
+        bin_ms: document.getElementById('cg-bin').value,
+    });
+    if (other) {
+        params.set('filename2', other[0]);
+        params.set('cluster_id2', other[1]);
+    }
+    panel.style.display = 'block';
+    title.textContent = 'Loading...';
+    const res = await fetch(`/api/correlogram?${params}`);
+    const data = await res.json();
+    if (correlogramRequest.unit !== unit || correlogramRequest.other !== other) {
+        return; // a newer request was made while this one was in flight
+    }
+    if (!res.ok) {
+        title.textContent = 'Error: ' + data.message;
+        return;
     }
+    title.textContent = other ? `${unitLabel(unit)} x ${unitLabel(other)}` : `${unitLabel(unit)} autocorrelogram`;
+    const centers = data.bin_edges.slice(0, -1).map((e, i) => (e + data.bin_edges[i + 1]) / 2);
+    if (correlogramChart) {
+        correlogramChart.destroy();
+    }
+    correlogramChart = new Chart(document.getElementById('correlogram-canvas'), {
+        type: 'bar',
+        data: {
+            labels: centers.map(v => v.toFixed(1)),
+            datasets: [{ data: data.counts, backgroundColor: 'black', barPercentage: 1.0, categoryPercentage: 1.0 }]
+        },
+        options: {
+            animation: false,
+            scales: {
+                x: { title: { display: true, text: 'Lag (ms)' }, ticks: { maxTicksLimit: 11 } },
+                y: { title: { display: true, text: 'Count' }, ticks: { maxTicksLimit: 5 } }
+            },
+            plugins: { legend: { display: false } }
+        }
+    });
+  }
 
-    // Hide loading, show grid
-    loading.style.display = 'none';
+  document.getElementById('cg-close').onclick = () => {
+    document.getElementById('correlogram-panel').style.display = 'none';
+    correlogramRequest = null;
+  };
+  for (const id of ['cg-window', 'cg-bin']) {
+    document.getElementById(id).onchange = () => {
+        if (correlogramRequest) {
+            showCorrelogram(correlogramRequest.unit, correlogramRequest.other);
+        }
+    };
+  }
+
+  // Unit whose similar units are highlighted
+  let similarTo = null;
+
+  async function showSimilar(unit) {
+    similarTo = unit;
+    const status = document.getElementById('similar-status');
+    const minSimilarity = parseFloat(document.getElementById('sim-min').value);
+    const params = new URLSearchParams({ filename: unit[0], cluster_id: unit[1], k: 100 });
+    const res = await fetch(`/api/similar?${params}`);
+    const data = await res.json();
+    for (const card of cardsByKey.values()) {
+        card.classList.remove('similar');
+    }
+    if (!res.ok) {
+        status.textContent = 'Error: ' + data.message;
+        return;
+    }
+    const close = data.matches.filter(m => m.similarity >= minSimilarity);
+    for (const m of close) {
+        const card = cardsByKey.get(`${m.filename}_${m.cluster_id}`);
+        if (card) {
+            card.classList.add('similar');
+        }
+    }
+    status.textContent = `${close.length} unit(s) similar to ${unitLabel(unit)}`;
+    document.getElementById('similar-btn').disabled = close.length === 0;
+
+    params.set('scope', 'corpus');
+    const corpusRes = await fetch(`/api/similar?${params}`);
+    if (corpusRes.ok) {
+        const corpusClose = (await corpusRes.json()).matches.filter(m => m.similarity >= minSimilarity);
+        const nExcluded = corpusClose.filter(m => m.excluded).length;
+        status.textContent += `, ${corpusClose.length} in the training corpus (${nExcluded} excluded there)`;
+    }
+  }
+
+  document.getElementById('similar-btn').onclick = async () => {
+    if (!similarTo) {
+        return;
+    }
+    // the exclusion events pushed over /api/events update the cards
+    const res = await fetch('/api/similar/exclude', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({ filename: similarTo[0], cluster_id: similarTo[1], k: 100,
+                               min_similarity: parseFloat(document.getElementById('sim-min').value) })
+    });
+    const data = await res.json();
+    document.getElementById('similar-status').textContent = res.ok ? `Excluded ${data.added.length} similar unit(s)` : ('Error: ' + data.message);
+  };
+
+  function addDuplicateBadge(filename, clusterId, partnerFile, partnerId, score) {
+    const card = cardsByKey.get(`${filename}_${clusterId}`);
+    if (!card) {
+        return;
+    }
+    let badge = card.querySelector('.dup-badge');
+    if (!badge) {
+        badge = document.createElement('span');
+        badge.className = 'dup-badge';
+        badge.innerText = 'dup';
+        badge.title = 'Likely duplicate of:';
+        badge.onclick = e => e.stopPropagation();
+        card.firstChild.appendChild(badge);
+    }
+    const partner = partnerFile.replace('.mat', '').replace('times_', '');
+    badge.title += `\n${partner} - c${partnerId} (${(score * 100).toFixed(0)}% of spikes coincide)`;
+  }
+
+  async function markDuplicates() {
+    const res = await fetch('/api/duplicates');
+    if (!res.ok) {
+        return;
+    }
+    const data = await res.json();
+    for (const p of data.pairs) {
+        addDuplicateBadge(p.filename_a, p.cluster_id_a, p.filename_b, p.cluster_id_b, p.score);
+        addDuplicateBadge(p.filename_b, p.cluster_id_b, p.filename_a, p.cluster_id_a, p.score);
+    }
+    const status = document.getElementById('duplicates-status');
+    status.textContent = `${data.pairs.length} likely duplicate pair(s)`;
+    document.getElementById('duplicates-btn').disabled = data.pairs.length === 0;
+  }
+
+  // Resolved by the next 'parse' event; the timeout is only a fallback if an event is missed
+  let parseVersion = 0;
+  let parseWaiter = null;
+  function nextParseEvent(seenVersion) {
+    if (parseVersion !== seenVersion) {
+        return Promise.resolve();
+    }
+    return new Promise(resolve => {
+        parseWaiter = resolve;
+        setTimeout(resolve, 5000);
+    });
+  }
+
+  async function loadData() {
+    const loading = document.getElementById('loading');
+    const grid = document.getElementById('grid');
+
+    // Cards are shown as soon as their channel is parsed; the loading line tracks progress
+    loading.style.display = 'block';
     grid.style.display = 'grid';
+    grid.innerHTML = '';
+    cardsByKey.clear();
+    isiChartsByKey.clear();
+    activityCanvasByKey.clear();
+
+    let rendered = 0;
+    while (true) {
+        const seenVersion = parseVersion;
+        const res = await fetch(`/api/neurons/progress?start=${rendered}`);
+        const progress = await res.json();
+        if (progress.error) {
+            loading.textContent = `Error while parsing channels: ${progress.error}`;
+            return;
+        }
+        if (!progress.finished) {
+            loading.textContent = `Parsing channels... ${progress.done} / ${progress.total}`;
+        }
+
+        // Create cards one by one
+        for (const n of progress.neurons) {
+            renderCard(grid, n);
+            rendered++;
+            // Let browser update DOM before next iteration
+            await new Promise(r => requestAnimationFrame(r));
+        }
+
+        if (progress.finished) {
+            break;
+        }
+        await nextParseEvent(seenVersion);
+    }
+
+    // Hide loading
+    loading.style.display = 'none';
+    loadActivity();
+    markDuplicates();
   }
 
+  listenForUpdates();
   loadData();
 });
@@ -0,0 +1,33 @@
+import numpy as np
+from activity_store import bin_activity, choose_level, level_series, load_activity_store, save_activity_store, unit_activity
+
+def test_pyramid_levels_agree_with_direct_binning(tmp_path):
+    rng = np.random.default_rng(0)
+    # the last unit only fires during part of the recording
+    units = [np.sort(rng.uniform(0, 1_234_000, n)) for n in [500, 2000]] + [np.sort(rng.uniform(305_500, 512_300, 50))]
+    amplitudes = [rng.uniform(20, 80, len(t)) for t in units]
+    path = str(tmp_path / "neuron_data_activity.npz")
+    activity = [bin_activity(t, a) for t, a in zip(units, amplitudes)]
+    save_activity_store(path, ["a.mat", "a.mat", "b.mat"], [1, 2, 1], activity)
+    store = load_activity_store(path)
+
+    first, last = int(units[2][0] // 1000), int(units[2][-1] // 1000)
+    assert first >= 305 and activity[2][0] == first and len(activity[2][1]) == last - first + 1
+    assert choose_level(store, 2000) == 0 and choose_level(store, 200) == 1 and choose_level(store, 20) == 2
+    assert choose_level(store, 5) == 2
+    for k, bin_s in enumerate([1, 10, 100]):
+        rates, amps = level_series(store, k, [0, 1, 2])
+        assert rates.shape == (3, int(np.ceil(1234 / bin_s)))
+        for row, (t, a) in enumerate(zip(units, amplitudes)):
+            # binned directly from the start of the recording
+            bins = (t // (bin_s * 1000)).astype(int)
+            counts = np.bincount(bins, minlength=rates.shape[1])
+            amp_sums = np.bincount(bins, weights=a, minlength=rates.shape[1])
+            assert np.allclose(rates[row] * bin_s, counts)
+            with np.errstate(invalid="ignore"):
+                assert np.allclose(amps[row], amp_sums / counts, equal_nan=True, rtol=1e-5)
+        assert np.array_equal(level_series(store, k, [2, 1], n_bins=4)[0], rates[[2, 1], :4])
+
+    for i, (first, counts, amp_sums) in enumerate(activity):
+        saved = unit_activity(store, i)
+        assert saved[0] == first and np.array_equal(saved[1], counts) and np.array_equal(saved[2], amp_sums)
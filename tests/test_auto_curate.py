@@ -0,0 +1,40 @@
+import csv
+import os
+import shutil
+import numpy as np
+from auto_curate import auto_exclude_clusters, curate_sessions, find_sessions, write_exclusions, write_summary
+from benchmarks.synthetic_session import write_synthetic_session
+from session import Session
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "dataset1")
+MODEL_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "training", "model.npz")
+
+def test_batch_curation_skips_up_to_date_sessions(tmp_path):
+    shutil.copytree(DATA_DIR, tmp_path / "cohort" / "mouse1")
+    write_synthetic_session(tmp_path / "cohort" / "mouse2", n_channels=3, min_spikes=50, max_spikes=100, duration_s=60.0)
+    sessions = find_sessions([str(tmp_path / "cohort")])
+    assert [os.path.basename(s) for s in sessions] == ["mouse1", "mouse2"]
+
+    rows = curate_sessions(sessions, MODEL_FILE, workers=2)
+    assert [r["status"] for r in rows] == ["ok", "ok"]
+    for s, r in zip(sessions, rows):
+        results = os.path.join(s, "cluster_viewer_results")
+        assert os.path.exists(os.path.join(results, "spikes_auto.mat"))
+        with open(os.path.join(results, "clusters_excluded_auto.csv")) as f:
+            assert len(list(csv.reader(f))) == r["n_excluded"] <= r["n_units"]
+
+    # only the session whose source changed is curated again
+    os.remove(os.path.join(sessions[1], "times_synth_1003.mat"))
+    rows = curate_sessions(sessions, MODEL_FILE, workers=2)
+    assert [r["status"] for r in rows] == ["skipped", "ok"]
+    assert rows[1]["n_channels"] == 2
+    write_summary(rows, tmp_path / "summary.csv")
+
+def test_only_units_below_threshold_are_excluded(tmp_path):
+    session = Session(["a.mat"] * 4, [1, 2, 3, 4], np.ones(4), np.zeros(2), np.zeros((4, 2)), np.zeros((4, 5, 2)),
+                      model_prob=np.array([0.2, 0.5, 0.9, np.nan]))
+    excluded = auto_exclude_clusters(session, threshold=0.5)
+    assert excluded == {("a.mat", 1)}
+    write_exclusions(excluded, tmp_path / "excluded.csv")
+    assert (tmp_path / "excluded.csv").read_bytes() == b"a.mat,1\r\n"
+    assert os.listdir(tmp_path) == ["excluded.csv"]
@@ -0,0 +1,81 @@
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+from activity_store import activity_store_file, load_activity_store
+from channel_parser import collect_neuron_data, update_neuron_data
+from channel_watcher import ChannelWatcher, settled, snapshot
+from isi_store import isi_store_file, load_isi_store
+
+DATA_DIR = Path(__file__).parent / "data" / "dataset1"
+CHANNELS = sorted(p.name for p in DATA_DIR.glob("times_*.mat"))
+
+def test_files_are_reported_once_settled(tmp_path):
+    watcher = ChannelWatcher(str(tmp_path), settle_s=5.0)
+    path = tmp_path / "times_a.mat"
+    path.write_bytes(b"x")
+    assert watcher.poll(now=0) == ([], [])
+    path.write_bytes(b"xx")  # still being written
+    assert watcher.poll(now=6) == ([], [])
+    assert watcher.poll(now=10) == ([], [])
+    assert watcher.poll(now=11) == ([str(path)], [])
+    assert watcher.poll(now=20) == ([], [])
+
+    os.remove(path)
+    assert watcher.poll(now=21) == ([], [str(path)])
+
+def test_known_files_are_not_reported(tmp_path):
+    (tmp_path / "times_a.mat").write_bytes(b"x")
+    watcher = ChannelWatcher(str(tmp_path), settle_s=0, known=snapshot(str(tmp_path)))
+    watcher.poll(now=0)
+    assert watcher.poll(now=1) == ([], [])
+
+def test_recently_modified_files_are_not_settled(tmp_path):
+    (tmp_path / "times_a.mat").write_bytes(b"x")
+    files = snapshot(str(tmp_path))
+    mtime_s = files[str(tmp_path / "times_a.mat")][1] / 1e9
+    assert settled(files, 5.0, now=mtime_s + 1) == {}
+    assert settled(files, 5.0, now=mtime_s + 6) == files
+
+def test_updating_channels_matches_full_parse(tmp_path):
+    full = str(tmp_path / "full.json")
+    collect_neuron_data(DATA_DIR, full, verbose=False)
+    partial_dir = tmp_path / "partial"
+    partial_dir.mkdir()
+    for name in CHANNELS[1:]:
+        shutil.copy(DATA_DIR / name, partial_dir)
+    outfile = str(tmp_path / "neuron_data.json")
+    collect_neuron_data(partial_dir, outfile, verbose=False)
+
+    # a channel that sorts first arrives late, and another one is rewritten
+    shutil.copy(DATA_DIR / CHANNELS[0], partial_dir)
+    update_neuron_data(outfile, str(partial_dir / CHANNELS[0]))
+    neurons, channel = update_neuron_data(outfile, str(partial_dir / CHANNELS[1]))
+    with open(full) as f1, open(outfile) as f2:
+        assert f1.read() == f2.read()
+    assert [n["filename"] for n in channel] == [CHANNELS[1]] * len(channel)
+    for load, store_file in [(load_isi_store, isi_store_file), (load_activity_store, activity_store_file)]:
+        expected, actual = load(store_file(full)), load(store_file(outfile))
+        assert expected.keys() == actual.keys()
+        assert all(np.array_equal(expected[k], actual[k]) for k in expected)
+
+    os.remove(partial_dir / CHANNELS[1])
+    neurons, channel = update_neuron_data(outfile, str(partial_dir / CHANNELS[1]))
+    assert channel == [] and CHANNELS[1] not in {n["filename"] for n in neurons}
+    assert len(load_isi_store(isi_store_file(outfile))["cluster_ids"]) == len(neurons)
+
+def test_unreadable_channel_fails_the_cli_unless_skipped(tmp_path):
+    import subprocess
+    import sys
+    for name in CHANNELS:
+        shutil.copy(DATA_DIR / name, tmp_path)
+    bad = tmp_path / "times_zzbad.mat"
+    bad.write_bytes((DATA_DIR / CHANNELS[0]).read_bytes()[:200])
+    outfile = tmp_path / "neuron_data.json"
+
+    script = Path(__file__).parent.parent / "channel_parser.py"
+    result = subprocess.run([sys.executable, str(script), str(tmp_path), "--outfile", str(outfile)], capture_output=True, text=True)
+    assert result.returncode != 0 and not outfile.exists()
+
+    assert collect_neuron_data(tmp_path, str(outfile), verbose=False, skip_errors=True) == [str(bad)]
+    assert outfile.exists()
@@ -0,0 +1,274 @@
+import json
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import cluster_viewer
+from cluster_viewer import app, start_background_parse, subscribe_events, unsubscribe_events
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "EXCLUDE_FILE", str(tmp_path / "clusters_excluded.csv"))
+    monkeypatch.setitem(app.config, "CURATED_FILE", str(tmp_path / "clusters_curated.csv"))
+    return app.test_client()
+
+def test_toggle_publishes_exclusion_delta(client):
+    q = subscribe_events()
+    try:
+        client.post("/api/toggle", json={"filename": "times_a_1.mat", "cluster_id": 2})
+        client.post("/api/toggle", json={"filename": "times_a_1.mat", "cluster_id": 2})
+        messages = [q.get(timeout=1), q.get(timeout=1)]
+    finally:
+        unsubscribe_events(q)
+
+    events = []
+    for m in messages:
+        lines = m.strip().split("\n")
+        assert lines[0] == "event: exclusion"
+        events.append(json.loads(lines[1][len("data: "):]))
+    assert events == [
+        {"filename": "times_a_1.mat", "cluster_id": 2, "excluded": True},
+        {"filename": "times_a_1.mat", "cluster_id": 2, "excluded": False},
+    ]
+
+def test_background_parse_streams_progress(client, tmp_path, monkeypatch):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    monkeypatch.setitem(app.config, "DATA_FILE", str(tmp_path / "neuron_data.json"))
+    monkeypatch.setitem(app.config, "MODEL_FILE", None)
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+
+    start_background_parse(str(data_dir), pattern="times_*.mat", nbins=50).join(timeout=60)
+    progress = client.get("/api/neurons/progress?start=2").get_json()
+
+    with open(data_dir / "expected_summary.json") as f:
+        expected = json.load(f)
+    assert progress["finished"] and progress["done"] == progress["total"] == 3
+    assert [(n["filename"], n["cluster_id"]) for n in progress["neurons"]] == [(n["filename"], n["cluster_id"]) for n in expected[2:]]
+
+def test_metrics_report_request_latency_and_prediction_cache(client, tmp_path, monkeypatch):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    monkeypatch.setitem(app.config, "DATA_FILE", str(data_dir / "expected_summary.json"))
+    monkeypatch.setitem(app.config, "MODEL_FILE", str(Path(__file__).parent.parent / "training" / "model.npz"))
+    # keep the prediction cache out of the test data directory
+    monkeypatch.setattr(cluster_viewer, "_prediction_cache_file", lambda: str(tmp_path / "model_predictions.json"))
+
+    client.get("/api/neurons")
+    client.get("/api/neurons")
+    snapshot = client.get("/api/metrics").get_json()
+
+    assert snapshot["timings"]["request GET /api/neurons"]["count"] >= 2
+    assert snapshot["counters"]["prediction_cache_hits"] >= 5
+    assert snapshot["timings"]["inference"]["count"] >= 1
+
+def test_duplicates_are_reported_and_excluded(client, tmp_path, monkeypatch):
+    data_dir = tmp_path / "session"
+    shutil.copytree(Path(__file__).parent / "data" / "dataset1", data_dir)
+    # the same units seen again on another channel
+    shutil.copy(data_dir / "times_mLT2aHa05_2289.mat", data_dir / "times_zcopy_9999.mat")
+    monkeypatch.setitem(app.config, "EXPORT_ARGS", SimpleNamespace(directory=str(data_dir), pattern="times_*.mat", keep_duplicates=False))
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+
+    pairs = client.get("/api/duplicates").get_json()["pairs"]
+    assert pairs and all(p["score"] == 1.0 for p in pairs)
+    assert {(p["filename_a"], p["filename_b"]) for p in pairs} == {("times_mLT2aHa05_2289.mat", "times_zcopy_9999.mat")}
+
+    q = subscribe_events()
+    try:
+        added = client.post("/api/duplicates/exclude", json={}).get_json()["added"]
+        events = [q.get(timeout=1) for _ in added]
+    finally:
+        unsubscribe_events(q)
+    assert sorted(added) == sorted([p["filename_b"], p["cluster_id_b"]] for p in pairs)
+    assert all(e.startswith("event: exclusion") for e in events)
+
+def test_correlogram_endpoint_is_cached(client, monkeypatch):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    monkeypatch.setitem(app.config, "EXPORT_ARGS", SimpleNamespace(directory=str(data_dir), pattern="times_*.mat", keep_duplicates=False))
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+    cluster_viewer._cached_correlogram.cache_clear()
+
+    query = "/api/correlogram?filename=times_mLT2aHa05_2289.mat&cluster_id=1&window_ms=20&bin_ms=2"
+    acg = client.get(query).get_json()
+    assert len(acg["counts"]) == 20 and len(acg["bin_edges"]) == 21
+    assert acg["counts"] == acg["counts"][::-1] and sum(acg["counts"]) > 0
+    client.get(query)
+    assert cluster_viewer._cached_correlogram.cache_info().hits == 1
+
+    ccg = client.get(query + "&filename2=times_mRT2aHa01_2317.mat&cluster_id2=1").get_json()
+    assert ccg["n_spikes"] == acg["n_spikes"] and ccg["n_spikes2"] > 0
+    assert client.get(query.replace("cluster_id=1", "cluster_id=99")).status_code == 404
+    assert client.get(query.replace("bin_ms=2", "bin_ms=3")).status_code == 400
+
+    # a reload between reading the trains' key and computing gives no (cached) mix of versions
+    with cluster_viewer._spike_lock:
+        trains_key = cluster_viewer._spike_trains["key"]
+    with pytest.raises(cluster_viewer.StaleSpikeTrains):
+        cluster_viewer._cached_correlogram(trains_key[:-1] + ((),), ("times_mLT2aHa05_2289.mat", 1), None, 20.0, 2.0)
+
+def test_isi_endpoint_rebins_session_and_single_unit(client, tmp_path, monkeypatch):
+    from channel_parser import collect_neuron_data
+    data_file = str(tmp_path / "neuron_data.json")
+    collect_neuron_data(Path(__file__).parent / "data" / "dataset1", data_file, verbose=False)
+    monkeypatch.setitem(app.config, "DATA_FILE", data_file)
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+
+    session = client.get("/api/isi?nbins=20&min_ms=2&max_ms=5000").get_json()
+    assert len(session["ISI_bins"]) == 19 and len(session["units"]) == 5
+    unit = client.get("/api/isi?nbins=20&min_ms=2&max_ms=5000&filename=times_mRT2aHa02_2318.mat&cluster_id=2").get_json()
+    assert unit["units"] == [u for u in session["units"] if (u["filename"], u["cluster_id"]) == ("times_mRT2aHa02_2318.mat", 2)]
+    assert client.get("/api/isi?nbins=1").status_code == 400
+
+def test_activity_endpoint_picks_level_by_width(client, tmp_path, monkeypatch):
+    from channel_parser import collect_neuron_data
+    data_file = str(tmp_path / "neuron_data.json")
+    collect_neuron_data(Path(__file__).parent / "data" / "dataset1", data_file, verbose=False)
+    monkeypatch.setitem(app.config, "DATA_FILE", data_file)
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+
+    fine = client.get("/api/activity?width=5000").get_json()
+    coarse = client.get("/api/activity?width=100").get_json()
+    assert fine["bin_s"] == 1 and coarse["bin_s"] == 10 and coarse["n_bins"] <= 100
+    assert len(coarse["units"]) == 5 and all(len(u["rate_hz"]) == coarse["n_bins"] for u in coarse["units"])
+    # total spikes are the same at every resolution
+    for f, c in zip(fine["units"], coarse["units"]):
+        assert np.isclose(sum(f["rate_hz"]), sum(c["rate_hz"]) * 10)
+    one = client.get("/api/activity?width=100&filename=times_mRT2aHa02_2318.mat&cluster_id=3").get_json()
+    assert one["units"] == [u for u in coarse["units"] if (u["filename"], u["cluster_id"]) == ("times_mRT2aHa02_2318.mat", 3)]
+
+def _separable_session(path, n_units=40):
+    """A session whose even units have a spike trough and odd units are flat noise, so the labels are learnable."""
+    rng = np.random.default_rng(0)
+    neurons = []
+    for i in range(n_units):
+        median = rng.normal(scale=5, size=64)
+        if i % 2 == 0:
+            median[18:23] -= 80
+        neurons.append({"cluster_id": 1, "filename": f"times_ch{i:02d}_1.mat", "firing_rate_hz": 1.0, "ISI_bins": [1.0, 2.0],
+                        "ISI_freqs": [0.5, 0.5], "waveform_quintiles": np.tile(median, (9, 1)).tolist()})
+    with open(path, "w") as f:
+        json.dump(neurons, f)
+
+def test_retrain_swaps_model_and_publishes_predictions(client, tmp_path, monkeypatch):
+    from training.inference import save_numpy_model
+    from training.online import holdout_mask
+    _separable_session(tmp_path / "neuron_data.json")
+    rng = np.random.default_rng(1)
+    # restarted with a model an earlier run retrained, which must survive this run
+    model_file = str(tmp_path / "model_retrained_1.npz")
+    save_numpy_model(model_file, [(rng.normal(scale=0.1, size=(8, 64)), np.zeros(8)), (rng.normal(scale=0.1, size=(1, 8)), np.zeros(1))],
+                     np.zeros(64), np.full(64, 50.0), False)
+    monkeypatch.setitem(app.config, "DATA_FILE", str(tmp_path / "neuron_data.json"))
+    monkeypatch.setitem(app.config, "MODEL_FILE", model_file)
+    monkeypatch.setitem(app.config, "RETRAIN_MIN_LABELS", 3)
+    monkeypatch.setattr(cluster_viewer, "_prediction_cache_file", lambda: str(tmp_path / "model_predictions.json"))
+    monkeypatch.setattr(cluster_viewer, "_retrain_state", {"curated": frozenset(), "written": [], "kept_probs": None})
+    model_bytes = Path(model_file).read_bytes()
+    keys = cluster_viewer.load_neurons().keys()
+
+    assert cluster_viewer.retrain_now() is None  # nothing curated yet
+    # exclude the noise units and keep the others (toggled twice) among the first 30
+    for i, (filename, cluster_id) in enumerate(keys[:30]):
+        for _ in range(1 if i % 2 else 2):
+            client.post("/api/toggle", json={"filename": filename, "cluster_id": cluster_id})
+    before = {(u["filename"], u["cluster_id"]): u["model_prob"] for u in client.get("/api/neurons").get_json()}
+    q = subscribe_events()
+    try:
+        result = cluster_viewer.retrain_now()
+        event = q.get(timeout=1).strip().split("\n")
+    finally:
+        unsubscribe_events(q)
+
+    assert event[0] == "event: model"
+    data = json.loads(event[1][len("data: "):])
+    assert result["accepted"] and result["holdout_loss_after"] < result["holdout_loss_before"]
+    assert result["n_holdout"] == holdout_mask(keys[:30], 0.2).sum() > 0 and result["n_train"] + result["n_holdout"] == 30
+    assert app.config["MODEL_FILE"] == str(tmp_path / "model_retrained_2.npz")
+    assert Path(model_file).read_bytes() == model_bytes
+    assert [(u["filename"], u["cluster_id"]) for u in data["units"]] == keys[30:]
+    # only the uncurated units are re-scored by the new model
+    after = {(u["filename"], u["cluster_id"]): u["model_prob"] for u in client.get("/api/neurons").get_json()}
+    assert all(after[k] == before[k] for k in keys[:30])
+    assert [after[k] for k in keys[30:]] == pytest.approx([u["model_prob"] for u in data["units"]])
+    assert any(after[k] != before[k] for k in keys[30:])
+    # the same labels are not fitted twice
+    assert cluster_viewer.retrain_now() is None
+
+def test_channel_update_replaces_session_and_notifies(client, tmp_path, monkeypatch):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    channels = sorted(p.name for p in data_dir.glob("times_*.mat"))
+    monkeypatch.setitem(app.config, "DATA_FILE", str(tmp_path / "neuron_data.json"))
+    monkeypatch.setitem(app.config, "MODEL_FILE", None)
+    q = subscribe_events()
+    try:
+        cluster_viewer.update_channel(str(data_dir / channels[1]))
+        cluster_viewer.update_channel(str(data_dir / channels[0]))
+        events = [q.get(timeout=1), q.get(timeout=1)]
+    finally:
+        unsubscribe_events(q)
+
+    assert all(e.startswith("event: channel") for e in events)
+    assert sorted(set(cluster_viewer.load_neurons().filenames.tolist())) == channels[:2]
+    units = client.get(f"/api/neurons?filename={channels[1]}").get_json()
+    assert units and {u["filename"] for u in units} == {channels[1]}
+    assert client.get("/api/neurons?filename=times_none.mat").get_json() == []
+
+def test_similar_units_in_session_and_corpus(client, tmp_path, monkeypatch):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    shutil.copy(data_dir / "expected_summary.json", tmp_path / "neuron_data.json")
+    monkeypatch.setitem(app.config, "DATA_FILE", str(tmp_path / "neuron_data.json"))
+    session = cluster_viewer.load_neurons()
+    features = session.features()
+    np.savez(tmp_path / "feature_store.npz", X=features, y=np.array([0, 1, 1, 1, 1])[:len(session)],
+             filenames=session.filenames, cluster_ids=session.cluster_ids, sessions=np.full(len(session), "s1"))
+    monkeypatch.setitem(app.config, "CORPUS_FILE", str(tmp_path / "feature_store.npz"))
+    filename, cluster_id = session.keys()[0]
+
+    data = client.get(f"/api/similar?filename={filename}&cluster_id={cluster_id}&k=100").get_json()
+    assert len(data["matches"]) == len(session) - 1
+    assert (filename, cluster_id) not in {(m["filename"], m["cluster_id"]) for m in data["matches"]}
+    assert (tmp_path / "neuron_data_similarity.npz").exists()
+    corpus = client.get(f"/api/similar?filename={filename}&cluster_id={cluster_id}&k=1&scope=corpus").get_json()["matches"]
+    assert corpus == [{"session": "s1", "filename": filename, "cluster_id": cluster_id, "similarity": 1.0, "excluded": True}]
+    assert client.get("/api/similar?filename=times_none.mat&cluster_id=1").status_code == 404
+
+    res = client.post("/api/similar/exclude", json={"filename": filename, "cluster_id": cluster_id, "min_similarity": -1}).get_json()
+    assert sorted(map(tuple, res["added"])) == sorted(session.keys()[1:])
+    assert cluster_viewer.load_curated() >= set(session.keys()[1:])
+    for bad in ({"filename": filename}, {"filename": filename, "cluster_id": cluster_id, "k": 0},
+                {"filename": filename, "cluster_id": cluster_id, "min_similarity": 2}):
+        assert client.post("/api/similar/exclude", json=bad).status_code == 400
+
+def test_truncated_channel_at_startup_is_skipped_and_retried(client, tmp_path, monkeypatch):
+    from channel_watcher import ChannelWatcher, snapshot
+    data_dir = tmp_path / "session"
+    shutil.copytree(Path(__file__).parent / "data" / "dataset1", data_dir)
+    source = data_dir / "times_mLT2aHa05_2289.mat"
+    # wave_clus is still writing this channel when the viewer starts
+    late = data_dir / "times_zlate_9999.mat"
+    late.write_bytes(source.read_bytes()[:200])
+    monkeypatch.setitem(app.config, "DATA_FILE", str(tmp_path / "neuron_data.json"))
+    monkeypatch.setitem(app.config, "MODEL_FILE", None)
+    monkeypatch.setitem(app.config, "PARSE_STATUS", None)
+
+    known = snapshot(str(data_dir))
+    start_background_parse(str(data_dir), known=known).join(timeout=60)
+    assert app.config["PARSE_STATUS"]["error"] is None
+    units = client.get("/api/neurons").get_json()
+    assert len(units) == 5 and str(late) not in known
+
+    shutil.copy(source, late)
+    watcher = ChannelWatcher(str(data_dir), settle_s=0, known=known)
+    watcher.poll(now=0)
+    changed, removed = watcher.poll(now=1)
+    assert changed == [str(late)] and removed == []
+    cluster_viewer.update_channel(changed[0])
+    filenames = [u["filename"] for u in client.get("/api/neurons").get_json()]
+    assert filenames[:5] == [u["filename"] for u in units] and filenames.count(late.name) == filenames.count(source.name)
+
+def test_retrained_models_are_numbered_after_existing_ones(tmp_path):
+    (tmp_path / "model_retrained_3.npz").write_bytes(b"earlier run")
+    first = cluster_viewer._reserve_retrained_model(str(tmp_path), ".npz")
+    second = cluster_viewer._reserve_retrained_model(str(tmp_path), ".npz")
+    assert (first, second) == (str(tmp_path / "model_retrained_4.npz"), str(tmp_path / "model_retrained_5.npz"))
+    assert (tmp_path / "model_retrained_3.npz").read_bytes() == b"earlier run"
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from correlograms import correlogram
+
+def test_correlogram_matches_all_pairs_histogram():
+    rng = np.random.default_rng(0)
+    a = np.sort(rng.uniform(0, 20_000, 400))
+    b = np.sort(rng.uniform(0, 20_000, 300))
+
+    edges, counts = correlogram(a, b, window_ms=25.0, bin_ms=0.5)
+    lags = (b[None, :] - a[:, None]).ravel()
+    assert np.allclose(edges, np.linspace(-25, 25, 101))
+    assert (counts == np.histogram(lags, bins=100, range=(-25, 25))[0]).all()
+
+    _, counts = correlogram(a, window_ms=25.0, bin_ms=0.5)
+    lags = (a[None, :] - a[:, None])[~np.eye(len(a), dtype=bool)]
+    assert counts.sum() == np.count_nonzero(np.abs(lags) <= 25)
+    assert (counts[50:] == np.histogram(lags, bins=100, range=(-25, 25))[0][50:]).all()
+    assert (counts == counts[::-1]).all()
+
+def test_bins_must_divide_the_window():
+    assert correlogram([0.0, 1.0], window_ms=0.3, bin_ms=0.1)[1].shape == (6,)
+    with pytest.raises(ValueError):
+        correlogram([0.0, 1.0], window_ms=50.0, bin_ms=3.0)
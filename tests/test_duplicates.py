@@ -0,0 +1,27 @@
+import numpy as np
+from duplicates import count_coincidences, find_duplicate_units
+
+def test_finds_jittered_copy_on_another_channel():
+    rng = np.random.default_rng(0)
+    trains = [np.sort(rng.uniform(0, 600_000, n)) for n in [3000, 2000, 2500, 1500]]
+    # unit 4 is 80% of unit 1's spikes seen on another channel with a little jitter
+    kept = trains[1][rng.random(len(trains[1])) < 0.8]
+    trains.append(np.sort(kept + rng.uniform(-0.2, 0.2, len(kept))))
+    # unit 5 is a copy of unit 0 on the same channel, ignored unless asked for
+    trains.append(trains[0].copy())
+    channels = ["ch1", "ch1", "ch2", "ch3", "ch4", "ch1"]
+
+    pairs = find_duplicate_units(trains, channels, window_ms=0.5)
+    assert [(p["a"], p["b"]) for p in pairs] == [(1, 4)]
+    assert pairs[0]["coincidences"] == len(kept) and pairs[0]["score"] == 1.0
+    assert pairs[0]["expected"] < 0.01
+
+    pairs = find_duplicate_units(trains, channels, window_ms=0.5, cross_channel_only=False)
+    assert [(p["a"], p["b"]) for p in pairs] == [(0, 5), (1, 4)]
+
+def test_count_coincidences_matches_brute_force():
+    rng = np.random.default_rng(1)
+    a = np.sort(rng.uniform(0, 1000, 300))
+    b = np.sort(rng.uniform(0, 1000, 200))
+    expected = sum(np.any(np.abs(b - t) <= 2.0) for t in a)
+    assert count_coincidences(a, b, 2.0) == expected
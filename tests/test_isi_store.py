@@ -0,0 +1,26 @@
+import json
+from pathlib import Path
+import numpy as np
+from channel_parser import collect_neuron_data
+from isi_store import isi_store_file, load_isi_store, log_bins, rebin
+
+def test_rebinning_stored_isis_reproduces_parse_time_histograms(tmp_path):
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    outfile = str(tmp_path / "neuron_data.json")
+    collect_neuron_data(data_dir, outfile, nbins=50, verbose=False)
+    with open(outfile) as f:
+        neurons = json.load(f)
+
+    store = load_isi_store(isi_store_file(outfile))
+    assert store["isis"].dtype == np.float32
+    assert [(str(f), int(c)) for f, c in zip(store["filenames"], store["cluster_ids"])] == [(n["filename"], n["cluster_id"]) for n in neurons]
+
+    density = rebin(store["isis"], store["offsets"], log_bins(50))
+    assert np.allclose(density, [n["ISI_freqs"] for n in neurons], rtol=1e-6)
+
+    # any other resolution matches np.histogram on the stored intervals
+    edges = log_bins(17, 0.5, 2000.0)
+    density = rebin(store["isis"], store["offsets"], edges)
+    for i, d in enumerate(density):
+        isis = store["isis"][store["offsets"][i]:store["offsets"][i + 1]]
+        assert np.allclose(d, np.nan_to_num(np.histogram(isis, bins=edges, density=True)[0]))
@@ -0,0 +1,27 @@
+import json
+from pathlib import Path
+import numpy as np
+from auto_curate import auto_exclude_clusters
+from session import Session
+from training.data_loader import get_neuron_features
+
+DATA_FILE = Path(__file__).parent / "data" / "dataset1" / "expected_summary.json"
+
+def test_session_round_trips_the_json_shape():
+    with open(DATA_FILE) as f:
+        neurons = json.load(f)
+    session = Session.from_json(DATA_FILE)
+    assert session.waveform_quintiles.shape == (5, 9, 64) and session.isi_bins.ndim == 1
+    assert np.array_equal(session.features(), get_neuron_features(neurons))
+    assert session.to_records() == [{**n, "excluded": False} for n in neurons]
+
+    # slices share the arrays but are annotated independently
+    tail = session[2:]
+    tail.set_excluded({("times_mRT2aHa02_2318.mat", 2)})
+    tail.model_prob = np.array([0.9, 0.2, np.nan])
+    assert np.shares_memory(tail.waveform_quintiles, session.waveform_quintiles)
+    assert not session.excluded.any() and session.model_prob is None
+    unit = tail[1]
+    assert (unit.filename, unit.cluster_id, unit.excluded, unit.model_prob) == ("times_mRT2aHa02_2318.mat", 2, True, 0.2)
+    assert tail.to_records()[0]["model_feature"] == neurons[2]["waveform_quintiles"][4]
+    assert auto_exclude_clusters(tail) == {("times_mRT2aHa02_2318.mat", 2)}
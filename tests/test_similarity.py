@@ -0,0 +1,23 @@
+import numpy as np
+from similarity import build_index, find_similar, load_similarity_index, save_similarity_index
+
+def test_find_similar_ranks_by_shape_correlation(tmp_path):
+    rng = np.random.default_rng(0)
+    waveforms = rng.normal(size=(500, 64))
+    waveforms[7] = 3 * waveforms[3] + 1  # same shape, other amplitude and offset
+    index = build_index([f"times_{i}.mat" for i in range(500)], np.arange(500), waveforms, rng.random((500, 50)))
+
+    rows, sims = find_similar(index, index["waveform"][3], k=5, skip=3)
+    expected = np.corrcoef(waveforms)[3]
+    expected[3] = -np.inf
+    assert rows[0] == 7 and np.isclose(sims[0], 1, atol=1e-5)
+    assert list(rows) == list(np.argsort(-expected)[:5])
+    assert np.allclose(sims, expected[rows], atol=1e-5)
+
+    rows_isi, sims_isi = find_similar(index, index["waveform"][3], index["isi"][3], k=499, skip=3)
+    assert 3 not in rows_isi and np.all(np.diff(sims_isi) <= 0)
+
+    save_similarity_index(str(tmp_path / "index.npz"), index, (10, 20))
+    loaded, source = load_similarity_index(str(tmp_path / "index.npz"))
+    assert source == (10, 20)
+    assert all(np.array_equal(index[k], loaded[k]) for k in index)
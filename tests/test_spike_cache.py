@@ -0,0 +1,51 @@
+import os
+import shutil
+import numpy as np
+from channel_parser import load_spike_data
+from make_spikes_matrix import make_spikes_matrix
+from spike_cache import load_channel
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "dataset1")
+
+def test_ingest_cache_matches_mat_files(tmp_path):
+    directory = tmp_path / "session"
+    shutil.copytree(DATA_DIR, directory)
+    cache_dir = str(tmp_path / "cache")
+    mat_path = str(sorted(directory.glob("times_*.mat"))[0])
+
+    expected = load_channel(mat_path)
+    ingested = load_channel(mat_path, cache_dir)
+    cached = load_channel(mat_path, cache_dir)
+    assert isinstance(cached["spikes"], np.memmap)
+    assert not isinstance(ingested["spikes"], np.memmap)
+    for k, v in expected.items():
+        assert np.array_equal(cached[k], v) and cached[k].shape == np.shape(v)
+
+    for a, b in zip(load_spike_data(mat_path), load_spike_data(mat_path, cache_dir=cache_dir)):
+        assert a["cluster_id"] == b["cluster_id"]
+        assert np.array_equal(a["ISI_freqs"], b["ISI_freqs"])
+        assert np.array_equal(a["waveform_quintiles"], b["waveform_quintiles"])
+
+    plain = make_spikes_matrix(str(directory), ignoreDuplicates=True)
+    via_cache = make_spikes_matrix(str(directory), ignoreDuplicates=True, cacheDir=cache_dir)
+    assert (plain["spikes"] != via_cache["spikes"]).nnz == 0
+    assert np.array_equal(plain["waveform"], via_cache["waveform"])
+
+    # a rewritten source file is re-ingested rather than served stale
+    st = os.stat(mat_path)
+    os.utime(mat_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not isinstance(load_channel(mat_path, cache_dir)["spikes"], np.memmap)
+
+def test_concurrent_ingests_do_not_share_temporary_files(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from spike_cache import ingest_channel
+    cache_dir = str(tmp_path / "cache")
+    mat_path = os.path.join(DATA_DIR, sorted(f for f in os.listdir(DATA_DIR) if f.startswith("times_"))[0])
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: ingest_channel(mat_path, cache_dir), range(8)))
+    channel_dir = os.path.join(cache_dir, os.path.splitext(os.path.basename(mat_path))[0])
+    assert not [f for f in os.listdir(channel_dir) if f.endswith(".tmp")]
+    cached = load_channel(mat_path, cache_dir)
+    for k, v in load_channel(mat_path).items():
+        assert np.array_equal(cached[k], v)
@@ -0,0 +1,56 @@
+from pathlib import Path
+import numpy as np
+import scipy.io as sio
+from channel_parser import load_spike_data, load_spike_times
+from make_spikes_matrix import make_spikes_matrix
+from spike_index import build_spike_index, window_rows
+
+DATA_DIR = Path(__file__).parent / "data" / "dataset1"
+T_START, T_STOP = 100000.0, 300000.0
+
+def test_window_rows_match_mask():
+    rng = np.random.default_rng(0)
+    cluster_ids = rng.integers(0, 5, 10000)
+    spike_times = rng.random(10000) * 1000
+    index = build_spike_index(cluster_ids, spike_times)
+    for cid in range(6):
+        for t_start, t_stop in [(None, None), (250.0, 750.0), (None, 10.0), (900.0, 100.0)]:
+            mask = cluster_ids == cid
+            if t_start is not None:
+                mask &= spike_times >= t_start
+            if t_stop is not None:
+                mask &= spike_times < t_stop
+            rows = window_rows(index, cid, t_start, t_stop)
+            assert np.array_equal(np.sort(rows), np.flatnonzero(mask))
+            assert np.all(np.diff(spike_times[rows]) >= 0)
+
+def crop_directory(tmp_path):
+    """Copies dataset1 with only the spikes inside the window, as cropping the recording externally would."""
+    for fpath in sorted(DATA_DIR.glob("times_*.mat")):
+        data = sio.loadmat(fpath, squeeze_me=True)
+        t = data["cluster_class"][:, 1]
+        keep = (t >= T_START) & (t < T_STOP)
+        sio.savemat(tmp_path / fpath.name, {k: data[k][keep] for k in ["spikes", "forced", "cluster_class", "detectionLabel"]})
+    return tmp_path
+
+def test_windowed_summaries_and_export_match_cropped_files(tmp_path):
+    cropped = crop_directory(tmp_path)
+    for fpath in sorted(DATA_DIR.glob("times_*.mat")):
+        windowed = load_spike_data(str(fpath), t_start=T_START, t_stop=T_STOP)
+        # the second read uses the index saved in the ingest cache
+        load_spike_data(str(fpath), cache_dir=str(tmp_path / "cache"))
+        cached = load_spike_data(str(fpath), cache_dir=str(tmp_path / "cache"), t_start=T_START, t_stop=T_STOP)
+        expected = load_spike_data(str(cropped / fpath.name))
+        assert [n["cluster_id"] for n in windowed] == [n["cluster_id"] for n in cached] == [n["cluster_id"] for n in expected]
+        for a, b in zip(windowed + cached, expected + expected):
+            assert np.array_equal(a["ISI_freqs"], b["ISI_freqs"])
+            assert np.array_equal(a["waveform_quintiles"], b["waveform_quintiles"])
+            assert a["firing_rate_hz"] == b["firing_rate_hz"]
+        times = load_spike_times(str(fpath), t_start=T_START, t_stop=T_STOP)
+        assert all(t.min() >= T_START and t.max() < T_STOP for t in times.values())
+
+    windowed = make_spikes_matrix(str(DATA_DIR), ignoreForced=True, tStart=T_START, tStop=T_STOP)
+    expected = make_spikes_matrix(str(cropped), ignoreForced=True)
+    assert (windowed["spikes"] != expected["spikes"]).nnz == 0
+    assert np.array_equal(windowed["waveform"], expected["waveform"], equal_nan=True)
+    assert windowed["params"]["tStart"] == T_START
@@ -0,0 +1,22 @@
+from scipy.io import loadmat
+from benchmarks.synthetic_session import write_synthetic_session
+from channel_parser import load_spike_data
+from make_spikes_matrix import make_spikes_matrix
+
+def test_synthetic_session_matches_wave_clus_layout(tmp_path):
+    params = dict(n_channels=3, max_clusters=2, min_spikes=50, max_spikes=100, duration_s=60.0, seed=3)
+    paths = write_synthetic_session(tmp_path, **params)
+    again = write_synthetic_session(tmp_path / "again", **params)
+    assert (loadmat(paths[-1])["cluster_class"] == loadmat(again[-1])["cluster_class"]).all()
+
+    for path in paths:
+        mat = loadmat(path, squeeze_me=True)
+        n = mat["cluster_class"].shape[0]
+        assert mat["spikes"].shape == (n, 64)
+        assert mat["detectionLabel"].shape == mat["forced"].shape == (n,)
+        assert (mat["cluster_class"][:, 1] < 60_000).all()
+        kept_clusters = set(mat["cluster_class"][mat["detectionLabel"] == 1, 0].astype(int)) - {0}
+        assert [n["cluster_id"] for n in load_spike_data(path)] == sorted(kept_clusters)
+
+    result = make_spikes_matrix(str(tmp_path), ignoreDuplicates=True, ignoreForced=True)
+    assert result["spikes"].shape[0] == len(result["cluster_ids"])
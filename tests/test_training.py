@@ -0,0 +1,166 @@
+import csv
+import json
+from pathlib import Path
+import numpy as np
+import pytest
+from training.data_loader import get_neuron_feature, get_neuron_features
+
+MODEL_FILE = Path(__file__).parent.parent / "training" / "model.pt"
+
+def load_test_neurons():
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    with open(data_dir / "expected_summary.json") as f:
+        return json.load(f)
+
+def test_batch_predictor_matches_single_unit_predictor():
+    pytest.importorskip("torch")
+    from training.train import load_model_batch_predictor, load_model_predictor
+    neurons = load_test_neurons()
+
+    batch_logits = load_model_batch_predictor(MODEL_FILE)(get_neuron_features(neurons))
+    single = load_model_predictor(MODEL_FILE)
+    single_logits = [single(get_neuron_feature(n)) for n in neurons]
+
+    assert batch_logits.shape == (len(neurons),)
+    assert np.allclose(batch_logits, single_logits, atol=1e-5)
+
+def test_numpy_predictor_matches_torch_predictor(tmp_path):
+    pytest.importorskip("torch")
+    from training.export_model import export_numpy_model
+    from training.inference import load_numpy_predictor
+    from training.train import load_model_batch_predictor
+    features = get_neuron_features(load_test_neurons())
+
+    npz_file = export_numpy_model(MODEL_FILE, tmp_path / "model.npz")
+    numpy_logits = load_numpy_predictor(npz_file)(features)
+    torch_logits = load_model_batch_predictor(MODEL_FILE)(features)
+
+    assert np.allclose(numpy_logits, torch_logits, atol=1e-5)
+
+def test_prediction_cache_skips_inference_for_known_units(tmp_path):
+    from training.inference import load_numpy_predictor
+    from training.prediction_cache import predict_probs
+    model_file = str(MODEL_FILE.with_suffix(".npz"))
+    cache_file = str(tmp_path / "model_predictions.json")
+    features = get_neuron_features(load_test_neurons())
+    loads = []
+    def load_predictor():
+        loads.append(model_file)
+        return load_numpy_predictor(model_file)
+
+    probs, n_cached = predict_probs(features[:3], model_file, load_predictor, cache_file)
+    assert n_cached == 0 and len(loads) == 1
+    probs_again, n_cached = predict_probs(features[:3], model_file, load_predictor, cache_file)
+    assert n_cached == 3 and len(loads) == 1
+    assert np.array_equal(probs, probs_again)
+    # only the two unseen units are scored
+    all_probs, n_cached = predict_probs(features, model_file, load_predictor, cache_file)
+    assert n_cached == 3 and len(loads) == 2
+    assert np.array_equal(all_probs[:3], probs)
+
+def test_prediction_cache_is_thread_safe(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from training.inference import load_numpy_predictor
+    from training.prediction_cache import load_prediction_cache, predict_probs
+    model_file = str(MODEL_FILE.with_suffix(".npz"))
+    cache_file = str(tmp_path / "model_predictions.json")
+    features = get_neuron_features(load_test_neurons())
+    predictor = load_numpy_predictor(model_file)
+
+    # every thread scores a different unit, so each one rewrites the cache
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: predict_probs(features[i:i + 1], model_file, lambda: predictor, cache_file)[0],
+                                [i % len(features) for i in range(32)]))
+    cache = load_prediction_cache(cache_file)
+    assert len(cache) == 1 and len(next(iter(cache.values()))) == len(features)
+    assert [p.name for p in tmp_path.iterdir()] == ["model_predictions.json"]
+    probs, n_cached = predict_probs(features, model_file, lambda: None, cache_file)
+    assert n_cached == len(features) and np.allclose(probs[[i % len(features) for i in range(32)]], np.concatenate(results))
+
+def test_feature_store_updates_incrementally(tmp_path):
+    from training.data_loader import load_feature_store, load_sessions, update_feature_store
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    for name in ["session_a", "session_b"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "neuron_data.json").write_bytes((data_dir / "expected_summary.json").read_bytes())
+        (tmp_path / name / "clusters_excluded.csv").write_bytes((data_dir / "clusters_excluded.csv").read_bytes())
+
+    X, y = load_feature_store(str(tmp_path))
+    X_ref, y_ref = load_sessions(str(tmp_path))
+    assert np.array_equal(np.sort(X, axis=0), np.sort(X_ref, axis=0))
+    assert sorted(y) == sorted(y_ref)
+
+    # relabelling one session only touches its labels
+    (tmp_path / "session_b" / "clusters_excluded.csv").write_text("")
+    store = update_feature_store(str(tmp_path))
+    rows = store["sessions"] == "session_b"
+    assert store["y"][rows].all()
+    assert np.array_equal(store["y"][~rows], y[:rows.sum()])
+    assert np.array_equal(store["X"], X)
+
+def test_feature_store_accepts_sessions_without_units(tmp_path):
+    from training.data_loader import load_feature_store, update_feature_store
+    data_dir = Path(__file__).parent / "data" / "dataset1"
+    for name, data in [("session_a", "[]"), ("session_b", (data_dir / "expected_summary.json").read_text())]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "neuron_data.json").write_text(data)
+        (tmp_path / name / "clusters_excluded.csv").write_text("")
+
+    X, y = load_feature_store(str(tmp_path))
+    assert X.shape == (5, 64) and y.all()
+    (tmp_path / "session_b" / "clusters_excluded.csv").write_bytes((data_dir / "clusters_excluded.csv").read_bytes())
+    store = update_feature_store(str(tmp_path))
+    assert np.array_equal(store["X"], X) and not store["y"].all()
+    assert [p.name for p in tmp_path.iterdir() if p.is_file()] == ["feature_store.npz"]
+
+def test_retrain_improves_holdout_loss(tmp_path):
+    from training.inference import load_numpy_model, save_numpy_model
+    from training.online import retrain
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 8))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    layers = [(rng.normal(scale=0.1, size=(16, 8)), np.zeros(16)), (rng.normal(scale=0.1, size=(1, 16)), np.zeros(1))]
+    save_numpy_model(tmp_path / "model.npz", layers, np.zeros(8), np.ones(8), False)
+
+    outfile = str(tmp_path / "model_retrained.npz")
+    result = retrain(str(tmp_path / "model.npz"), X, y, outfile)
+
+    assert result["accepted"] and result["n_holdout"] == 40
+    assert result["holdout_loss_after"] < result["holdout_loss_before"] - 0.1
+    assert len(load_numpy_model(outfile)[0]) == 2
+
+def test_holdout_is_fixed_per_unit():
+    from training.online import holdout_mask
+    keys = [(f"times_ch{i}.mat", c) for i in range(50) for c in (1, 2)]
+    mask = holdout_mask(keys, 0.2)
+    assert 0 < mask.sum() < len(keys)
+    # a unit's membership does not depend on which other units are curated
+    assert np.array_equal(holdout_mask(keys[::3], 0.2), mask[::3])
+    assert not holdout_mask(keys, 0).any()
+
+def test_sweep_summary_and_refit_for_mean_best_epoch(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    from training import sweep
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(40, 8))
+    y = (X[:, 0] > 0).astype(np.float32)
+    grid = {"hidden_size": [0, 4], "lr": [1e-2], "batch_size": [8], "normalize": [True], "normalize_samples": [False]}
+
+    rows = sweep.sweep(X, y, grid, folds=2, epochs=5, patience=2, workers=1)
+    summary = tmp_path / "sweep.csv"
+    sweep.write_summary(rows, summary)
+    with open(summary, newline="") as f:
+        written = list(csv.DictReader(f))
+    assert [int(r["hidden_size"]) for r in written] == [r["hidden_size"] for r in rows] and sorted(r["hidden_size"] for r in rows) == [0, 4]
+    assert [float(r["mean_test_loss"]) for r in written] == sorted(r["mean_test_loss"] for r in rows)
+    assert all(1 <= r["mean_best_epoch"] <= 5 for r in rows)
+
+    epochs = []
+    fit_classifier = sweep.fit_classifier
+    def recording_fit(*args, **kwargs):
+        epochs.append(kwargs["epochs"])
+        return fit_classifier(*args, **kwargs)
+    monkeypatch.setattr(sweep, "fit_classifier", recording_fit)
+    out = tmp_path / "best.pt"
+    sweep.refit_best(X, y, {**rows[0], "mean_best_epoch": 2.6}, str(out))
+    assert epochs == [3] and out.exists() and out.with_suffix(".npz").exists()
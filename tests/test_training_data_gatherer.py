@@ -0,0 +1,47 @@
+import os
+from training.training_data_gatherer import collect_files, find_targets
+
+def make_session(root, name, sub="sorting"):
+    folder = root / name / sub
+    folder.mkdir(parents=True)
+    (folder / "neuron_data.json").write_text("[]")
+    (folder / "clusters_excluded.csv").write_text("times_a.mat,1\n")
+    return folder
+
+def test_files_are_copied_only_when_changed(tmp_path):
+    src = make_session(tmp_path / "in", "s1")
+    out = tmp_path / "out"
+    collect_files(tmp_path / "in", out)
+    dest = out / "s1" / "clusters_excluded.csv"
+    assert dest.read_text() == "times_a.mat,1\n" and not os.path.samefile(dest, src / "clusters_excluded.csv")
+
+    # an unchanged source is not copied again
+    dest.write_text("times_b.mat,2\n")
+    os.utime(dest, ns=(os.stat(src / "clusters_excluded.csv").st_atime_ns, os.stat(src / "clusters_excluded.csv").st_mtime_ns))
+    collect_files(tmp_path / "in", out)
+    assert dest.read_text() == "times_b.mat,2\n"
+
+    (src / "clusters_excluded.csv").write_text("times_a.mat,1\ntimes_a.mat,3\n")
+    collect_files(tmp_path / "in", out)
+    assert dest.read_text() == "times_a.mat,1\ntimes_a.mat,3\n"
+
+def test_link_mode_hard_links_files(tmp_path):
+    src = make_session(tmp_path / "in", "s1")
+    out = tmp_path / "out"
+    collect_files(tmp_path / "in", out, link=True)
+    for name in ["neuron_data.json", "clusters_excluded.csv"]:
+        assert os.path.samefile(out / "s1" / name, src / name)
+    collect_files(tmp_path / "in", out, link=True)
+    assert sorted(os.listdir(out / "s1")) == ["clusters_excluded.csv", "neuron_data.json"]
+
+def test_pruned_and_hidden_directories_are_skipped(tmp_path):
+    make_session(tmp_path, "s1", sub=".backup")
+    make_session(tmp_path, "s2", sub="old_sorting")
+    assert find_targets(tmp_path / "s1") == {}
+    assert find_targets(tmp_path / "s2", prune=["old_*"]) == {}
+    assert set(find_targets(tmp_path / "s1", prune=[])) == {"neuron_data.json", "clusters_excluded.csv"}
+
+    # the shallowest copy wins when there are several
+    make_session(tmp_path, "s3", sub="a/deeper")
+    shallow = make_session(tmp_path, "s3", sub="z")
+    assert find_targets(tmp_path / "s3")["neuron_data.json"] == shallow / "neuron_data.json"
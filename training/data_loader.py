@@ -2,12 +2,25 @@ import os.path
 import csv
 import json
 import numpy as np
+from atomic_write import atomic_write
+
+NEURON_DATA_FILE = "neuron_data.json"
+EXCLUDE_FILE = "clusters_excluded.csv"
+FEATURE_STORE_FILE = "feature_store.npz"
 
 def get_neuron_feature(n):
     waveforms = n['waveform_quintiles']
     middle = len(waveforms) // 2
     return waveforms[middle]
 
+def get_neuron_features(neurons):
+    """Stacks get_neuron_feature() of every neuron into one (n_neurons, n_features) matrix."""
+    return np.array([get_neuron_feature(n) for n in neurons], dtype=float)
+
+def sigmoid(logits):
+    with np.errstate(over="ignore"):
+        return 1 / (1 + np.exp(-np.asarray(logits, dtype=float)))
+
 def load_neuron_features(data_file):
     if not os.path.exists(data_file):
         raise FileNotFoundError(f"Data file {data_file} not found")
@@ -44,8 +57,8 @@ def get_training_data(neurons, excluded):
     return X, y
 
 def session_loader(session_dir):
-    data_file = os.path.join(session_dir, "neuron_data.json")
-    exclude_file = os.path.join(session_dir, "clusters_excluded.csv")
+    data_file = os.path.join(session_dir, NEURON_DATA_FILE)
+    exclude_file = os.path.join(session_dir, EXCLUDE_FILE)
     neurons = load_neuron_features(data_file)
     excluded = get_excluded_clusters(exclude_file)
     return get_training_data(neurons, excluded)
@@ -64,8 +77,99 @@ def load_sessions(base_dir):
     y = np.hstack(y)
     return X, y
 
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def _read_feature_store(store_file):
+    if not os.path.exists(store_file):
+        return None
+    with np.load(store_file, allow_pickle=False) as f:
+        store = {k: f[k] for k in f.files}
+    store["manifest"] = json.loads(str(store["manifest"]))
+    return store
+
+def update_feature_store(base_dir, store_file=None, verbose=True):
+    """
+    Keeps a single .npz with the features, labels and (session, filename, cluster_id) keys
+    of every unit under base_dir, plus a per-session manifest of file sizes/mtimes.
+    Only sessions whose neuron_data.json changed are re-parsed; if only
+    clusters_excluded.csv changed, just the labels are recomputed.
+    Returns the store as a dict of arrays.
+    """
+    if store_file is None:
+        store_file = os.path.join(base_dir, FEATURE_STORE_FILE)
+    old = _read_feature_store(store_file)
+    old_manifest = old["manifest"] if old is not None else {}
+
+    session_names = sorted(e.name for e in os.scandir(base_dir) if e.is_dir())
+    manifest = {}
+    parts = []
+    changed = set(old_manifest) != set(session_names)
+    for name in session_names:
+        session_dir = os.path.join(base_dir, name)
+        data_file = os.path.join(session_dir, NEURON_DATA_FILE)
+        exclude_file = os.path.join(session_dir, EXCLUDE_FILE)
+        if not os.path.exists(data_file):
+            raise FileNotFoundError(f"Data file {data_file} not found")
+        if not os.path.exists(exclude_file):
+            raise FileNotFoundError(f"Exclude file {exclude_file} not found")
+        entry = {"neuron_data": _file_signature(data_file), "clusters_excluded": _file_signature(exclude_file)}
+        prev = old_manifest.get(name)
+
+        if prev is not None and prev["neuron_data"] == entry["neuron_data"]:
+            rows = slice(prev["start"], prev["stop"])
+            X = old["X"][rows]
+            filenames = old["filenames"][rows]
+            cluster_ids = old["cluster_ids"][rows]
+            if prev["clusters_excluded"] == entry["clusters_excluded"]:
+                y = old["y"][rows]
+            else:
+                excluded = get_excluded_clusters(exclude_file)
+                y = np.array([0 if (fn, int(cid)) in excluded else 1 for fn, cid in zip(filenames, cluster_ids)], dtype=int)
+                changed = True
+        else:
+            if verbose:
+                print(f"Reading session {name} ...")
+            neurons = load_neuron_features(data_file)
+            Xc, yc = get_training_data(neurons, get_excluded_clusters(exclude_file))
+            # a session without units has no feature width of its own; it is left out of the stacking below
+            X = np.array(Xc, dtype=float) if Xc else np.zeros((0, 0))
+            y = np.array(yc, dtype=int)
+            filenames = np.array([n["filename"] for n in neurons], dtype=str)
+            cluster_ids = np.array([n["cluster_id"] for n in neurons], dtype=int)
+            changed = True
+        parts.append((name, X, y, filenames, cluster_ids))
+        manifest[name] = entry
+
+    if not changed:
+        return old
+
+    start = 0
+    for name, X, y, filenames, cluster_ids in parts:
+        manifest[name].update(start=start, stop=start + len(y))
+        start += len(y)
+
+    store = {
+        "X": np.vstack([p[1] for p in parts if len(p[2])]) if any(len(p[2]) for p in parts) else np.zeros((0, 0)),
+        "y": np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=int),
+        "filenames": np.concatenate([p[3] for p in parts]) if parts else np.zeros(0, dtype=str),
+        "cluster_ids": np.concatenate([p[4] for p in parts]) if parts else np.zeros(0, dtype=int),
+        "sessions": np.concatenate([np.full(len(p[2]), p[0]) for p in parts]) if parts else np.zeros(0, dtype=str),
+    }
+    atomic_write(store_file, lambda f: np.savez(f, manifest=np.array(json.dumps(manifest)), **store))
+    if verbose:
+        print(f"Updated feature store {store_file} ({len(store['y'])} units from {len(parts)} sessions)")
+    store["manifest"] = manifest
+    return store
+
+def load_feature_store(base_dir, store_file=None, verbose=True):
+    """Same (X, y) as load_sessions(), but read from the incrementally updated feature store."""
+    store = update_feature_store(base_dir, store_file=store_file, verbose=verbose)
+    return store["X"], store["y"]
+
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(base_dir, "training_data")
-    X, y = load_sessions(data_dir)
+    X, y = load_feature_store(data_dir)
     print(f"Loaded {len(X)} samples with {X.shape[1]} features each")
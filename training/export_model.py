@@ -0,0 +1,26 @@
+"""
+Converts a torch checkpoint written by train.py into a plain-array .npz model
+that training.inference can evaluate without torch.
+"""
+
+import argparse
+import os.path
+from training.inference import save_numpy_model
+from training.train import load_model
+
+def export_numpy_model(checkpoint_path, outfile=None):
+    model, mean, std, normalize_samples = load_model(checkpoint_path)
+    state = model.state_dict()
+    prefixes = ["net.0", "net.2"] if "net.0.weight" in state else ["net"]
+    layers = [(state[f"{p}.weight"].numpy(), state[f"{p}.bias"].numpy()) for p in prefixes]
+    if outfile is None:
+        outfile = os.path.splitext(checkpoint_path)[0] + ".npz"
+    save_numpy_model(outfile, layers, mean, std, normalize_samples)
+    return outfile
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained model checkpoint (.pt) to a torch-free .npz file.")
+    parser.add_argument("checkpoint", help="Path to the .pt checkpoint written by train.py")
+    parser.add_argument("--outfile", default=None, help="Output .npz path (default: checkpoint path with .npz extension)")
+    args = parser.parse_args()
+    print(f"Saved to {export_numpy_model(args.checkpoint, args.outfile)}")
@@ -0,0 +1,68 @@
+"""
+Torch-free inference for the cluster Classifier.
+
+A checkpoint written by train.py is exported (see export_model.py) to a plain .npz
+holding the Linear layer weights plus the mean/std/normalize_samples preprocessing,
+which can then be evaluated with NumPy alone.
+"""
+
+import os.path
+import numpy as np
+
+NUMPY_MODEL_EXT = ".npz"
+
+def save_numpy_model(path, layers, mean, std, normalize_samples):
+    """layers is a list of (weight, bias) pairs, with a ReLU between consecutive layers."""
+    arrays = {
+        "mean": np.asarray(mean, dtype=np.float64),
+        "std": np.asarray(std, dtype=np.float64),
+        "normalize_samples": np.asarray(bool(normalize_samples)),
+    }
+    for i, (weight, bias) in enumerate(layers):
+        arrays[f"weight_{i}"] = np.asarray(weight, dtype=np.float32)
+        arrays[f"bias_{i}"] = np.asarray(bias, dtype=np.float32)
+    np.savez(path, **arrays)
+
+def load_numpy_model(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file {path} not found")
+    with np.load(path, allow_pickle=False) as f:
+        layers = []
+        while f"weight_{len(layers)}" in f:
+            i = len(layers)
+            layers.append((f[f"weight_{i}"], f[f"bias_{i}"]))
+        if not layers:
+            raise ValueError(f"Model file {path} does not contain any layers")
+        return layers, f["mean"], f["std"], bool(f["normalize_samples"])
+
+def forward(layers, X):
+    """Same computation as Classifier.forward: Linear layers in float32 with ReLU in between."""
+    h = X
+    for i, (weight, bias) in enumerate(layers):
+        if i > 0:
+            h = np.maximum(h, 0)
+        h = h @ weight.T + bias
+    return h[:, 0]
+
+def preprocess(features, mean, std, normalize_samples):
+    """Same preprocessing as the torch predictor: optional division by the sample minimum, then standardization."""
+    X = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    if normalize_samples:
+        sample_min = X.min(axis=1, keepdims=True)
+        sample_min[sample_min == 0] = 1.0
+        X = X / sample_min
+    return ((X - mean) / std).astype(np.float32)
+
+def load_numpy_predictor(path):
+    """Returns predictor(features) mapping an (n_units, n_features) matrix to n_units logits."""
+    layers, mean, std, normalize_samples = load_numpy_model(path)
+    def predictor(features):
+        return forward(layers, preprocess(features, mean, std, normalize_samples))
+    return predictor
+
+def load_predictor(path):
+    """Batch predictor for either an exported .npz model or a torch .pt checkpoint (which needs torch)."""
+    if os.path.splitext(path)[1] == NUMPY_MODEL_EXT:
+        return load_numpy_predictor(path)
+    from training.train import load_model_batch_predictor
+    return load_model_batch_predictor(path)
@@ -0,0 +1,96 @@
+"""
+Torch-free fine-tuning of an exported (.npz) Classifier on newly curated units.
+
+The model's preprocessing (mean/std/normalize_samples) is kept as is and its Linear
+layers are trained further with full-batch Adam on the BCE-with-logits loss, the same
+objective as train.py. A holdout decides whether the fine-tuned model replaces the
+current one: it is only saved if its holdout loss is no worse. When models are fine-tuned
+one after another, holdout_mask() keeps the holdout fixed per unit, so no generation is
+ever judged on units an earlier one was trained on.
+"""
+
+import hashlib
+import numpy as np
+from atomic_write import atomic_write
+from training.inference import load_numpy_model, preprocess, save_numpy_model
+
+def bce_with_logits(logits, y):
+    """Mean binary cross-entropy, computed stably from logits like torch's BCEWithLogitsLoss."""
+    return float(np.mean(np.logaddexp(0, logits) - y * logits))
+
+def _forward(layers, X):
+    """Returns the logits and the input of every layer, for backpropagation."""
+    inputs = []
+    h = X
+    for i, (weight, bias) in enumerate(layers):
+        if i > 0:
+            h = np.maximum(h, 0)
+        inputs.append(h)
+        h = h @ weight.T + bias
+    return h[:, 0], inputs
+
+def fine_tune(layers, X, y, epochs=200, lr=1e-3):
+    """Returns new (weight, bias) layers after `epochs` full-batch Adam steps from the given ones."""
+    params = [p.astype(np.float64) for layer in layers for p in layer]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    X = X.astype(np.float64)
+    for step in range(1, epochs + 1):
+        current = list(zip(params[::2], params[1::2]))
+        logits, inputs = _forward(current, X)
+        # d(loss)/d(logits) of the mean BCE, as a column for the last layer
+        grad_out = ((1 / (1 + np.exp(-logits)) - y) / len(y))[:, None]
+        grads = [None] * len(params)
+        for i in reversed(range(len(current))):
+            weight, _ = current[i]
+            grads[2 * i] = grad_out.T @ inputs[i]
+            grads[2 * i + 1] = grad_out.sum(axis=0)
+            if i > 0:
+                grad_out = (grad_out @ weight) * (inputs[i] > 0)
+        for k, g in enumerate(grads):
+            m[k] = beta1 * m[k] + (1 - beta1) * g
+            v[k] = beta2 * v[k] + (1 - beta2) * g * g
+            params[k] -= lr * (m[k] / (1 - beta1 ** step)) / (np.sqrt(v[k] / (1 - beta2 ** step)) + eps)
+    return [(w.astype(np.float32), b.astype(np.float32)) for w, b in zip(params[::2], params[1::2])]
+
+def split_holdout(n, holdout_fraction, seed):
+    idx = np.random.default_rng(seed).permutation(n)
+    n_holdout = max(1, int(round(n * holdout_fraction)))
+    return idx[n_holdout:], idx[:n_holdout]
+
+def holdout_mask(keys, holdout_fraction):
+    """
+    Whether each (filename, cluster_id) belongs to the holdout. The choice depends only on
+    the unit's key, so a unit is in the holdout of every retraining or of none.
+    """
+    fractions = [int.from_bytes(hashlib.sha1(f"{filename}/{cluster_id}".encode()).digest()[:8], "big") / 2**64
+                 for filename, cluster_id in keys]
+    return np.array(fractions, dtype=float) < holdout_fraction
+
+def retrain(model_file, features, labels, outfile, holdout=None, holdout_fraction=0.2, epochs=200, lr=1e-3, seed=0):
+    """
+    Fine-tunes the .npz model in model_file on (features, labels) minus a holdout and,
+    if the holdout loss does not get worse, writes the new model to outfile (atomically).
+    holdout is a boolean mask over the units (e.g. from holdout_mask()); by default a random
+    holdout_fraction of them is drawn with seed.
+    Returns {"accepted", "holdout_loss_before", "holdout_loss_after", "n_train", "n_holdout"}.
+    """
+    layers, mean, std, normalize_samples = load_numpy_model(model_file)
+    X = preprocess(features, mean, std, normalize_samples)
+    y = np.asarray(labels, dtype=np.float64)
+    if holdout is None:
+        train_idx, holdout_idx = split_holdout(len(y), holdout_fraction, seed)
+    else:
+        train_idx, holdout_idx = np.flatnonzero(~holdout), np.flatnonzero(holdout)
+    if len(train_idx) == 0 or len(holdout_idx) == 0:
+        raise ValueError(f"Need units to train on and to hold out, got {len(train_idx)} and {len(holdout_idx)}")
+
+    new_layers = fine_tune(layers, X[train_idx], y[train_idx], epochs=epochs, lr=lr)
+    before = bce_with_logits(_forward(layers, X[holdout_idx].astype(np.float64))[0], y[holdout_idx])
+    after = bce_with_logits(_forward(new_layers, X[holdout_idx].astype(np.float64))[0], y[holdout_idx])
+    accepted = after <= before
+    if accepted:
+        atomic_write(outfile, lambda f: save_numpy_model(f, new_layers, mean, std, normalize_samples))
+    return {"accepted": accepted, "holdout_loss_before": before, "holdout_loss_after": after,
+            "n_train": len(train_idx), "n_holdout": len(holdout_idx)}
@@ -0,0 +1,106 @@
+"""
+Persistent cache of model predictions, keyed by a hash of the model file and of each
+unit's feature vector, so reopening a session or re-exporting with the same model
+needs no inference at all.
+"""
+
+import hashlib
+import json
+import os.path
+import threading
+import numpy as np
+from atomic_write import atomic_write
+from training.data_loader import sigmoid
+
+PREDICTION_CACHE_FILE = "model_predictions.json"
+MAX_CACHED_MODELS = 3  # keep a few models so swapping back and forth stays cheap
+
+# Serializes the read-modify-write of cache files between threads (viewer requests, the retrainer)
+_lock = threading.Lock()
+# cache_file -> ((mtime_ns, size), cache) as last read or written by this process
+_loaded = {}
+# model_file -> ((mtime_ns, size), digest), so a model is hashed once until it changes
+_model_digests = {}
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _identity(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def model_digest(model_file):
+    """file_digest() of the model, recomputed only when its mtime or size changes."""
+    identity = _identity(model_file)
+    with _lock:
+        cached = _model_digests.get(model_file)
+    if cached is not None and cached[0] == identity:
+        return cached[1]
+    digest = file_digest(model_file)
+    with _lock:
+        _model_digests[model_file] = (identity, digest)
+    return digest
+
+def feature_digests(features):
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    return [hashlib.sha1(row.tobytes()).hexdigest() for row in features]
+
+def load_prediction_cache(cache_file):
+    """Returns {model_digest: {feature_digest: probability}}, or {} if the file is missing or unreadable."""
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: ignoring unreadable prediction cache {cache_file}: {e}")
+        return {}
+
+def save_prediction_cache(cache_file, cache):
+    atomic_write(cache_file, lambda f: json.dump(cache, f), mode="w")
+
+def _current_cache(cache_file):
+    """The cache as on disk, re-read only if another process has rewritten it; call with _lock held."""
+    identity = _identity(cache_file) if os.path.exists(cache_file) else None
+    loaded = _loaded.get(cache_file)
+    if loaded is None or loaded[0] != identity:
+        loaded = (identity, load_prediction_cache(cache_file))
+        _loaded[cache_file] = loaded
+    return loaded[1]
+
+def predict_probs(features, model_file, load_predictor, cache_file):
+    """
+    Returns (probs, n_cached) for an (n_units, n_features) matrix.
+    load_predictor() is only called if some units are missing from the cache,
+    and only those units are scored. Safe to call from several threads at once.
+    """
+    features = np.asarray(features, dtype=np.float64)
+    model_key = model_digest(model_file)
+    keys = feature_digests(features)
+    with _lock:
+        cache = _current_cache(cache_file)
+        predictions = dict(cache.get(model_key, {}))
+        n_models = len(cache)
+
+    missing = [i for i, k in enumerate(keys) if k not in predictions]
+    if missing:
+        # scored outside the lock; other callers' predictions are merged in below
+        predictor = load_predictor()
+        probs = sigmoid(predictor(features[missing]))
+        for i, p in zip(missing, probs):
+            predictions[keys[i]] = float(p)
+
+    if missing or n_models > MAX_CACHED_MODELS:
+        with _lock:
+            cache = dict(_current_cache(cache_file))
+            # re-insert the current model last so it counts as the most recently used
+            cache[model_key] = {**cache.pop(model_key, {}), **predictions}
+            for stale in list(cache)[:-MAX_CACHED_MODELS]:
+                del cache[stale]
+            save_prediction_cache(cache_file, cache)
+            _loaded[cache_file] = (_identity(cache_file), cache)
+    return np.array([predictions[k] for k in keys]), len(keys) - len(missing)
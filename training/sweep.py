@@ -0,0 +1,129 @@
+"""
+k-fold cross-validated hyperparameter sweep for the cluster Classifier.
+
+Every (configuration, fold) pair is trained in a CPU process pool, each worker limited
+to a few torch threads. Results are written as a summary table, and with --out the best
+configuration is refit on all data for the mean best epoch count across its folds and saved
+there in the same checkpoint format as train.py.
+"""
+
+import argparse
+import csv
+import itertools
+import os.path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from training.data_loader import load_feature_store
+from training.train import fit_classifier, normalize_by_sample_min, save_checkpoint, standardization
+
+HYPERPARAMETERS = ["hidden_size", "lr", "batch_size", "normalize", "normalize_samples"]
+
+# set in each worker by _init_worker, so the data is sent once per process rather than once per task
+_worker_data = {}
+
+def _init_worker(X, y, threads):
+    torch.set_num_threads(threads)
+    _worker_data["X"] = X
+    _worker_data["y"] = y
+
+def make_folds(n, k, seed):
+    idx = np.random.default_rng(seed).permutation(n)
+    return np.array_split(idx, k)
+
+def run_fold(config, folds, fold, epochs, patience, model_seed):
+    X, y = _worker_data["X"], _worker_data["y"]
+    test_idx = folds[fold]
+    train_idx = np.concatenate([f for i, f in enumerate(folds) if i != fold])
+    if config["normalize_samples"]:
+        X = normalize_by_sample_min(X)
+    mean, std = standardization(X[train_idx], config["normalize"])
+    X = (X - mean) / std
+    _, best_epoch, test_loss, test_acc = fit_classifier(
+        X[train_idx], y[train_idx], X[test_idx], y[test_idx], hidden_size=config["hidden_size"], lr=config["lr"],
+        epochs=epochs, batch_size=config["batch_size"], patience=patience, model_seed=model_seed)
+    return {"fold": fold, "best_epoch": best_epoch, "test_loss": test_loss, "test_acc": test_acc}
+
+def summarize(config, fold_results):
+    return {
+        **config,
+        "mean_test_loss": float(np.mean([r["test_loss"] for r in fold_results])),
+        "std_test_loss":  float(np.std([r["test_loss"] for r in fold_results])),
+        "mean_test_acc":  float(np.mean([r["test_acc"] for r in fold_results])),
+        "mean_best_epoch": float(np.mean([r["best_epoch"] for r in fold_results])),
+    }
+
+def sweep(X, y, grid, folds=5, epochs=1000, patience=10, split_seed=42, model_seed=0, workers=None, threads_per_worker=1):
+    """Returns one summary row per configuration in grid (dict of hyperparameter -> list of values), best first."""
+    configs = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    fold_idx = make_folds(len(X), folds, split_seed)
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    print(f"Running {len(configs)} configurations x {folds} folds on {workers} workers ({threads_per_worker} thread(s) each)")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y, threads_per_worker)) as pool:
+        futures = {(c, f): pool.submit(run_fold, config, fold_idx, f, epochs, patience, model_seed)
+                   for c, config in enumerate(configs) for f in range(folds)}
+        rows = [summarize(config, [futures[(c, f)].result() for f in range(folds)]) for c, config in enumerate(configs)]
+    return sorted(rows, key=lambda r: r["mean_test_loss"])
+
+def write_summary(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved sweep summary to {path}")
+
+def refit_best(X, y, best, path, model_seed=0):
+    """Refits the best configuration on all data for its mean best epoch count and saves the checkpoint."""
+    if best["normalize_samples"]:
+        X = normalize_by_sample_min(X)
+    mean, std = standardization(X, best["normalize"])
+    epochs = max(1, int(round(best["mean_best_epoch"])))
+    state, _, _, _ = fit_classifier((X - mean) / std, y, None, None, hidden_size=best["hidden_size"], lr=best["lr"],
+                                    epochs=epochs, batch_size=best["batch_size"], model_seed=model_seed)
+    save_checkpoint(path, state, mean, std, best["normalize_samples"])
+
+def main(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(base_dir, "training_data")
+    X, y = load_feature_store(data_dir)
+    print(f"Loaded {len(X)} samples, {X.shape[1]} features, "
+          f"{y.sum()} positive / {(y == 0).sum()} negative")
+
+    grid = {
+        "hidden_size":       args.hidden_size,
+        "lr":                args.lr,
+        "batch_size":        args.batch_size,
+        "normalize":         [bool(v) for v in args.normalize],
+        "normalize_samples": [bool(v) for v in args.normalize_samples],
+    }
+    rows = sweep(X, y, grid, folds=args.folds, epochs=args.epochs, patience=args.patience, split_seed=args.split_seed,
+                 model_seed=args.model_seed, workers=args.workers, threads_per_worker=args.threads_per_worker)
+
+    print(f"\n{'rank':>4} " + " ".join(f"{h:>17}" for h in HYPERPARAMETERS) + "   test loss (std)   test acc  epochs")
+    for rank, r in enumerate(rows, 1):
+        print(f"{rank:4d} " + " ".join(f"{str(r[h]):>17}" for h in HYPERPARAMETERS) +
+              f"   {r['mean_test_loss']:.4f} ({r['std_test_loss']:.4f})   {r['mean_test_acc']:.3f}  {r['mean_best_epoch']:6.1f}")
+
+    write_summary(rows, args.summary or os.path.join(base_dir, "model_sweep.csv"))
+    if args.out:
+        refit_best(X, y, rows[0], args.out, model_seed=args.model_seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="k-fold cross-validated hyperparameter sweep (CPU only).")
+    parser.add_argument("--hidden-size", type=int,   nargs="+", default=[0, 16, 32], help="hidden layer sizes to try (0 = linear)")
+    parser.add_argument("--lr",          type=float, nargs="+", default=[1e-3],     help="learning rates to try")
+    parser.add_argument("--batch-size",  type=int,   nargs="+", default=[32],       help="batch sizes to try")
+    parser.add_argument("--normalize",         type=int, nargs="+", default=[0, 1], help="standardize features: 0, 1 or both")
+    parser.add_argument("--normalize-samples", type=int, nargs="+", default=[0, 1], help="divide samples by their minimum: 0, 1 or both")
+    parser.add_argument("--folds",       type=int,   default=5,    help="number of cross-validation folds")
+    parser.add_argument("--epochs",      type=int,   default=1000)
+    parser.add_argument("--patience",    type=int,   default=10,   help="early stopping patience (epochs)")
+    parser.add_argument("--split-seed",  type=int,   default=42,   help="seed for fold assignment")
+    parser.add_argument("--model-seed",  type=int,   default=0,    help="seed for model weight init")
+    parser.add_argument("--workers",     type=int,   default=None, help="number of worker processes (default: cpu count / threads per worker)")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="torch threads per worker process")
+    parser.add_argument("--summary",     type=str,   default=None, help="path of the sweep summary CSV (default: training/model_sweep.csv)")
+    parser.add_argument("--out",         type=str,   default=None, help="if set, refits the best configuration and saves it to this checkpoint path (.pt, plus a .npz copy)")
+    main(parser.parse_args())
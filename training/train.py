@@ -3,8 +3,7 @@ import os.path
 import numpy as np
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, TensorDataset
-from training.data_loader import load_sessions
+from training.data_loader import load_feature_store
 
 class Classifier(nn.Module):
     def __init__(self, input_size, hidden_size=32):
@@ -23,7 +22,7 @@ class Classifier(nn.Module):
 
 
 def load_model(path):
-    checkpoint = torch.load(path, weights_only=False)
+    checkpoint = torch.load(path, weights_only=False, map_location="cpu")
     state             = checkpoint["state_dict"]
     mean              = checkpoint["mean"]
     std               = checkpoint["std"]
@@ -39,87 +38,89 @@ def load_model(path):
     model.eval()
     return model, mean, std, normalize_samples
 
-def load_model_predictor(path):
+def load_model_batch_predictor(path):
+    """Returns predictor(features) mapping an (n_units, n_features) matrix to n_units logits in one forward pass."""
     model, mean, std, normalize_samples = load_model(path)
-    def predictor(feature):
-        x = np.array(feature, dtype=np.float32)
+    def predictor(features):
+        X = np.atleast_2d(np.asarray(features, dtype=np.float32))
         if normalize_samples:
-            sample_min = x.min()
-            if sample_min == 0:
-                sample_min = 1.0
-            x = x / sample_min
-        x = (x - mean) / std
+            sample_min = X.min(axis=1, keepdims=True)
+            sample_min[sample_min == 0] = 1.0
+            X = X / sample_min
+        X = (X - mean) / std
         with torch.no_grad():
-            logit = model(torch.tensor(x, dtype=torch.float32).unsqueeze(0)).item()
-        return logit
+            logits = model(torch.tensor(X, dtype=torch.float32)).numpy()
+        return logits
+    return predictor
+
+def load_model_predictor(path):
+    batch_predictor = load_model_batch_predictor(path)
+    def predictor(feature):
+        return float(batch_predictor([feature])[0])
     return predictor
 
-def train(model, loader, optimizer, criterion):
+def normalize_by_sample_min(X):
+    sample_min = X.min(axis=1, keepdims=True)
+    sample_min[sample_min == 0] = 1.0
+    return X / sample_min
+
+def standardization(X_train, normalize):
+    if normalize:
+        mean = X_train.mean(axis=0)
+        std  = X_train.std(axis=0)
+        std[std == 0] = 1.0
+    else:
+        mean = np.zeros(X_train.shape[1])
+        std  = np.ones(X_train.shape[1])
+    return mean, std
+
+def iterate_batches(X, y, batch_size, shuffle=False):
+    """Yields (X, y) slices of in-memory tensors; replaces DataLoader, whose per-sample collation dominates on small data."""
+    n = len(y)
+    order = torch.randperm(n) if shuffle else None
+    for start in range(0, n, batch_size):
+        if order is None:
+            yield X[start:start + batch_size], y[start:start + batch_size]
+        else:
+            idx = order[start:start + batch_size]
+            yield X[idx], y[idx]
+
+def train(model, X, y, optimizer, criterion, batch_size):
     model.train()
     total_loss = 0.0
-    for X_batch, y_batch in loader:
+    for X_batch, y_batch in iterate_batches(X, y, batch_size, shuffle=True):
         optimizer.zero_grad()
         loss = criterion(model(X_batch), y_batch)
         loss.backward()
         optimizer.step()
         total_loss += loss.item() * len(y_batch)
-    return total_loss / len(loader.dataset)
+    return total_loss / len(y)
 
 
-def evaluate(model, loader, criterion):
+def evaluate(model, X, y, criterion):
     model.eval()
-    total_loss = 0.0
-    correct = 0
     with torch.no_grad():
-        for X_batch, y_batch in loader:
-            logits = model(X_batch)
-            total_loss += criterion(logits, y_batch).item() * len(y_batch)
-            preds = (torch.sigmoid(logits) >= 0.5).float()
-            correct += (preds == y_batch).sum().item()
-    n = len(loader.dataset)
-    return total_loss / n, correct / n
-
-def main(args):
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(base_dir, "training_data")
-
-    X, y = load_sessions(data_dir)
-    print(f"Loaded {len(X)} samples, {X.shape[1]} features, "
-          f"{y.sum()} positive / {(y == 0).sum()} negative")
-
-    if args.normalize_samples:
-        sample_min = X.min(axis=1, keepdims=True)
-        sample_min[sample_min == 0] = 1.0
-        X = X / sample_min
-
-    rng = np.random.default_rng(args.split_seed)
-    idx = rng.permutation(len(X))
-    split = int(len(X) * (1.0 - args.test_size))
-    train_idx, test_idx = idx[:split], idx[split:]
-    X_train, X_test = X[train_idx], X[test_idx]
-    y_train, y_test = y[train_idx], y[test_idx]
-
-    if args.normalize:
-        mean = X_train.mean(axis=0)
-        std  = X_train.std(axis=0)
-        std[std == 0] = 1.0
-        X_train = (X_train - mean) / std
-        X_test  = (X_test  - mean) / std
-    else:
-        mean = np.zeros(X_train.shape[1])
-        std  = np.ones(X_train.shape[1])
-
+        logits = model(X)
+        loss = criterion(logits, y).item()
+        preds = (torch.sigmoid(logits) >= 0.5).float()
+        acc = (preds == y).float().mean().item()
+    return loss, acc
+
+def fit_classifier(X_train, y_train, X_test, y_test, hidden_size=32, lr=1e-3, epochs=1000, batch_size=32, patience=10, model_seed=0, log_every=0):
+    """
+    Trains a Classifier on already-preprocessed numpy arrays, keeping the weights with the lowest test loss.
+    If X_test is None, trains for exactly `epochs` epochs and keeps the final weights.
+    Returns (state_dict, best_epoch, best_test_loss, best_test_acc).
+    """
     X_train = torch.tensor(X_train, dtype=torch.float32)
-    X_test  = torch.tensor(X_test,  dtype=torch.float32)
     y_train = torch.tensor(y_train, dtype=torch.float32)
-    y_test  = torch.tensor(y_test,  dtype=torch.float32)
+    if X_test is not None:
+        X_test = torch.tensor(X_test, dtype=torch.float32)
+        y_test = torch.tensor(y_test, dtype=torch.float32)
 
-    train_loader = DataLoader(TensorDataset(X_train, y_train), batch_size=args.batch_size, shuffle=True)
-    test_loader  = DataLoader(TensorDataset(X_test,  y_test),  batch_size=args.batch_size)
-
-    torch.manual_seed(args.model_seed)
-    model     = Classifier(input_size=X.shape[1], hidden_size=args.hidden_size)
-    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    torch.manual_seed(model_seed)
+    model     = Classifier(input_size=X_train.shape[1], hidden_size=hidden_size)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
     criterion = nn.BCEWithLogitsLoss()
 
     best_test_loss = float("inf")
@@ -128,9 +129,13 @@ def main(args):
     best_state     = None
     epochs_no_improve = 0
 
-    for epoch in range(1, args.epochs + 1):
-        train_loss = train(model, train_loader, optimizer, criterion)
-        test_loss, test_acc = evaluate(model, test_loader, criterion)
+    for epoch in range(1, epochs + 1):
+        train_loss = train(model, X_train, y_train, optimizer, criterion, batch_size)
+        if X_test is None:
+            if log_every and epoch % log_every == 0:
+                print(f"Epoch {epoch:3d} | train loss {train_loss:.4f}")
+            continue
+        test_loss, test_acc = evaluate(model, X_test, y_test, criterion)
 
         if test_loss < best_test_loss:
             best_test_loss = test_loss
@@ -141,26 +146,59 @@ def main(args):
         else:
             epochs_no_improve += 1
 
-        if epoch % args.log_every == 0:
+        if log_every and epoch % log_every == 0:
             print(f"Epoch {epoch:3d} | train loss {train_loss:.4f} | "
                   f"test loss {test_loss:.4f} | test acc {test_acc:.3f}")
 
-        if args.patience and epochs_no_improve >= args.patience:
-            print(f"Early stopping at epoch {epoch} (no improvement for {args.patience} epochs)")
+        if patience and epochs_no_improve >= patience:
+            if log_every:
+                print(f"Early stopping at epoch {epoch} (no improvement for {patience} epochs)")
             break
 
-    model.load_state_dict(best_state)
+    if X_test is None:
+        return {k: v.clone() for k, v in model.state_dict().items()}, epochs, float("nan"), float("nan")
+    return best_state, best_epoch, best_test_loss, best_test_acc
+
+def save_checkpoint(path, state, mean, std, normalize_samples):
+    torch.save({
+        "state_dict":       state,
+        "mean":             mean,
+        "std":              std,
+        "normalize_samples": normalize_samples,
+    }, path)
+    print(f"Saved to {path}")
+    from training.export_model import export_numpy_model
+    print(f"Saved torch-free copy to {export_numpy_model(path)}")
+
+def main(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(base_dir, "training_data")
+
+    X, y = load_feature_store(data_dir)
+    print(f"Loaded {len(X)} samples, {X.shape[1]} features, "
+          f"{y.sum()} positive / {(y == 0).sum()} negative")
+
+    if args.normalize_samples:
+        X = normalize_by_sample_min(X)
+
+    rng = np.random.default_rng(args.split_seed)
+    idx = rng.permutation(len(X))
+    split = int(len(X) * (1.0 - args.test_size))
+    train_idx, test_idx = idx[:split], idx[split:]
+    X_train, X_test = X[train_idx], X[test_idx]
+    y_train, y_test = y[train_idx], y[test_idx]
+
+    mean, std = standardization(X_train, args.normalize)
+    X_train = (X_train - mean) / std
+    X_test  = (X_test  - mean) / std
+
+    best_state, best_epoch, best_test_loss, best_test_acc = fit_classifier(
+        X_train, y_train, X_test, y_test, hidden_size=args.hidden_size, lr=args.lr, epochs=args.epochs,
+        batch_size=args.batch_size, patience=args.patience, model_seed=args.model_seed, log_every=args.log_every)
     print(f"\nBest model (epoch {best_epoch}) | test loss {best_test_loss:.4f} | test acc {best_test_acc:.3f}")
 
     if args.output:
-        path = os.path.join(base_dir, args.output + ".pt")
-        torch.save({
-            "state_dict":       best_state,
-            "mean":             mean,
-            "std":              std,
-            "normalize_samples": args.normalize_samples,
-        }, path)
-        print(f"Saved to {path}")
+        save_checkpoint(os.path.join(base_dir, args.output + ".pt"), best_state, mean, std, args.normalize_samples)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -3,30 +3,88 @@
 Searches subdirectories of a given input directory for 'neuron_data.json' and
 'clusters_excluded.csv', then copies any found files into a matching folder
 structure in the output directory.
+
+Each top-level subdirectory is walked once (in parallel across subdirectories),
+skipping --prune'd subtrees (by default hidden directories and __pycache__), and files are only copied when their size
+or modification time differ from the existing copy.
 """
 
 import argparse
+import fnmatch
+import os
 import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
 TARGET_FILES = {"neuron_data.json", "clusters_excluded.csv"}
+DEFAULT_PRUNE = [".*", "__pycache__"]
+
+
+def _is_pruned(name: str, prune: list[str]) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in prune)
 
 
-def find_targets(folder: Path) -> dict[str, Path]:
-    """Recursively search a folder for target files. Returns a dict of {filename: path}."""
+def find_targets(folder: Path, prune: list[str] = DEFAULT_PRUNE) -> dict[str, Path]:
+    """Search a folder for all target files in a single directory walk. Returns a dict of {filename: path}."""
+    matches = {target: [] for target in TARGET_FILES}
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError as e:
+            print(f"  [!] Cannot read '{current}': {e}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not _is_pruned(entry.name, prune):
+                    stack.append(entry.path)
+            elif entry.name in matches:
+                matches[entry.name].append(Path(entry.path))
+
     found = {}
-    for target in TARGET_FILES:
-        matches = list(folder.rglob(target))
-        if matches:
-            # If multiple matches exist, take the first one and warn
-            if len(matches) > 1:
-                print(f"  [!] Multiple '{target}' found in '{folder.name}', using: {matches[0]}")
-            found[target] = matches[0]
+    for target, paths in matches.items():
+        if paths:
+            # If multiple matches exist, take the shallowest one and warn
+            paths.sort(key=lambda p: (len(p.parts), str(p)))
+            if len(paths) > 1:
+                print(f"  [!] Multiple '{target}' found in '{folder.name}', using: {paths[0]}")
+            found[target] = paths[0]
     return found
 
 
-def collect_files(input_dir: Path, output_dir: Path, dry_run: bool = False) -> None:
+def is_up_to_date(src: Path, dest: Path) -> bool:
+    """True if dest exists with the same size and modification time as src (as left by copy2)."""
+    try:
+        s, d = src.stat(), dest.stat()
+    except FileNotFoundError:
+        return False
+    return s.st_size == d.st_size and abs(s.st_mtime - d.st_mtime) < 1e-3
+
+
+def sync_file(src: Path, dest: Path, link: bool = False) -> bool:
+    """Copies (or hard-links) src to dest unless dest is already up to date. Returns True if dest was written."""
+    if is_up_to_date(src, dest):
+        return False
+    if link:
+        # link into a private directory next to dest, so concurrent runs never share a temporary name
+        tmp_dir = Path(tempfile.mkdtemp(dir=dest.parent, prefix=f".{dest.name}."))
+        try:
+            os.link(src, tmp_dir / dest.name)
+            os.replace(tmp_dir / dest.name, dest)
+            return True
+        except OSError as e:
+            print(f"  [!] Cannot hard-link {src} ({e}), copying instead")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copy2(src, dest)
+    return True
+
+
+def collect_files(input_dir: Path, output_dir: Path, dry_run: bool = False, link: bool = False,
+                  prune: list[str] = DEFAULT_PRUNE, workers: int = 8) -> None:
     """Main logic: iterate top-level subdirectories and copy found target files."""
     if not input_dir.is_dir():
         raise ValueError(f"Input directory does not exist: {input_dir}")
@@ -38,9 +96,13 @@ def collect_files(input_dir: Path, output_dir: Path, dry_run: bool = False) -> N
 
     copied_count = 0
     skipped_count = 0
+    unchanged_files = 0
+
+    # scanning is I/O bound, so threads overlap the directory walks of different sessions
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        all_found = list(pool.map(lambda d: find_targets(d, prune), subdirs))
 
-    for subdir in subdirs:
-        found = find_targets(subdir)
+    for subdir, found in zip(subdirs, all_found):
 
         if not found:
             print(f"[ skip ] '{subdir.name}' — no target files found")
@@ -54,12 +116,14 @@ def collect_files(input_dir: Path, output_dir: Path, dry_run: bool = False) -> N
             out_folder.mkdir(parents=True, exist_ok=True)
             for filename, src_path in found.items():
                 dest_path = out_folder / filename
-                shutil.copy2(src_path, dest_path)
-                print(f"         {src_path.relative_to(input_dir)}  →  {dest_path.relative_to(output_dir.parent)}")
+                if sync_file(src_path, dest_path, link=link):
+                    print(f"         {src_path.relative_to(input_dir)}  →  {dest_path.relative_to(output_dir.parent)}")
+                else:
+                    unchanged_files += 1
 
         copied_count += 1
 
-    print(f"\nDone. {copied_count} folder(s) processed, {skipped_count} skipped.")
+    print(f"\nDone. {copied_count} folder(s) processed, {skipped_count} skipped, {unchanged_files} file(s) already up to date.")
     if dry_run:
         print("(Dry run — no files were written.)")
 
@@ -74,6 +138,18 @@ def main():
         "--dry-run", action="store_true",
         help="Preview what would be copied without writing any files"
     )
+    parser.add_argument(
+        "--link", action="store_true",
+        help="Hard-link files instead of copying them (falls back to copying across filesystems)"
+    )
+    parser.add_argument(
+        "--prune", nargs="*", default=DEFAULT_PRUNE,
+        help=f"Directory name patterns not to descend into; pass no patterns to search everywhere (default: {' '.join(DEFAULT_PRUNE)})"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8,
+        help="Number of top-level subdirectories scanned in parallel (default: 8)"
+    )
     args = parser.parse_args()
 
     input_dir = Path(args.input_dir).resolve()
@@ -86,7 +162,7 @@ def main():
     else:
         print()
 
-    collect_files(input_dir, output_dir, dry_run=args.dry_run)
+    collect_files(input_dir, output_dir, dry_run=args.dry_run, link=args.link, prune=args.prune, workers=args.workers)
 
 
 if __name__ == "__main__":